@@ -0,0 +1,119 @@
+import os
+import time
+import hashlib
+import tempfile
+from almacenamiento import obtener_almacen
+
+# ----------------------------------------------------
+# ALMACÉN DE FOTOS DIRECCIONADO POR CONTENIDO
+# ----------------------------------------------------
+# Cada foto se guarda una sola vez bajo el SHA-256 de su contenido, en
+# subcarpetas por prefijo (imagenes_persistentes/ab/cd/<hash>.<ext>). Subir
+# otra vez la misma foto no ocupa más disco y dos envíos simultáneos no pueden
+# pisarse el nombre. Qué registros usan cada foto lo lleva almacen_registros;
+# aquí solo se borra un archivo cuando ya nadie lo referencia.
+#
+# Con almacenamiento remoto (ver almacenamiento) cada foto se sube al bucket al
+# guardarse y la carpeta local queda como caché de lectura.
+CARPETA_FOTOS = 'imagenes_persistentes'
+PREFIJO_TEMPORAL = '.subida-'
+SUFIJO_RETIRADA = '.retirada'
+TAMANO_BLOQUE_ESCRITURA = 1024 * 1024
+# Una foto sin referencias no se borra si se subió o reutilizó hace menos de esto,
+# porque otra sesión puede estar a punto de guardar un registro que la usa
+GRACIA_ELIMINACION_S = 600
+
+EXTENSIONES_EQUIVALENTES = {'jpeg': 'jpg'}
+
+
+def normalizar_extension(extension):
+    extension = extension.lower().lstrip('.')
+    return EXTENSIONES_EQUIVALENTES.get(extension, extension)
+
+
+def ruta_foto(hash_foto, extension):
+    """Ruta donde se guarda la foto con ese hash."""
+    return os.path.join(CARPETA_FOTOS, hash_foto[:2], hash_foto[2:4], f"{hash_foto}.{normalizar_extension(extension)}")
+
+
+def guardar_foto(datos, extension):
+    """
+    Escribe la foto calculando su hash en el mismo recorrido y la mueve a su ruta definitiva.
+    Si ya existía una foto idéntica se reutiliza. Devuelve (ruta, hash).
+    """
+    os.makedirs(CARPETA_FOTOS, exist_ok=True)
+    vista = memoryview(datos)
+    h = hashlib.sha256()
+
+    fd, ruta_tmp = tempfile.mkstemp(prefix=PREFIJO_TEMPORAL, dir=CARPETA_FOTOS)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for inicio in range(0, len(vista), TAMANO_BLOQUE_ESCRITURA):
+                bloque = vista[inicio:inicio + TAMANO_BLOQUE_ESCRITURA]
+                h.update(bloque)
+                f.write(bloque)
+
+        hash_foto = h.hexdigest()
+        ruta = ruta_foto(hash_foto, extension)
+        try:
+            # Ya existe: se renueva la fecha para protegerla de la limpieza y se descarta la copia
+            os.utime(ruta)
+            os.remove(ruta_tmp)
+        except FileNotFoundError:
+            # No existe (o la limpieza la acaba de retirar): se deja la copia nueva
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            os.replace(ruta_tmp, ruta)
+        # Si falla la subida falla el guardado: el registro no debe apuntar a una foto que no está en el almacén
+        obtener_almacen().subir(ruta, reutilizar=True)
+        return ruta, hash_foto
+    except Exception:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+
+
+def hash_desde_ruta(ruta):
+    """Devuelve el hash si la ruta es de una foto direccionada por contenido; si no, None."""
+    nombre = os.path.splitext(os.path.basename(str(ruta)))[0]
+    if len(nombre) == 64 and all(c in '0123456789abcdef' for c in nombre):
+        return nombre
+    return None
+
+
+def eliminar_foto(ruta, gracia_s=GRACIA_ELIMINACION_S):
+    """Borra el archivo de una foto ya sin referencias, salvo que sea más reciente que el periodo de gracia. Devuelve los bytes liberados."""
+    almacen = obtener_almacen()
+    if almacen.remoto:
+        return _eliminar_foto_remota(almacen, ruta, gracia_s)
+    try:
+        if time.time() - os.stat(ruta).st_mtime < gracia_s:
+            return 0
+        # Se retira primero con un nombre temporal: si entretanto alguien volvió a subir la misma
+        # foto (guardar_foto renueva su fecha), se devuelve a su lugar en vez de borrarla
+        ruta_retirada = f"{ruta}{SUFIJO_RETIRADA}"
+        os.rename(ruta, ruta_retirada)
+        info = os.stat(ruta_retirada)
+        if time.time() - info.st_mtime < gracia_s:
+            os.replace(ruta_retirada, ruta)
+            return 0
+        os.remove(ruta_retirada)
+        return info.st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _eliminar_foto_remota(almacen, ruta, gracia_s):
+    """
+    Borra el objeto y su copia local. El bucket no permite retirar el objeto como el disco, así que se confía
+    en la fecha que guardar_foto renueva (en la copia local y en el objeto) justo antes de usar la foto.
+    """
+    try:
+        if time.time() - os.stat(ruta).st_mtime < gracia_s:
+            return 0
+    except FileNotFoundError:
+        pass
+    info = almacen.info(ruta)
+    if info is None or time.time() - info[1] < gracia_s:
+        return 0
+    almacen.eliminar(ruta)
+    return info[0]
@@ -0,0 +1,561 @@
+import os
+import json
+import sqlite3
+import threading
+import pandas as pd
+from almacen_fotos import CARPETA_FOTOS, eliminar_foto
+
+# ----------------------------------------------------
+# ALMACÉN DE REGISTROS (SQLITE EN MODO WAL)
+# ----------------------------------------------------
+# Reemplaza la reescritura completa de datos_maestro.csv en cada alta:
+# cada registro es una fila (JSON) que se inserta, actualiza o elimina por su
+# id dentro de una transacción, así que un corte a mitad de escritura ya no
+# puede truncar el archivo maestro.
+#
+# Varias sesiones (inspectores) escriben sobre el mismo archivo: SQLite
+# serializa las escrituras y unos triggers anotan cada alta, cambio o baja en
+# la tabla 'cambios'. Cada sesión recuerda el último número de cambio que vio y
+# solo pide los posteriores, en lugar de recargar todo el conjunto.
+#
+# Los meses cerrados se pasan a archivos Parquet (ver archivo_registros.py) y
+# salen de la tabla 'registros'. De cada registro archivado quedan aquí su id,
+# mes, fecha de alta, MODELO, SERIE y las fotos que usa, para que el control de
+# SERIE duplicada y el conteo de referencias de fotos sigan abarcando todo el
+# historial.
+#
+# La base no va al almacenamiento de objetos (ver almacenamiento): SQLite en
+# modo WAL necesita un disco local con bloqueos. ARCHIVO_REGISTROS permite
+# ubicarla en un volumen persistente, y los procesos que escriben deben correr
+# en el mismo host (WAL no funciona sobre sistemas de archivos de red).
+# Con almacenamiento s3 las fotos del bucket se limpian comparándolas con esta
+# base (ver recolector_fotos), así que todas las instancias que guardan
+# registros deben compartirla: varias réplicas con una base propia cada una se
+# borrarían las fotos entre sí.
+ARCHIVO_REGISTROS = os.environ.get('ARCHIVO_REGISTROS', 'datos_maestro.db')
+# CSV maestro de versiones anteriores: se importa una sola vez (ver migrar_desde_csv)
+ARCHIVO_CSV_ANTERIOR = 'datos_maestro.csv'
+COLUMNA_ID = '_id'
+MAX_CAMBIOS_RETENIDOS = 100000
+
+_local = threading.local()
+_base_preparada = False
+_base_lock = threading.Lock()
+_csv_revisados = set()
+_migracion_lock = threading.Lock()
+
+_EXPR_SERIE = "upper(trim(json_extract(datos, '$.SERIE')))"
+_EXPR_MODELO = "upper(trim(json_extract(datos, '$.MODELO')))"
+
+
+def normalizar_clave(valor):
+    """Forma en que se comparan MODELO y SERIE: sin espacios en los extremos y en mayúsculas."""
+    return str(valor).strip().upper()
+
+
+def _conexion():
+    """Conexión SQLite propia de cada hilo (Streamlit ejecuta cada sesión en su hilo)."""
+    con = getattr(_local, 'con', None)
+    if con is None:
+        con = sqlite3.connect(ARCHIVO_REGISTROS, timeout=30, isolation_level=None)
+        con.execute("PRAGMA synchronous=NORMAL")
+        _preparar_base(con)
+        _local.con = con
+    return con
+
+
+def _preparar_base(con):
+    """
+    Crea tablas, índices y triggers una sola vez por proceso: el esquema toma el bloqueo de escritura,
+    y hacerlo con cada conexión nueva haría esperar a cada sesión detrás de las altas en curso.
+    """
+    global _base_preparada
+    if _base_preparada:
+        return
+    with _base_lock:
+        if _base_preparada:
+            return
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS registros (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                creado TEXT NOT NULL DEFAULT (datetime('now')),
+                datos TEXT NOT NULL
+            )
+        """)
+        con.executescript("""
+            CREATE TABLE IF NOT EXISTS cambios (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_registro INTEGER NOT NULL
+            );
+            CREATE TRIGGER IF NOT EXISTS registros_alta AFTER INSERT ON registros
+            BEGIN INSERT INTO cambios (id_registro) VALUES (NEW.id); END;
+            CREATE TRIGGER IF NOT EXISTS registros_cambio AFTER UPDATE ON registros
+            BEGIN INSERT INTO cambios (id_registro) VALUES (NEW.id); END;
+            CREATE TRIGGER IF NOT EXISTS registros_baja AFTER DELETE ON registros
+            BEGIN INSERT INTO cambios (id_registro) VALUES (OLD.id); END;
+        """)
+        # Índices por SERIE y (MODELO, SERIE) normalizados, sobre el JSON de cada registro
+        con.executescript(f"""
+            CREATE INDEX IF NOT EXISTS registros_serie ON registros ({_EXPR_SERIE});
+            CREATE INDEX IF NOT EXISTS registros_modelo_serie ON registros ({_EXPR_MODELO}, {_EXPR_SERIE});
+        """)
+        _crear_indice_fotos(con)
+        _crear_tablas_archivo(con)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS recoleccion_fotos (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                hoja TEXT,
+                nombre TEXT,
+                turno_hasta REAL NOT NULL DEFAULT 0,
+                vueltas INTEGER NOT NULL DEFAULT 0,
+                examinados INTEGER NOT NULL DEFAULT 0,
+                borrados INTEGER NOT NULL DEFAULT 0,
+                bytes_liberados INTEGER NOT NULL DEFAULT 0,
+                ultima_vuelta REAL,
+                ultimo_paso REAL
+            )
+        """)
+        con.execute("INSERT OR IGNORE INTO recoleccion_fotos (id) VALUES (1)")
+        _base_preparada = True
+
+
+def _crear_indice_fotos(con):
+    """
+    Tabla fotos_registros (ruta de foto -> registros que la usan), mantenida por triggers a partir
+    del JSON de cada registro: cualquier valor que sea una ruta dentro de la carpeta de fotos.
+    """
+    existia = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fotos_registros'").fetchone()
+    prefijo = CARPETA_FOTOS + os.sep
+    fotos_de = f"""
+        SELECT j.value, {{fila}}.id FROM json_each({{fila}}.datos) j
+        WHERE j.type = 'text' AND substr(j.value, 1, {len(prefijo)}) = '{prefijo}'
+    """
+    con.executescript(f"""
+        CREATE TABLE IF NOT EXISTS fotos_registros (
+            ruta TEXT NOT NULL,
+            id_registro INTEGER NOT NULL,
+            PRIMARY KEY (ruta, id_registro)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS fotos_registros_por_registro ON fotos_registros (id_registro);
+        CREATE TRIGGER IF NOT EXISTS fotos_alta AFTER INSERT ON registros BEGIN
+            INSERT OR IGNORE INTO fotos_registros {fotos_de.format(fila='NEW')};
+        END;
+        CREATE TRIGGER IF NOT EXISTS fotos_cambio AFTER UPDATE ON registros BEGIN
+            DELETE FROM fotos_registros WHERE id_registro = OLD.id;
+            INSERT OR IGNORE INTO fotos_registros {fotos_de.format(fila='NEW')};
+        END;
+        CREATE TRIGGER IF NOT EXISTS fotos_baja AFTER DELETE ON registros BEGIN
+            DELETE FROM fotos_registros WHERE id_registro = OLD.id;
+        END;
+    """)
+    if not existia:
+        # Bases creadas antes del índice: se indexan las fotos de los registros existentes
+        con.execute(f"""
+            INSERT OR IGNORE INTO fotos_registros
+            SELECT j.value, registros.id FROM registros, json_each(registros.datos) j
+            WHERE j.type = 'text' AND substr(j.value, 1, {len(prefijo)}) = '{prefijo}'
+        """)
+
+
+def _crear_tablas_archivo(con):
+    """Índices de los registros archivados (por SERIE y por mes) y de las fotos que siguen usando."""
+    con.executescript("""
+        CREATE INDEX IF NOT EXISTS registros_creado ON registros (creado);
+        CREATE TABLE IF NOT EXISTS registros_archivados (
+            id INTEGER PRIMARY KEY,
+            particion TEXT NOT NULL,
+            creado TEXT NOT NULL,
+            modelo TEXT NOT NULL,
+            serie TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS registros_archivados_serie ON registros_archivados (serie);
+        CREATE INDEX IF NOT EXISTS registros_archivados_modelo_serie ON registros_archivados (modelo, serie);
+        CREATE INDEX IF NOT EXISTS registros_archivados_particion ON registros_archivados (particion);
+        CREATE TABLE IF NOT EXISTS fotos_archivadas (
+            ruta TEXT NOT NULL,
+            id_registro INTEGER NOT NULL,
+            PRIMARY KEY (ruta, id_registro)
+        ) WITHOUT ROWID;
+    """)
+
+
+def fotos_de_registro(id_registro):
+    """Rutas de las fotos que usa un registro."""
+    filas = _conexion().execute("SELECT ruta FROM fotos_registros WHERE id_registro = ?", (id_registro,)).fetchall()
+    return [ruta for (ruta,) in filas]
+
+
+def contar_referencias(ruta):
+    """Cantidad de registros (activos o archivados) que usan la foto."""
+    return _conexion().execute("""
+        SELECT (SELECT COUNT(*) FROM fotos_registros WHERE ruta = ?) + (SELECT COUNT(*) FROM fotos_archivadas WHERE ruta = ?)
+    """, (ruta, ruta)).fetchone()[0]
+
+
+def rutas_referenciadas(rutas):
+    """Subconjunto de las rutas que usa algún registro (activo o archivado), con una consulta indexada."""
+    rutas = list(rutas)
+    if not rutas:
+        return set()
+    marcas = ", ".join("?" * len(rutas))
+    filas = _conexion().execute(
+        f"SELECT ruta FROM fotos_registros WHERE ruta IN ({marcas}) UNION SELECT ruta FROM fotos_archivadas WHERE ruta IN ({marcas})",
+        rutas * 2
+    ).fetchall()
+    return {ruta for (ruta,) in filas}
+
+
+def liberar_fotos(rutas):
+    """Borra del disco las fotos de la lista que ya no usa ningún registro. Devuelve los bytes liberados."""
+    return sum(eliminar_foto(ruta) for ruta in set(rutas) if contar_referencias(ruta) == 0)
+
+
+def _a_registro(id_registro, datos):
+    registro = json.loads(datos)
+    registro[COLUMNA_ID] = id_registro
+    return registro
+
+
+def _a_json(registro):
+    return json.dumps({k: v for k, v in registro.items() if k != COLUMNA_ID}, ensure_ascii=False)
+
+
+def ids_por_serie(serie, modelo=None):
+    """Ids de los registros (activos o archivados) con esa SERIE (y ese MODELO, si se indica), usando los índices de la base."""
+    if modelo is None:
+        filas = _conexion().execute(
+            f"SELECT id FROM registros WHERE {_EXPR_SERIE} = ? UNION SELECT id FROM registros_archivados WHERE serie = ? ORDER BY id",
+            (normalizar_clave(serie),) * 2
+        ).fetchall()
+    else:
+        filas = _conexion().execute(
+            f"""SELECT id FROM registros WHERE {_EXPR_MODELO} = ? AND {_EXPR_SERIE} = ?
+                UNION SELECT id FROM registros_archivados WHERE modelo = ? AND serie = ? ORDER BY id""",
+            (normalizar_clave(modelo), normalizar_clave(serie)) * 2
+        ).fetchall()
+    return [id_registro for (id_registro,) in filas]
+
+
+def archivados_por_serie(serie):
+    """Lista de (id, mes 'AAAA-MM') de los registros archivados con esa SERIE."""
+    return _conexion().execute(
+        "SELECT id, particion FROM registros_archivados WHERE serie = ? ORDER BY id", (normalizar_clave(serie),)
+    ).fetchall()
+
+
+def conteo_archivados():
+    """Devuelve {mes 'AAAA-MM': cantidad de registros archivados}."""
+    return dict(_conexion().execute("SELECT particion, COUNT(*) FROM registros_archivados GROUP BY particion").fetchall())
+
+
+def fechas_alta():
+    """Devuelve {id: fecha de alta 'AAAA-MM-DD HH:MM:SS' (UTC)} de todos los registros, incluidos los archivados."""
+    return dict(_conexion().execute("SELECT id, creado FROM registros UNION ALL SELECT id, creado FROM registros_archivados").fetchall())
+
+
+def insertar_registro(registro, bloquear_serie_duplicada=False):
+    """
+    Añade un registro al final del almacén y devuelve su id.
+    Con bloquear_serie_duplicada, la comprobación y el alta son atómicas y devuelve None si la SERIE ya existe.
+    """
+    con = _conexion()
+    if bloquear_serie_duplicada:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if ids_por_serie(registro.get('SERIE', '')):
+                con.execute("ROLLBACK")
+                return None
+            cursor = con.execute("INSERT INTO registros (datos) VALUES (?)", (_a_json(registro),))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    else:
+        cursor = con.execute("INSERT INTO registros (datos) VALUES (?)", (_a_json(registro),))
+    id_registro = cursor.lastrowid
+    if id_registro % 1000 == 0:
+        purgar_cambios()
+    return id_registro
+
+
+def insertar_registros(registros, bloquear_serie_duplicada=False):
+    """
+    Añade varios registros en una sola transacción y devuelve sus ids, en el mismo orden.
+    Con bloquear_serie_duplicada, el id es None para los que tengan una SERIE ya existente
+    (incluida una repetida dentro del mismo lote).
+    """
+    con = _conexion()
+    ids = []
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        for registro in registros:
+            if bloquear_serie_duplicada and ids_por_serie(registro.get('SERIE', '')):
+                ids.append(None)
+                continue
+            ids.append(con.execute("INSERT INTO registros (datos) VALUES (?)", (_a_json(registro),)).lastrowid)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    purgar_cambios()
+    return ids
+
+
+def actualizar_registro(id_registro, cambios):
+    """Aplica los cambios (dict columna -> valor) sobre un registro existente. Devuelve False si no existe."""
+    con = _conexion()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        fila = con.execute("SELECT datos FROM registros WHERE id = ?", (id_registro,)).fetchone()
+        if fila is None:
+            con.execute("ROLLBACK")
+            return False
+        registro = json.loads(fila[0])
+        registro.update({k: v for k, v in cambios.items() if k != COLUMNA_ID})
+        fotos_anteriores = fotos_de_registro(id_registro)
+        con.execute("UPDATE registros SET datos = ? WHERE id = ?", (_a_json(registro), id_registro))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    # Las fotos reemplazadas se borran solo si ningún otro registro las usa
+    liberar_fotos(fotos_anteriores)
+    return True
+
+
+def eliminar_registro(id_registro):
+    """Elimina un registro por su id y las fotos que solo él usaba. Devuelve False si no existía."""
+    fotos = fotos_de_registro(id_registro)
+    cursor = _conexion().execute("DELETE FROM registros WHERE id = ?", (id_registro,))
+    if cursor.rowcount == 0:
+        return False
+    liberar_fotos(fotos)
+    return True
+
+
+def leer_registros():
+    """Devuelve todos los registros (lista de dicts con su '_id'), en orden de alta."""
+    return leer_registros_con_marca()[0]
+
+
+def leer_registros_con_marca():
+    """Devuelve (registros, marca): la marca es el último número de cambio incluido en la lectura."""
+    con = _conexion()
+    # Ambas consultas dentro de la misma transacción de lectura ven la misma foto de la base
+    con.execute("BEGIN")
+    try:
+        marca = con.execute("SELECT COALESCE(MAX(seq), 0) FROM cambios").fetchone()[0]
+        filas = con.execute("SELECT id, datos FROM registros ORDER BY id").fetchall()
+    finally:
+        con.execute("COMMIT")
+    return [_a_registro(id_registro, datos) for id_registro, datos in filas], marca
+
+
+def leer_cambios_desde(marca):
+    """
+    Devuelve (cambios, nueva_marca) con los registros dados de alta, modificados o eliminados después de la marca.
+    cambios es una lista de (id, registro) en orden; registro es None si fue eliminado.
+    Si la marca es tan antigua que sus cambios ya se purgaron, devuelve (None, marca) y hay que recargar todo.
+    """
+    con = _conexion()
+    con.execute("BEGIN")
+    try:
+        minimo, maximo = con.execute("SELECT MIN(seq), MAX(seq) FROM cambios").fetchone()
+        if maximo is None or maximo <= marca:
+            return [], marca
+        if minimo > marca + 1:
+            return None, marca
+
+        filas = con.execute("""
+            SELECT c.id_registro, r.datos
+            FROM (SELECT id_registro, MAX(seq) AS seq FROM cambios WHERE seq > ? GROUP BY id_registro) c
+            LEFT JOIN registros r ON r.id = c.id_registro
+            ORDER BY c.seq
+        """, (marca,)).fetchall()
+    finally:
+        con.execute("COMMIT")
+
+    cambios = [(id_registro, _a_registro(id_registro, datos) if datos is not None else None) for id_registro, datos in filas]
+    return cambios, maximo
+
+
+def purgar_cambios(max_retenidos=MAX_CAMBIOS_RETENIDOS):
+    """Descarta las entradas más antiguas del registro de cambios."""
+    _conexion().execute("DELETE FROM cambios WHERE seq <= (SELECT MAX(seq) FROM cambios) - ?", (max_retenidos,))
+
+
+def eliminar_todos():
+    """Vacía el almacén de registros, incluidos los índices de los registros archivados."""
+    _conexion().executescript("""
+        BEGIN IMMEDIATE;
+        DELETE FROM registros;
+        DELETE FROM registros_archivados;
+        DELETE FROM fotos_archivadas;
+        COMMIT;
+    """)
+
+
+# ----------------------------------------------------
+# ESTADO DE LA LIMPIEZA DE FOTOS HUÉRFANAS
+# ----------------------------------------------------
+# Una sola fila compartida por todos los procesos: el cursor del recorrido
+# (hoja = subcarpeta 'ab/cd', nombre = último archivo visto), un turno con
+# vencimiento para que dos procesos no recorran lo mismo a la vez, y los totales.
+
+def _estado_recoleccion(con):
+    fila = con.execute("""
+        SELECT hoja, nombre, turno_hasta, vueltas, examinados, borrados, bytes_liberados, ultima_vuelta, ultimo_paso
+        FROM recoleccion_fotos WHERE id = 1
+    """).fetchone()
+    claves = ('hoja', 'nombre', 'turno_hasta', 'vueltas', 'examinados', 'borrados', 'bytes_liberados', 'ultima_vuelta', 'ultimo_paso')
+    return dict(zip(claves, fila))
+
+
+def estado_recoleccion():
+    """Cursor y totales acumulados de la limpieza de fotos huérfanas."""
+    return _estado_recoleccion(_conexion())
+
+
+def tomar_turno_recoleccion(ahora, duracion_s):
+    """Reserva la limpieza para este proceso hasta ahora + duracion_s. Devuelve el estado, o None si otro la tiene."""
+    con = _conexion()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = con.execute(
+            "UPDATE recoleccion_fotos SET turno_hasta = ? WHERE id = 1 AND turno_hasta < ?", (ahora + duracion_s, ahora)
+        )
+        estado = _estado_recoleccion(con) if cursor.rowcount else None
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return estado
+
+
+def registrar_paso_recoleccion(ahora, hoja, nombre, examinados, borrados, bytes_liberados, vuelta_completa):
+    """Guarda el nuevo cursor, suma los totales del paso y libera el turno."""
+    _conexion().execute("""
+        UPDATE recoleccion_fotos SET
+            hoja = ?, nombre = ?, turno_hasta = 0,
+            vueltas = vueltas + ?, examinados = examinados + ?, borrados = borrados + ?, bytes_liberados = bytes_liberados + ?,
+            ultima_vuelta = CASE WHEN ? THEN ? ELSE ultima_vuelta END, ultimo_paso = ?
+        WHERE id = 1
+    """, (hoja, nombre, int(vuelta_completa), examinados, borrados, bytes_liberados, int(vuelta_completa), ahora, ahora))
+
+
+def liberar_turno_recoleccion():
+    _conexion().execute("UPDATE recoleccion_fotos SET turno_hasta = 0 WHERE id = 1")
+
+
+# ----------------------------------------------------
+# ARCHIVO POR MES
+# ----------------------------------------------------
+
+def particiones_con_registros_antes_de(particion):
+    """Meses ('AAAA-MM', según la fecha de alta) anteriores al indicado que todavía tienen registros activos."""
+    filas = _conexion().execute(
+        "SELECT DISTINCT substr(creado, 1, 7) FROM registros WHERE creado < ? ORDER BY 1", (f"{particion}-01",)
+    ).fetchall()
+    return [p for (p,) in filas]
+
+
+def ids_archivados(particion):
+    """Ids de los registros archivados del mes 'AAAA-MM' (los que su Parquet debe contener)."""
+    filas = _conexion().execute("SELECT id FROM registros_archivados WHERE particion = ?", (particion,)).fetchall()
+    return {id_registro for (id_registro,) in filas}
+
+
+def archivar_particion(particion, escribir_archivo):
+    """
+    Saca de la tabla activa los registros dados de alta en el mes 'AAAA-MM'. Primero, sin bloquear las
+    escrituras, se llama escribir_archivo(filas) con filas = [(id, creado, registro)]; si falla, no se archiva
+    nada. Después, dentro de la transacción, solo se comprueba qué registros siguen igual que en esa lectura
+    y se sacan esos (los modificados o borrados entretanto quedan para el próximo archivado).
+    Las fotos y la SERIE de cada registro quedan indexadas. Devuelve la cantidad archivada.
+    """
+    con = _conexion()
+    desde, hasta = f"{particion}-01", f"{particion}-32"
+    filas = con.execute(
+        "SELECT id, creado, datos FROM registros WHERE creado >= ? AND creado < ? ORDER BY id", (desde, hasta)
+    ).fetchall()
+    if not filas:
+        return 0
+    escribir_archivo([(id_registro, creado, json.loads(datos)) for id_registro, creado, datos in filas])
+    escritos = {id_registro: datos for id_registro, _, datos in filas}
+
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        vigentes = con.execute("SELECT id, datos FROM registros WHERE creado >= ? AND creado < ?", (desde, hasta)).fetchall()
+        ids = [id_registro for id_registro, datos in vigentes if escritos.get(id_registro) == datos]
+        lista_ids = json.dumps(ids)
+        con.execute(f"""
+            INSERT OR REPLACE INTO registros_archivados (id, particion, creado, modelo, serie)
+            SELECT id, ?, creado, COALESCE({_EXPR_MODELO}, ''), COALESCE({_EXPR_SERIE}, '')
+            FROM registros WHERE id IN (SELECT value FROM json_each(?))
+        """, (particion, lista_ids))
+        # Antes del borrado: el trigger de baja quita las fotos del índice de registros activos
+        con.execute("""
+            INSERT OR IGNORE INTO fotos_archivadas
+            SELECT ruta, id_registro FROM fotos_registros WHERE id_registro IN (SELECT value FROM json_each(?))
+        """, (lista_ids,))
+        con.execute("DELETE FROM registros WHERE id IN (SELECT value FROM json_each(?))", (lista_ids,))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    purgar_cambios()
+    return len(ids)
+
+
+def migrar_desde_csv(ruta_csv):
+    """
+    Importa una sola vez el CSV maestro anterior si el almacén está vacío. Devuelve la cantidad importada.
+    El CSV se renombra a '.migrado' tanto si se importó como si el almacén ya tenía registros, y cada
+    ruta se revisa una sola vez por proceso, así que las recargas no vuelven a pedir la escritura.
+    """
+    with _migracion_lock:
+        if ruta_csv in _csv_revisados:
+            return 0
+        cantidad = _migrar_desde_csv(ruta_csv)
+        _csv_revisados.add(ruta_csv)
+        return cantidad
+
+
+def _migrar_desde_csv(ruta_csv):
+    if not os.path.exists(ruta_csv):
+        return 0
+
+    con = _conexion()
+    # Con registros ya cargados no hace falta el bloqueo de escritura para saber que no se importa
+    if con.execute("SELECT 1 FROM registros LIMIT 1").fetchone() is not None:
+        _marcar_migrado(ruta_csv)
+        return 0
+
+    # BEGIN IMMEDIATE serializa la migración si varias sesiones arrancan a la vez
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        if not os.path.exists(ruta_csv) or con.execute("SELECT 1 FROM registros LIMIT 1").fetchone() is not None:
+            con.execute("ROLLBACK")
+            _marcar_migrado(ruta_csv)
+            return 0
+        df = pd.read_csv(ruta_csv, dtype=str, keep_default_na=False)
+        con.executemany(
+            "INSERT INTO registros (datos) VALUES (?)",
+            ((_a_json(registro),) for registro in df.to_dict('records'))
+        )
+        os.replace(ruta_csv, f"{ruta_csv}.migrado")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return len(df)
+
+
+def _marcar_migrado(ruta_csv):
+    try:
+        os.replace(ruta_csv, f"{ruta_csv}.migrado")
+    except FileNotFoundError:
+        # Otro proceso ya lo importó o lo marcó
+        pass
@@ -0,0 +1,264 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache_disco import expulsar_antiguos
+from metricas import medir
+
+# ----------------------------------------------------
+# ALMACENAMIENTO DE ARCHIVOS (DISCO LOCAL U OBJETOS S3)
+# ----------------------------------------------------
+# Fotos y meses archivados se nombran por su ruta relativa
+# ('imagenes_persistentes/ab/cd/<hash>.jpg'); esa misma ruta es la que guardan
+# los registros. Con ALMACENAMIENTO=local (por defecto) el archivo en disco es
+# el dato. Con ALMACENAMIENTO=s3 el dato es el objeto '<S3_PREFIJO><ruta>' en
+# el bucket, y la copia en disco es una caché de lectura: se descarga la
+# primera vez que se necesita (al exportar o mostrar una foto) y se expulsa por
+# antigüedad cuando la caché supera su límite. Así varias réplicas (ej. Cloud
+# Run) comparten las fotos y no se pierden al reciclar una instancia.
+#
+# El cliente S3 es uno por proceso, con su pool de conexiones; las fotos
+# grandes se suben y bajan en partes en paralelo. S3_ENDPOINT_URL permite
+# usar MinIO o moto (servidor local) en lugar de AWS. boto3 solo hace falta
+# con ALMACENAMIENTO=s3 y no está en requirements.txt: se instala con
+# 'pip install -r requirements-s3.txt'.
+#
+# Los registros siguen en SQLite (ver almacen_registros); miniaturas, reportes
+# y estado de exportaciones son derivados y quedan en el disco local. Al pasar
+# de local a s3, las fotos y meses ya guardados se copian una vez al bucket
+# (ej. 'aws s3 sync imagenes_persistentes s3://<bucket>/<prefijo>imagenes_persistentes').
+ALMACENAMIENTO = os.environ.get('ALMACENAMIENTO', 'local').lower()
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_PREFIJO = os.environ.get('S3_PREFIJO', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+S3_MAX_CONEXIONES = int(os.environ.get('S3_MAX_CONEXIONES', 64))
+# Archivos transferidos a la vez, y partes en paralelo dentro de cada archivo grande
+S3_ARCHIVOS_EN_PARALELO = int(os.environ.get('S3_ARCHIVOS_EN_PARALELO', 16))
+S3_PARTES_EN_PARALELO = int(os.environ.get('S3_PARTES_EN_PARALELO', 4))
+S3_UMBRAL_MULTIPARTE_BYTES = 8 * 1024 * 1024
+S3_TAMANO_PARTE_BYTES = 8 * 1024 * 1024
+# Límite de la caché local de archivos remotos
+TAMANO_MAXIMO_CACHE_LOCAL_BYTES = int(os.environ.get('TAMANO_MAXIMO_CACHE_LOCAL_MB', 2048)) * 1024 * 1024
+# Un archivo usado hace menos de esto no se expulsa (puede estar en medio de una exportación)
+PROTECCION_CACHE_LOCAL_S = 3600
+SUFIJO_DESCARGA = '.descarga'
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+class AlmacenLocal:
+    """Los archivos viven solo en el disco del contenedor."""
+
+    remoto = False
+
+    def subir(self, ruta, reutilizar=False):
+        pass
+
+    def traer(self, ruta):
+        return os.path.exists(ruta)
+
+    def info(self, ruta):
+        """(tamaño, fecha de modificación) o None si no existe."""
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            return None
+        return estado.st_size, estado.st_mtime
+
+    def eliminar(self, ruta):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+    def listar(self, carpeta, despues_de=None):
+        """(ruta, tamaño, fecha) de los archivos bajo la carpeta, en orden de ruta, posteriores a despues_de."""
+        rutas = []
+        for raiz, carpetas, nombres in os.walk(carpeta):
+            carpetas.sort()
+            rutas.extend(os.path.join(raiz, nombre) for nombre in nombres)
+        for ruta in sorted(rutas, key=lambda r: r.replace(os.sep, '/')):
+            if despues_de is not None and ruta.replace(os.sep, '/') <= despues_de.replace(os.sep, '/'):
+                continue
+            informacion = self.info(ruta)
+            if informacion:
+                yield (ruta,) + informacion
+
+    def vaciar(self, carpeta):
+        if os.path.exists(carpeta):
+            shutil.rmtree(carpeta)
+
+
+class AlmacenS3:
+    """Los archivos viven en un bucket S3 (o compatible); el disco local es una caché de lectura."""
+
+    remoto = True
+
+    def __init__(self, bucket, prefijo='', endpoint_url=None, region=None):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as e:
+            raise ImportError("ALMACENAMIENTO=s3 requiere boto3 (pip install -r requirements-s3.txt).") from e
+
+        if not bucket:
+            raise ValueError("ALMACENAMIENTO=s3 requiere la variable S3_BUCKET.")
+        self.bucket = bucket
+        self.prefijo = prefijo
+        # Un solo cliente por proceso (es seguro entre hilos) con su pool de conexiones HTTP reutilizables
+        self._s3 = boto3.session.Session().client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(max_pool_connections=S3_MAX_CONEXIONES, retries={'max_attempts': 5, 'mode': 'standard'}),
+        )
+        self._transferencia = TransferConfig(
+            multipart_threshold=S3_UMBRAL_MULTIPARTE_BYTES,
+            multipart_chunksize=S3_TAMANO_PARTE_BYTES,
+            max_concurrency=S3_PARTES_EN_PARALELO,
+            use_threads=True,
+        )
+
+    def _clave(self, ruta):
+        return self.prefijo + ruta.replace(os.sep, '/')
+
+    def _ruta(self, clave):
+        return clave[len(self.prefijo):].replace('/', os.sep)
+
+    @staticmethod
+    def _no_existe(error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def subir(self, ruta, reutilizar=False):
+        """
+        Sube el archivo local. Con reutilizar (el contenido depende solo del nombre, como las fotos por hash),
+        si el objeto ya existe no se vuelve a subir: solo se renueva su fecha, para que la limpieza de
+        huérfanas respete el periodo de gracia.
+        """
+        from botocore.exceptions import ClientError
+
+        clave = self._clave(ruta)
+        if reutilizar:
+            try:
+                self._s3.copy_object(
+                    Bucket=self.bucket, Key=clave, CopySource={'Bucket': self.bucket, 'Key': clave}, MetadataDirective='REPLACE'
+                )
+                return
+            except ClientError as e:
+                if not self._no_existe(e):
+                    raise
+        with medir('almacenamiento.subida') as m:
+            m['bytes'] = os.path.getsize(ruta)
+            self._s3.upload_file(ruta, self.bucket, clave, Config=self._transferencia)
+
+    def traer(self, ruta):
+        """Deja una copia local del objeto (si no la hay). Devuelve False si el objeto no existe."""
+        from botocore.exceptions import ClientError
+
+        if os.path.exists(ruta):
+            return True
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}{SUFIJO_DESCARGA}"
+        try:
+            with medir('almacenamiento.descarga') as m:
+                self._s3.download_file(self.bucket, self._clave(ruta), ruta_tmp, Config=self._transferencia)
+                m['bytes'] = os.path.getsize(ruta_tmp)
+            os.replace(ruta_tmp, ruta)
+            return True
+        except ClientError as e:
+            if self._no_existe(e):
+                return False
+            raise
+        finally:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+
+    def info(self, ruta):
+        from botocore.exceptions import ClientError
+
+        try:
+            respuesta = self._s3.head_object(Bucket=self.bucket, Key=self._clave(ruta))
+        except ClientError as e:
+            if self._no_existe(e):
+                return None
+            raise
+        return respuesta['ContentLength'], respuesta['LastModified'].timestamp()
+
+    def eliminar(self, ruta):
+        self._s3.delete_object(Bucket=self.bucket, Key=self._clave(ruta))
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+    def listar(self, carpeta, despues_de=None):
+        paginador = self._s3.get_paginator('list_objects_v2')
+        parametros = {'Bucket': self.bucket, 'Prefix': self._clave(carpeta) + '/'}
+        if despues_de is not None:
+            parametros['StartAfter'] = self._clave(despues_de)
+        for pagina in paginador.paginate(**parametros):
+            for objeto in pagina.get('Contents', []):
+                yield self._ruta(objeto['Key']), objeto['Size'], objeto['LastModified'].timestamp()
+
+    def vaciar(self, carpeta):
+        lote = []
+        for ruta, _, _ in self.listar(carpeta):
+            lote.append({'Key': self._clave(ruta)})
+            if len(lote) == 1000:
+                self._s3.delete_objects(Bucket=self.bucket, Delete={'Objects': lote, 'Quiet': True})
+                lote = []
+        if lote:
+            self._s3.delete_objects(Bucket=self.bucket, Delete={'Objects': lote, 'Quiet': True})
+        if os.path.exists(carpeta):
+            shutil.rmtree(carpeta)
+
+
+def obtener_almacen():
+    """Almacenamiento configurado (uno por proceso)."""
+    global _almacen
+    with _almacen_lock:
+        if _almacen is None:
+            if ALMACENAMIENTO == 's3':
+                _almacen = AlmacenS3(S3_BUCKET, S3_PREFIJO, S3_ENDPOINT_URL, S3_REGION)
+            elif ALMACENAMIENTO == 'local':
+                _almacen = AlmacenLocal()
+            else:
+                raise ValueError(f"ALMACENAMIENTO no soportado: {ALMACENAMIENTO} (use 'local' o 's3').")
+        return _almacen
+
+
+def traer_archivos(rutas, en_paralelo=S3_ARCHIVOS_EN_PARALELO):
+    """
+    Asegura una copia local de cada ruta (descargando en paralelo las que falten en la caché).
+    Devuelve la cantidad descargada. Con almacenamiento local no hace nada.
+    """
+    almacen = obtener_almacen()
+    if not almacen.remoto:
+        return 0
+    faltantes = []
+    for ruta in set(rutas):
+        try:
+            # Ya está en la caché: se marca como usada para que no se expulse mientras se lee
+            os.utime(ruta)
+        except FileNotFoundError:
+            faltantes.append(ruta)
+    if not faltantes:
+        return 0
+    with medir('almacenamiento.traer_archivos') as m, \
+            ThreadPoolExecutor(max_workers=en_paralelo, thread_name_prefix='almacenamiento') as executor:
+        traidos = sum(executor.map(almacen.traer, sorted(faltantes)))
+        m['conteo'] = len(faltantes)
+    return traidos
+
+
+def aplicar_limite_cache_local(carpeta, tamano_maximo=TAMANO_MAXIMO_CACHE_LOCAL_BYTES):
+    """
+    Con almacenamiento remoto, borra las copias locales usadas hace más tiempo hasta que la carpeta quepa en
+    el límite (los objetos quedan en el bucket). Devuelve los bytes liberados. Con almacenamiento local no hace nada.
+    """
+    if not obtener_almacen().remoto:
+        return 0
+    return expulsar_antiguos(carpeta, tamano_maximo, proteccion_s=PROTECCION_CACHE_LOCAL_S)
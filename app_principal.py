@@ -1,190 +1,88 @@
-import pandas as pd
 import streamlit as st
 import os
 import shutil 
-import json 
-from openpyxl import load_workbook
-from openpyxl.drawing.image import Image as OpenpyxlImage
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment, PatternFill, Font
-from io import BytesIO
-from PIL import Image
-from PIL.ExifTags import TAGS
-import gc 
+from miniaturas import CARPETA_MINIATURAS, obtener_miniatura, programar_limite_cache
+from preparacion_imagenes import es_ruta_valida
+from almacen_fotos import CARPETA_FOTOS
+from guardado_fotos import SUFIJO_ORIGINAL, guardar_foto_subida
+from configuracion import CAMPO_VERSION_ESQUEMA, obtener_configuracion, error_configuracion
+from almacen_registros import ARCHIVO_CSV_ANTERIOR, insertar_registro, eliminar_todos, migrar_desde_csv, archivados_por_serie
+from dataset_registros import VALORES_CONDICION, obtener_dataset, dataset_vacio, filtrar_dataset, buscar_por_serie
+from exportacion import IMAGEN_WIDTH, IMAGEN_HEIGHT, SUFIJO_VINCULADO, CRITERIOS_PARTES, FILAS_POR_PARTE_POR_DEFECTO, es_exportacion_en_cache, traer_fotos
+from almacenamiento import obtener_almacen
+from metricas import Acumulador, medir
+from archivo_registros import CARPETA_ARCHIVO, MESES_ACTIVOS, iniciar_archivador, particiones_archivadas, leer_particion
+from recolector_fotos import iniciar_recolector
+from trabajos_exportacion import enviar_exportacion, consultar_trabajo, ESTADO_EN_COLA, ESTADO_LISTO, ESTADO_ERROR
 
 # ----------------------------------------------------
 # CONFIGURACIÓN DINÁMICA Y PERSISTENCIA
 # ----------------------------------------------------
-CONFIG_FILE = 'config_cols.json'
-PERSISTENCE_FILE = 'datos_maestro.csv' 
-IMAGE_FOLDER = 'imagenes_persistentes' 
+PERSISTENCE_FILE = ARCHIVO_CSV_ANTERIOR
+IMAGE_FOLDER = CARPETA_FOTOS
 
-# Función para cargar la configuración de columnas (sin cambios)
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f: 
-                return json.load(f)
-        except Exception as e:
-            st.error(f"Error al leer config_cols.json (usando UTF-8). Por favor, verifique el formato del archivo. Error: {e}")
-            return {
-                "CONDICIONES_INSPECCION": ["DAÑO EN EMPAQUE", "DAÑO FISICO", "ACCESORIOS COMPLETOS", "PARILLA EN MAL ESTADO", "PRESENTA RESTOS METALICOS (VIRUTAS)", "TAPAS PRESENTAN OXIDO", "PRESENTA RAYAS", "TARJETA DE GARANTÍA", "TIENE ETIQUETA DE EFICIENCIA ENERGETICA"],
-                "COLUMNAS_IMAGEN": ["FOTO DE SERIE", "FOTO DEL EMPAQUE", "FOTO DE PRODUCTO COMPLETO", "FOTO PARTE TRASERA", "FOTO DE OBSERVACIONES A 50 CM (VIRUTAS)", "FOTO DE OBSERVACIONES CERCA (VIRUTAS)", "FOTO DE OBSERVACIONES A 50 CM (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES CERCA (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES A 50 CM (MANCHAS)", "FOTO DE OBSERVACIONES CERCA (MANCHAS)", "FOTO DE OBSERVACIONES A 50 CM (RAYAS)", "FOTO DE OBSERVACIONES CERCA (RAYAS)", "FOTO DE ACCESORIOS"]
-            }
-    return {
-        "CONDICIONES_INSPECCION": ["DAÑO EN EMPAQUE", "DAÑO FISICO", "ACCESORIOS COMPLETOS", "PARILLA EN MAL ESTADO", "PRESENTA RESTOS METALICOS (VIRUTAS)", "TAPAS PRESENTAN OXIDO", "PRESENTA RAYAS", "TARJETA DE GARANTÍA", "TIENE ETIQUETA DE EFICIENCIA ENERGETICA"],
-        "COLUMNAS_IMAGEN": ["FOTO DE SERIE", "FOTO DEL EMPAQUE", "FOTO DE PRODUCTO COMPLETO", "FOTO PARTE TRASERA", "FOTO DE OBSERVACIONES A 50 CM (VIRUTAS)", "FOTO DE OBSERVACIONES CERCA (VIRUTAS)", "FOTO DE OBSERVACIONES A 50 CM (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES CERCA (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES A 50 CM (MANCHAS)", "FOTO DE OBSERVACIONES CERCA (MANCHAS)", "FOTO DE OBSERVACIONES A 50 CM (RAYAS)", "FOTO DE OBSERVACIONES CERCA (RAYAS)", "FOTO DE ACCESORIOS"]
-    }
-
-# Cargar la configuración y definir las listas dinámicas
-config = load_config()
+# Configuración de columnas compartida por todas las sesiones: solo se relee si el archivo cambió,
+# así que lo guardado en la página de administración se aplica en la siguiente interacción
+config = obtener_configuracion()
 CONDICIONES_INSPECCION = config["CONDICIONES_INSPECCION"]
 COLUMNAS_IMAGEN = config["COLUMNAS_IMAGEN"]
+AJUSTES_FOTOS = config["PROCESAMIENTO_FOTOS"]
+# "ADVERTIR": se guarda y se avisa; "BLOQUEAR": no se guarda una SERIE ya inspeccionada
+POLITICA_DUPLICADOS = config["DUPLICADOS_SERIE"]
 
-# DEFINICIÓN DINÁMICA DE ENCABEZADOS
-ENCABEZADOS = ['MODELO', 'SERIE']
-ENCABEZADOS.extend(CONDICIONES_INSPECCION) 
-ENCABEZADOS.append('OBSERVACIONES') 
-
-COLUMNAS_FINALES = ENCABEZADOS + COLUMNAS_IMAGEN
-
-# --- 2. Constantes de Formato para Excel ---
-ALTURA_ENCABEZADO_PT = 60  
-ALTURA_FILA_DATOS_PT = 75  
-ANCHO_COLUMNA_NORMAL_UNITS = 14 
-ANCHO_COLUMNA_OBSERVACIONES_UNITS = 28 
-IMAGEN_WIDTH = 150 
-IMAGEN_HEIGHT = 150
-ALINEACION_CENTRO = Alignment(horizontal='center', vertical='center', wrap_text=True)
-RELLENO_VERDE_AZULADO = PatternFill(start_color='20B2AA', end_color='20B2AA', fill_type='solid') 
-FUENTE_ENCABEZADO = Font(color='FFFFFF', bold=True) 
+# Encabezados: MODELO, SERIE, condiciones y OBSERVACIONES (las fotos van al final)
+ENCABEZADOS = config["ENCABEZADOS"]
+COLUMNAS_FINALES = config["COLUMNAS_FINALES"]
 
 # --- 3. Funciones de Lógica y Persistencia ---
 
 def cargar_datos_persistentes():
-    if os.path.exists(PERSISTENCE_FILE):
-        try:
-            df = pd.read_csv(PERSISTENCE_FILE, dtype=str) 
-            
-            for col in COLUMNAS_IMAGEN:
-                if col not in df.columns:
-                    df[col] = ''
-            
-            for col in ENCABEZADOS:
-                 if col not in df.columns:
-                    df[col] = ''
-            
-            return df.to_dict('records')
-        except Exception as e:
-            st.warning(f"Advertencia: Error al cargar datos persistentes: {e}. Se inicia una lista vacía.")
-            return []
-    return []
+    """Devuelve (df, marca): el dataset compartido de registros, al día con el almacén, y su marca de cambios."""
+    try:
+        # Migración única del CSV maestro anterior al almacén de registros
+        migrar_desde_csv(PERSISTENCE_FILE)
+        return obtener_dataset(config)
+    except Exception as e:
+        st.warning(f"Advertencia: Error al cargar datos persistentes: {e}. Se inicia una lista vacía.")
+        return dataset_vacio(COLUMNAS_FINALES, CONDICIONES_INSPECCION), None
 
-def generar_excel_con_formato(df):
-    """Genera el archivo Excel en memoria, leyendo las imágenes desde el disco."""
-    
-    os.makedirs(IMAGE_FOLDER, exist_ok=True) 
 
-    output = BytesIO()
-    df_datos_texto = df[[c for c in ENCABEZADOS if c in df.columns]] 
-    df_datos_texto.to_excel(output, index=False)
-    output.seek(0)
-    
-    wb = load_workbook(output)
-    ws = wb.active 
-    
-    # Aplicar formatos de celda y fila
-    ws.row_dimensions[1].height = ALTURA_ENCABEZADO_PT
-    
-    for row_index in range(1, len(df) + 2):
-        fila_excel_obj = ws[row_index]
-        if row_index > 1:
-            ws.row_dimensions[row_index].height = ALTURA_FILA_DATOS_PT
-            
-        for col_idx_0based in range(len(ENCABEZADOS)): 
-            celda = fila_excel_obj[col_idx_0based]
-            celda.alignment = ALINEACION_CENTRO 
-            
-            if row_index == 1:
-                celda.fill = RELLENO_VERDE_AZULADO
-                celda.font = FUENTE_ENCABEZADO
-        
-    for idx, col_name in enumerate(ENCABEZADOS, start=1):
-        col_letter = get_column_letter(idx)
-        if col_name == 'OBSERVACIONES':
-            ws.column_dimensions[col_letter].width = ANCHO_COLUMNA_OBSERVACIONES_UNITS
-        else:
-            ws.column_dimensions[col_letter].width = ANCHO_COLUMNA_NORMAL_UNITS
+def sincronizar_registros():
+    """Trae los cambios de cualquier inspector al dataset compartido y descarta el reporte listo si ya no coincide."""
+    df, marca = cargar_datos_persistentes()
+    marca_anterior = st.session_state.get('marca_registros')
+    if marca != marca_anterior:
+        if marca_anterior is not None and st.session_state.get('excel_listo'):
+            descartar_excel_listo()
+        st.session_state['marca_registros'] = marca
+    return df
+
+
+def describir_registros(df, ids):
+    """Texto breve con el id y el MODELO de cada registro, para los avisos de duplicados."""
+    return ", ".join(f"registro #{i}, modelo {df.at[i, 'MODELO']}" if i in df.index else f"registro #{i}" for i in ids)
+
+
+def descartar_excel_listo():
+    """Limpia la bandera de descarga (y el trabajo asociado) y elimina el archivo si no pertenece a la caché de reportes."""
+    ruta = st.session_state.get('excel_listo')
+    if ruta and os.path.exists(ruta) and not es_exportacion_en_cache(ruta):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+    st.session_state['excel_listo'] = None
+    st.session_state['trabajo_exportacion'] = None
+    st.session_state['avisos_exportacion'] = []
+    st.query_params.pop('trabajo', None)
 
-    # Inserción de Imágenes Incrustadas
-    df_rutas_imagen = df[COLUMNAS_IMAGEN]
-    for indice_fila, (index, fila_rutas) in enumerate(df_rutas_imagen.iterrows()):
-        fila_excel = indice_fila + 2
-        
-        for indice_columna, nombre_columna_foto in enumerate(COLUMNAS_IMAGEN):
-            
-            imagen_ruta_guardada = fila_rutas[nombre_columna_foto]
-            path_check = str(imagen_ruta_guardada).strip()
-            es_path_valido = path_check and path_check.lower() != 'none' and path_check.lower() != 'nan'
-            
-            columna_imagen_index = len(ENCABEZADOS) + indice_columna + 1
-            columna_letra = get_column_letter(columna_imagen_index)
-
-            if indice_fila == 0: 
-                 celda_encabezado = ws[f'{columna_letra}1']
-                 celda_encabezado.value = nombre_columna_foto
-                 celda_encabezado.alignment = ALINEACION_CENTRO 
-                 celda_encabezado.fill = RELLENO_VERDE_AZULADO
-                 celda_encabezado.font = FUENTE_ENCABEZADO
-                 ws.column_dimensions[columna_letra].width = ANCHO_COLUMNA_NORMAL_UNITS
-            
-            if es_path_valido and os.path.exists(path_check):
-                try:
-                    with open(path_check, 'rb') as f:
-                        img_pil = Image.open(f)
-                        img_pil.load() 
-                        
-                    exif = img_pil._getexif()
-                    orientation = 1
-                    if exif:
-                        for tag, value in exif.items():
-                            if TAGS.get(tag, tag) == 'Orientation':
-                                orientation = value
-                                break
-                    
-                    if orientation == 3: img_pil = img_pil.rotate(180, expand=True)
-                    elif orientation == 6: img_pil = img_pil.rotate(-90, expand=True)
-                    elif orientation == 8: img_pil = img_pil.rotate(90, expand=True)
-
-                    rotated_img_bytes = BytesIO()
-                    img_pil.save(rotated_img_bytes, format='PNG')
-                    rotated_img_bytes.seek(0)
-
-                    img = OpenpyxlImage(rotated_img_bytes)
-                    img.width = IMAGEN_WIDTH 
-                    img.height = IMAGEN_HEIGHT
-                    ws.add_image(img, f'{columna_letra}{fila_excel}')
-                    
-                    del img_pil
-                    del rotated_img_bytes
-                    gc.collect() 
-
-                except Exception as e:
-                    st.warning(f"⚠️ Error al procesar imagen '{path_check}': {e}. Insertando sin rotación.")
-                    try:
-                        with open(path_check, 'rb') as f:
-                            img = OpenpyxlImage(f)
-                            img.width = IMAGEN_WIDTH 
-                            img.height = IMAGEN_HEIGHT
-                            ws.add_image(img, f'{columna_letra}{fila_excel}')
-                    except Exception as e2:
-                         st.error(f"❌ Error crítico al insertar imagen original: {e2}")
-
-    final_output = BytesIO()
-    wb.save(final_output)
-    return final_output
 
+def leer_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        return f.read()
 
+
+@medir('guardado.total')
 def guardar_registro_y_limpiar(modelo, serie, condiciones, observaciones, fotos):
     """Guarda el registro y limpia los campos (se ejecuta al añadir)."""
     
@@ -192,21 +90,33 @@ def guardar_registro_y_limpiar(modelo, serie, condiciones, observaciones, fotos)
         st.error("❌ Los campos MODELO y SERIE son obligatorios.")
         return 
 
+    # Tiempos por fase de este guardado (métricas de la página de administración)
+    tiempos = Acumulador()
+
+    # Control de SERIE duplicada con el índice en memoria (al día con el almacén)
+    with tiempos.medir('guardado.duplicados'):
+        df_registros, _ = cargar_datos_persistentes()
+        # Si no está entre los registros activos, se consulta el índice del archivo histórico
+        ids_duplicados = buscar_por_serie(serie) or [i for i, _ in archivados_por_serie(serie)]
+    if ids_duplicados and POLITICA_DUPLICADOS == 'BLOQUEAR':
+        st.error(f"❌ La SERIE {serie} ya fue inspeccionada ({describir_registros(df_registros, ids_duplicados)}). El registro no se guardó.")
+        return
+
     os.makedirs(IMAGE_FOLDER, exist_ok=True)
     
-    # Lógica de guardado de fotos físicas
+    # Lógica de guardado de fotos físicas: cada foto se guarda bajo el hash de su contenido,
+    # así que una foto repetida se almacena una sola vez
     fotos_rutas_guardadas = {}
     
     for k, uploaded_file in fotos.items():
         if uploaded_file is not None:
-            file_extension = uploaded_file.name.split('.')[-1]
-            timestamp = pd.Timestamp.now().strftime("%Y%m%d%H%M%S")
-            filename = f"{modelo.replace(' ', '_')}_{serie.replace(' ', '_')}_{k.replace(' ', '_')}_{timestamp}.{file_extension}"
-            ruta_guardado = os.path.join(IMAGE_FOLDER, filename)
-            
-            with open(ruta_guardado, "wb") as f:
-                f.write(uploaded_file.getbuffer()) 
-                
+            ruta_guardado, ruta_original, avisos = guardar_foto_subida(
+                uploaded_file.getbuffer(), uploaded_file.name.split('.')[-1], AJUSTES_FOTOS, nombre=k, tiempos=tiempos
+            )
+            for aviso in avisos:
+                st.warning(aviso)
+            if ruta_original:
+                fotos_rutas_guardadas[f"{k} {SUFIJO_ORIGINAL}"] = ruta_original
             fotos_rutas_guardadas[k] = ruta_guardado
         else:
             fotos_rutas_guardadas[k] = None
@@ -217,23 +127,34 @@ def guardar_registro_y_limpiar(modelo, serie, condiciones, observaciones, fotos)
         'SERIE': serie,
         'OBSERVACIONES': observaciones,
         **{k: 'SÍ' if v else 'NO' for k, v in condiciones.items()},
-        **fotos_rutas_guardadas 
+        **fotos_rutas_guardadas,
+        CAMPO_VERSION_ESQUEMA: config["VERSION_ESQUEMA"]
     }
     
-    st.session_state['datos_ingresados'].append(nuevo_registro)
+    programar_limite_cache()
 
-    # Persistencia: Guardar el registro a un archivo CSV (texto + rutas)
+    # Persistencia: se añade solo este registro al almacén (texto + rutas), sin reescribir los anteriores.
+    # El dataset compartido lo incorpora en la próxima sincronización, junto con los de otros inspectores.
     try:
-        df_actual = pd.DataFrame(st.session_state['datos_ingresados'])
-        df_actual[[c for c in COLUMNAS_FINALES if c in df_actual.columns]].to_csv(PERSISTENCE_FILE, index=False)
+        with tiempos.medir('guardado.insercion'):
+            id_nuevo = insertar_registro(nuevo_registro, bloquear_serie_duplicada=POLITICA_DUPLICADOS == 'BLOQUEAR')
     except Exception as e:
-        st.warning(f"Advertencia: No se pudo guardar el archivo de persistencia CSV. Error: {e}")
+        st.error(f"❌ No se pudo guardar el registro en el almacén persistente. Error: {e}")
+        return
+    finally:
+        tiempos.registrar()
+    if id_nuevo is None:
+        # Otra sesión guardó la misma SERIE entre la comprobación y el alta
+        st.error(f"❌ La SERIE {serie} acaba de ser registrada por otro inspector. El registro no se guardó.")
+        return
+    if ids_duplicados:
+        st.warning(f"⚠️ La SERIE {serie} ya había sido inspeccionada ({describir_registros(df_registros, ids_duplicados)}). Se guardó de todos modos.")
         
     st.success(f"✅ Registro para Modelo {modelo} añadido a la lista. Ingresa el siguiente.")
     
     # Reiniciamos la key del formulario y la key del excel para limpiar y no guardar un excel "viejo"
     st.session_state['limpiador_key'] += 1 
-    st.session_state['excel_listo'] = None 
+    descartar_excel_listo()
     
     keys_a_limpiar_texto = ['input_modelo', 'input_serie', 'input_observaciones']
     for key in keys_a_limpiar_texto:
@@ -246,21 +167,256 @@ def guardar_registro_y_limpiar(modelo, serie, condiciones, observaciones, fotos)
 # 💥 FUNCIÓN PARA PROCESAR Y PREPARAR LA DESCARGA 💥
 # ----------------------------------------------------
 
+FORMATO_EXCEL = "Un solo Excel"
+FORMATO_ZIP = "ZIP con varios Excel (reportes grandes)"
+FORMATO_VINCULADO = "Excel liviano + fotos vinculadas + Parquet (rápido)"
+
+
+def mostrar_opciones_descarga(df):
+    """Elige entre un único libro, un ZIP dividido en partes (sugerido cuando hay muchos registros) o el ZIP con fotos vinculadas."""
+    formatos = [FORMATO_EXCEL, FORMATO_ZIP, FORMATO_VINCULADO]
+    formato = st.radio(
+        "Formato de descarga",
+        formatos,
+        index=1 if len(df) > FILAS_POR_PARTE_POR_DEFECTO else 0,
+        horizontal=True,
+        key='formato_descarga'
+    )
+    if formato == FORMATO_ZIP:
+        col_criterio, col_filas = st.columns(2)
+        col_criterio.selectbox("Dividir", list(CRITERIOS_PARTES), format_func=CRITERIOS_PARTES.get, key='criterio_partes')
+        col_filas.number_input("Máximo de filas por Excel", min_value=1, value=FILAS_POR_PARTE_POR_DEFECTO, step=100, key='filas_por_parte')
+
+
 def procesar_excel_para_descarga(df):
-    """Llama a la función de generación de Excel, guarda el archivo en el estado de sesión."""
+    """Envía la generación del Excel a la cola de trabajos en segundo plano y guarda el id del trabajo."""
     
     if df.empty:
         st.error("No hay registros guardados para procesar.")
         return None
 
-    # st.spinner solo funciona si no hay un st.rerun posterior, pero sí muestra el mensaje de espera
-    with st.spinner('⏳ Procesando y formateando Excel con imágenes... Esto puede tardar unos segundos. ¡No cierres el navegador!'):
-        excel_bytes = generar_excel_con_formato(df)
-        st.session_state['excel_listo'] = excel_bytes
-        
-    # Limpiamos el Garbage Collector después del proceso
-    gc.collect()
-    st.rerun() # Forzamos el rerun para que el botón de descarga se active
+    partes = None
+    if st.session_state.get('formato_descarga') == FORMATO_ZIP:
+        partes = {
+            'criterio': st.session_state.get('criterio_partes', 'FILAS'),
+            'filas_por_parte': st.session_state.get('filas_por_parte', FILAS_POR_PARTE_POR_DEFECTO),
+        }
+
+    vinculado = st.session_state.get('formato_descarga') == FORMATO_VINCULADO
+    id_trabajo = enviar_exportacion(df, ENCABEZADOS, COLUMNAS_IMAGEN, partes=partes, vinculado=vinculado)
+    if id_trabajo is None:
+        st.error("⚠️ Hay demasiados reportes en proceso en este momento. Intente de nuevo en unos minutos.")
+        return None
+
+    st.session_state['avisos_exportacion'] = []
+    # El id queda también en la URL para recuperar el reporte si se recarga la página
+    st.session_state['trabajo_exportacion'] = id_trabajo
+    st.query_params['trabajo'] = id_trabajo
+
+
+@st.fragment(run_every=1)
+def mostrar_progreso_exportacion():
+    """Consulta el trabajo de exportación cada segundo y activa la descarga cuando termina."""
+    id_trabajo = st.session_state.get('trabajo_exportacion')
+    if not id_trabajo:
+        return
+
+    estado = consultar_trabajo(id_trabajo)
+    if estado is None or estado['estado'] == ESTADO_ERROR:
+        st.session_state['trabajo_exportacion'] = None
+        st.query_params.pop('trabajo', None)
+        if estado is not None:
+            st.session_state['avisos_exportacion'] = [('error', f"❌ Error al generar el reporte: {estado['error']}")]
+        st.rerun()
+
+    if estado['estado'] == ESTADO_LISTO:
+        st.session_state['excel_listo'] = estado['ruta']
+        st.session_state['avisos_exportacion'] = estado['avisos']
+        st.rerun()
+
+    if estado['estado'] == ESTADO_EN_COLA:
+        st.info("⏳ Reporte en cola, esperando un procesador libre...")
+        return
+
+    hechas, total = estado['hechas'], estado['total']
+    if not total:
+        st.progress(0.0, text="⏳ Preparando reporte...")
+        return
+    texto = f"⏳ Procesando imágenes: {hechas} de {total}"
+    if estado['eta_s'] is not None:
+        texto += f" (faltan ~{int(estado['eta_s']) + 1} s)"
+    st.progress(hechas / total, text=texto)
+
+def mostrar_descarga(df):
+    """Paso 1 (procesar en segundo plano) y paso 2 (descargar) del reporte de los registros activos o de un mes archivado."""
+    col_proc, col_down = st.columns(2)
+
+    # BOTÓN 1: PROCESAR (ENVÍA EL TRABAJO PESADO A SEGUNDO PLANO y prepara la descarga)
+    if st.session_state['excel_listo'] is None and st.session_state['trabajo_exportacion']:
+         with col_proc:
+             mostrar_progreso_exportacion()
+    elif st.session_state['excel_listo'] is None and not df.empty:
+         with col_proc:
+             mostrar_opciones_descarga(df)
+         col_proc.button(
+            label="⚙️ 1. Procesar para Descarga", 
+            type="primary",
+            on_click=procesar_excel_para_descarga, 
+            args=(df,)
+        )
+    elif st.session_state['excel_listo'] is not None:
+         col_proc.success("✅ Archivo listo. Continúe con el paso 2.")
+
+    # BOTÓN 2: DESCARGAR (SOLO APARECE SI EL ARCHIVO ESTÁ LISTO)
+    if st.session_state['excel_listo'] is not None and os.path.exists(st.session_state['excel_listo']):
+        es_zip = st.session_state['excel_listo'].endswith('.zip')
+        es_vinculado = st.session_state['excel_listo'].endswith(SUFIJO_VINCULADO)
+        if es_vinculado:
+            etiqueta, nombre_archivo = "⬇️ 2. Descargar Excel + Fotos (ZIP)", "Inspeccion_Reporte_Vinculado.zip"
+        elif es_zip:
+            etiqueta, nombre_archivo = "⬇️ 2. Descargar ZIP de Excel", "Inspeccion_Reporte_Mobil.zip"
+        else:
+            etiqueta, nombre_archivo = "⬇️ 2. Descargar Excel Final", "Inspeccion_Reporte_Mobil.xlsx"
+        col_down.download_button(
+            label=etiqueta,
+            # Se lee al hacer clic, no en cada interacción mientras el reporte está listo
+            data=lambda ruta=st.session_state['excel_listo']: leer_archivo(ruta),
+            file_name=nombre_archivo,
+            mime="application/zip" if es_zip else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            # El archivo sigue en la caché de reportes: mientras los registros no cambien, no se reprocesa
+            on_click="ignore",
+            type="primary"
+        )
+    else:
+        col_down.button("⬇️ 2. Descargar Excel Final", disabled=True)
+
+    for nivel, mensaje in st.session_state['avisos_exportacion']:
+        getattr(st, nivel)(mensaje)
+
+# ----------------------------------------------------
+# BÚSQUEDA POR SERIE
+# ----------------------------------------------------
+
+def mostrar_busqueda_serie(df):
+    """Busca una SERIE en el índice en memoria y muestra sus registros con sus fotos."""
+    with st.expander("🔎 Buscar Inspección por SERIE"):
+        serie_buscada = st.text_input("SERIE", key='buscar_serie').strip()
+        if not serie_buscada:
+            return
+
+        ids = [i for i in buscar_por_serie(serie_buscada) if i in df.index]
+        archivados = archivados_por_serie(serie_buscada)
+        if archivados:
+            st.info("También figura en el archivo histórico: " + ", ".join(f"registro #{i} ({mes})" for i, mes in archivados))
+        if not ids:
+            if not archivados:
+                st.info(f"No hay inspecciones para la SERIE {serie_buscada}.")
+            return
+
+        traer_fotos(df.loc[ids], COLUMNAS_IMAGEN)
+        for id_registro in ids:
+            fila = df.loc[id_registro]
+            st.markdown(f"**Registro #{id_registro}** — MODELO {fila['MODELO']}, SERIE {fila['SERIE']}")
+            st.dataframe(df.loc[[id_registro], [c for c in ENCABEZADOS if c in df.columns]], use_container_width=True, hide_index=True)
+
+            cols_foto = st.columns(4)
+            fotos_validas = [(c, fila[c]) for c in COLUMNAS_IMAGEN if c in df.columns and es_ruta_valida(fila[c])]
+            for i, (nombre_columna_foto, ruta) in enumerate(fotos_validas):
+                try:
+                    ruta_mostrar = obtener_miniatura(ruta, IMAGEN_WIDTH, IMAGEN_HEIGHT)
+                except Exception:
+                    ruta_mostrar = ruta
+                cols_foto[i % 4].image(ruta_mostrar, caption=nombre_columna_foto)
+            if not fotos_validas:
+                st.caption("Sin fotos.")
+
+# ----------------------------------------------------
+# ARCHIVO HISTÓRICO (MESES CERRADOS)
+# ----------------------------------------------------
+
+def mostrar_archivo_historico():
+    """Consulta y exportación de un mes archivado; se lee del Parquet solo al abrirlo."""
+    with st.expander("🗄️ Archivo Histórico (meses cerrados)"):
+        st.caption(f"La lista principal muestra los últimos {MESES_ACTIVOS} meses. Los anteriores se consultan aquí (solo lectura).")
+        try:
+            particiones = particiones_archivadas()
+        except ImportError:
+            st.warning("⚠️ Para consultar el archivo histórico falta instalar 'pyarrow'.")
+            return
+        if not particiones:
+            st.info("Todavía no hay meses archivados.")
+            return
+
+        opciones = {p['particion']: p for p in particiones}
+        particion = st.selectbox(
+            "Mes",
+            list(opciones),
+            format_func=lambda p: f"{p} ({opciones[p]['registros']} registros)",
+            key='particion_archivo'
+        )
+        if not st.toggle("Abrir mes", key='abrir_particion_archivo'):
+            return
+
+        try:
+            df_mes = leer_particion(particion, config)
+        except Exception as e:
+            st.error(f"❌ No se pudo leer el mes {particion}: {e}")
+            return
+
+        filtro_serie = st.text_input("Filtrar por SERIE", key='filtro_serie_archivo').strip()
+        df_vista = filtrar_dataset(df_mes, serie=filtro_serie)
+        st.dataframe(df_vista[[c for c in ENCABEZADOS if c in df_vista.columns]], use_container_width=True, height=300)
+        st.caption(f"{len(df_vista)} de {len(df_mes)} registros del mes {particion}.")
+
+        # La exportación usa el mismo formato elegido y la misma cola de trabajos que la lista principal
+        if st.session_state['excel_listo'] is None and not st.session_state['trabajo_exportacion']:
+            st.button(
+                f"⚙️ Procesar {particion} para Descarga",
+                on_click=procesar_excel_para_descarga,
+                args=(df_vista,),
+                key='exportar_particion_archivo'
+            )
+        else:
+            st.caption("Hay un reporte en curso o listo para descargar; descárguelo para exportar este mes.")
+
+# ----------------------------------------------------
+# VISTA PREVIA DE REGISTROS (FILTROS Y PAGINACIÓN)
+# ----------------------------------------------------
+FILAS_POR_PAGINA = 50
+OPCION_TODAS = '(Todas)'
+
+def mostrar_filtros_registros(df):
+    """Dibuja los filtros de la vista previa y devuelve el dataset filtrado (memorizado mientras no cambien datos ni filtros)."""
+    col_f1, col_f2, col_f3, col_f4 = st.columns(4)
+    filtro_modelo = col_f1.text_input("Filtrar por MODELO", key='filtro_modelo')
+    filtro_serie = col_f2.text_input("Filtrar por SERIE", key='filtro_serie')
+    filtro_condicion = col_f3.selectbox("Condición", [OPCION_TODAS] + CONDICIONES_INSPECCION, key='filtro_condicion')
+    filtro_valor = col_f4.selectbox("Valor", VALORES_CONDICION[::-1], key='filtro_valor', disabled=filtro_condicion == OPCION_TODAS)
+
+    clave = (st.session_state.get('marca_registros'), id(df), filtro_modelo, filtro_serie, filtro_condicion, filtro_valor)
+    memo = st.session_state.get('filtro_memo')
+    if memo is None or memo[0] != clave:
+        condicion = None if filtro_condicion == OPCION_TODAS else filtro_condicion
+        memo = (clave, filtrar_dataset(df, filtro_modelo.strip(), filtro_serie.strip(), condicion, filtro_valor))
+        st.session_state['filtro_memo'] = memo
+    return memo[1]
+
+
+def mostrar_pagina_registros(df):
+    """Muestra solo la página seleccionada del dataset filtrado."""
+    total_paginas = max(1, -(-len(df) // FILAS_POR_PAGINA))
+    if st.session_state.get('pagina_registros', 1) > total_paginas:
+        st.session_state['pagina_registros'] = total_paginas
+
+    pagina = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key='pagina_registros')
+    inicio = (pagina - 1) * FILAS_POR_PAGINA
+    df_pagina = df.iloc[inicio:inicio + FILAS_POR_PAGINA]
+
+    st.dataframe(df_pagina[[c for c in ENCABEZADOS if c in df_pagina.columns]], use_container_width=True, height=300, hide_index=True)
+    if len(df):
+        st.caption(f"Mostrando {inicio + 1}-{inicio + len(df_pagina)} de {len(df)} registros (página {pagina} de {total_paginas})")
+    else:
+        st.caption("Ningún registro coincide con los filtros.")
 
 # ----------------------------------------------------
 # PUNTO DE ENTRADA Y DISEÑO DE LA INTERFAZ PRINCIPAL
@@ -268,6 +424,14 @@ def procesar_excel_para_descarga(df):
 def main():
     st.set_page_config(page_title="Electrolux Inspección", layout="wide")
 
+    if error_configuracion():
+        st.error(error_configuracion())
+
+    # Limpieza de fotos huérfanas en segundo plano (una vez por proceso; no recorre la carpeta aquí)
+    iniciar_recolector()
+    # Los meses cerrados pasan al archivo histórico en segundo plano (una vez por día y proceso)
+    iniciar_archivador()
+
     LOGO_PATH = "electrolux_logo.png"
 
     # APLICACIÓN DE LOGO Y TÍTULO EN LA BARRA SUPERIOR
@@ -291,17 +455,27 @@ def main():
     
     if st.button("⚙️ Editar Formato de Columnas (Administración)", type="secondary"):
         st.write("<meta http-equiv='refresh' content='0; url=admin_columnas'>", unsafe_allow_html=True)
+
+    if st.button("📦 Importación Masiva (ZIP de Fotos + Manifiesto)", type="secondary"):
+        st.write("<meta http-equiv='refresh' content='0; url=importacion_masiva'>", unsafe_allow_html=True)
         
     st.markdown("---")
     
     # --- LÓGICA DE INICIALIZACIÓN Y ESTADO ---
-    if 'datos_ingresados' not in st.session_state:
-        st.session_state['datos_ingresados'] = cargar_datos_persistentes()
     if 'limpiador_key' not in st.session_state:
         st.session_state['limpiador_key'] = 0
     # Bandera para el archivo Excel listo
     if 'excel_listo' not in st.session_state:
          st.session_state['excel_listo'] = None
+    elif st.session_state['excel_listo'] and not os.path.exists(st.session_state['excel_listo']):
+         st.session_state['excel_listo'] = None
+    # Trabajo de exportación en segundo plano (se recupera desde la URL tras recargar la página)
+    if 'trabajo_exportacion' not in st.session_state:
+         st.session_state['trabajo_exportacion'] = st.query_params.get('trabajo')
+    if 'avisos_exportacion' not in st.session_state:
+         st.session_state['avisos_exportacion'] = []
+    # Dataset compartido, al día con los registros añadidos, editados o borrados por cualquier sesión
+    df_registros = sincronizar_registros()
 
 
     # Usamos st.form para agrupar los inputs
@@ -349,54 +523,33 @@ def main():
 
     # --- 5. Mostrar tabla de registros guardados y botón de DESCARGA ---
 
-    if st.session_state['datos_ingresados']:
-        df_preview = pd.DataFrame(st.session_state['datos_ingresados'])
-        
-        st.subheader(f"Registros Guardados ({len(st.session_state['datos_ingresados'])})")
-        st.dataframe(df_preview[[c for c in ENCABEZADOS if c in df_preview.columns]], use_container_width=True, height=200)
+    if not df_registros.empty:
+        st.subheader(f"Registros Guardados ({len(df_registros)})")
+        mostrar_busqueda_serie(df_registros)
+        df_filtrado = mostrar_filtros_registros(df_registros)
+        mostrar_pagina_registros(df_filtrado)
 
         st.markdown("---")
-        
-        col_proc, col_down = st.columns(2)
-
-        # BOTÓN 1: PROCESAR (INICIA EL TRABAJO PESADO y prepara la descarga)
-        if st.session_state['excel_listo'] is None:
-             col_proc.button(
-                label="⚙️ 1. Procesar para Descarga", 
-                type="primary",
-                on_click=procesar_excel_para_descarga, 
-                args=(df_preview,)
-            )
-        else:
-             col_proc.success("✅ Archivo listo. Continúe con el paso 2.")
-        
-        # BOTÓN 2: DESCARGAR (SOLO APARECE SI EL ARCHIVO ESTÁ LISTO)
-        if st.session_state['excel_listo'] is not None:
-            col_down.download_button(
-                label="⬇️ 2. Descargar Excel Final",
-                data=st.session_state['excel_listo'].getvalue(),
-                file_name="Inspeccion_Reporte_Mobil.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                # Limpiamos el estado después de la descarga para forzar el reprocesamiento
-                on_click=lambda: st.session_state.update({'excel_listo': None}),
-                type="primary"
-            )
-        else:
-            col_down.button("⬇️ 2. Descargar Excel Final", disabled=True)
-
 
+    if not df_registros.empty or st.session_state['trabajo_exportacion'] or st.session_state['excel_listo']:
+        mostrar_descarga(df_registros)
         st.markdown("---")
-        
+
+    mostrar_archivo_historico()
+
+    if not df_registros.empty:
         # BOTÓN DE LIMPIAR (ÚNICA FORMA DE BORRAR LOS REGISTROS Y ARCHIVOS)
         if st.button("🗑️ Limpiar Todos los Registros"):
-            st.session_state['datos_ingresados'] = []
             st.session_state['limpiador_key'] += 1 
-            st.session_state['excel_listo'] = None
+            descartar_excel_listo()
             
+            eliminar_todos()
             if os.path.exists(PERSISTENCE_FILE):
                  os.remove(PERSISTENCE_FILE)
-            if os.path.exists(IMAGE_FOLDER):
-                 shutil.rmtree(IMAGE_FOLDER) 
+            obtener_almacen().vaciar(IMAGE_FOLDER)
+            if os.path.exists(CARPETA_MINIATURAS):
+                 shutil.rmtree(CARPETA_MINIATURAS) 
+            obtener_almacen().vaciar(CARPETA_ARCHIVO)
             
             st.success("Lista de registros y archivos persistentes eliminados.")
             st.rerun()
@@ -0,0 +1,210 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+import pandas as pd
+from almacen_registros import COLUMNA_ID, archivar_particion, particiones_con_registros_antes_de, conteo_archivados, ids_archivados
+from almacenamiento import obtener_almacen
+from configuracion import CAMPO_VERSION_ESQUEMA
+from dataset_registros import dataset_desde_registros
+from metricas import medir
+
+# ----------------------------------------------------
+# ARCHIVO HISTÓRICO POR MES (PARQUET COMPRIMIDO)
+# ----------------------------------------------------
+# Los registros se agrupan por el mes de su fecha de alta (UTC). Solo los
+# últimos MESES_ACTIVOS meses quedan en el almacén activo, que es lo que cada
+# proceso carga en memoria; los meses cerrados se compactan en un Parquet por
+# mes (columnar, zstd) dentro de CARPETA_ARCHIVO y se leen solo cuando alguien
+# los consulta o exporta. Así el arranque y la memoria por proceso dependen
+# del volumen del mes en curso, no de los años de historial.
+#
+# Los meses archivados son de solo lectura. Sus fotos siguen en el almacén
+# de fotos y cuentan como referenciadas (ver almacen_registros). Con
+# almacenamiento remoto cada Parquet se sube al bucket al escribirse y se
+# descarga la primera vez que un proceso lo lee.
+#
+# El archivado automático lo hace un hilo de fondo por proceso, nunca la
+# ejecución de una sesión. El Parquet se escribe antes de bloquear el almacén,
+# así que puede quedar con filas de un archivado que no llegó a confirmarse:
+# lo que vale es el índice de archivados, y las lecturas filtran por él.
+CARPETA_ARCHIVO = os.environ.get('CARPETA_ARCHIVO_REGISTROS', 'archivo_registros')
+MESES_ACTIVOS = max(1, int(os.environ.get('MESES_ACTIVOS', 2)))
+# '0' desactiva el archivado automático (queda el botón de la página de administración)
+ARCHIVADO_AUTOMATICO = os.environ.get('ARCHIVADO_AUTOMATICO', '1') != '0'
+# Cada cuánto revisa el hilo de fondo (archivar_si_corresponde archiva a lo sumo una vez por día)
+INTERVALO_REVISION_ARCHIVO_S = 3600
+COMPRESION_ARCHIVO = 'zstd'
+COLUMNA_CREADO = '_creado'
+# Meses archivados que se mantienen leídos en memoria por proceso
+PARTICIONES_EN_MEMORIA = 2
+
+_lock_archivado = threading.Lock()
+_ultima_revision = {'dia': None}
+_lock_lecturas = threading.Lock()
+_lecturas = OrderedDict()
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def primera_particion_activa(hoy=None):
+    """Mes más antiguo que sigue en el almacén activo según MESES_ACTIVOS."""
+    hoy = hoy or datetime.now(timezone.utc)
+    meses = hoy.year * 12 + hoy.month - 1 - (MESES_ACTIVOS - 1)
+    return f"{meses // 12:04d}-{meses % 12 + 1:02d}"
+
+
+def ruta_particion(particion):
+    return os.path.join(CARPETA_ARCHIVO, f"registros_{particion}.parquet")
+
+
+def _a_tabla(filas):
+    """DataFrame columnar de los registros: una columna por campo, todo como texto salvo id y versión de esquema."""
+    registros = [{**registro, COLUMNA_ID: id_registro, COLUMNA_CREADO: creado} for id_registro, creado, registro in filas]
+    df = pd.DataFrame.from_records(registros)
+    for col in df.columns:
+        if col in (COLUMNA_ID, CAMPO_VERSION_ESQUEMA):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        else:
+            df[col] = df[col].map(lambda v: None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+    return df
+
+
+def _escribir_particion(particion, filas):
+    """Escribe (reemplazo atómico) el Parquet del mes, conservando lo ya archivado de ese mes."""
+    os.makedirs(CARPETA_ARCHIVO, exist_ok=True)
+    ruta = ruta_particion(particion)
+    df = _a_tabla(filas)
+    if obtener_almacen().traer(ruta):
+        # Un archivado anterior del mismo mes: se conservan por id sus filas confirmadas
+        anterior = pd.read_parquet(ruta)
+        anterior = anterior[anterior[COLUMNA_ID].isin(ids_archivados(particion)) & ~anterior[COLUMNA_ID].isin(df[COLUMNA_ID])]
+        df = pd.concat([anterior, df], ignore_index=True).sort_values(COLUMNA_ID)
+
+    ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with medir('archivo.escritura') as m:
+            df.to_parquet(ruta_tmp, index=False, compression=COMPRESION_ARCHIVO)
+            m['bytes'] = os.path.getsize(ruta_tmp)
+            m['conteo'] = len(df)
+        os.replace(ruta_tmp, ruta)
+        # Antes de que archivar_particion saque los registros del almacén activo
+        obtener_almacen().subir(ruta)
+    finally:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+
+
+def archivar_meses_cerrados(hoy=None):
+    """Archiva los meses anteriores a la ventana activa que aún tengan registros. Devuelve [(mes, cantidad)]."""
+    archivados = []
+    with _lock_archivado:
+        for particion in particiones_con_registros_antes_de(primera_particion_activa(hoy)):
+            cantidad = archivar_particion(particion, lambda filas, p=particion: _escribir_particion(p, filas))
+            if cantidad:
+                archivados.append((particion, cantidad))
+    return archivados
+
+
+def archivar_si_corresponde():
+    """
+    Archivado automático, a lo sumo una vez por día y proceso; no espera si otra sesión ya lo está haciendo.
+    Devuelve [(mes, cantidad)] archivados en esta llamada.
+    """
+    hoy = datetime.now(timezone.utc)
+    if not ARCHIVADO_AUTOMATICO or _ultima_revision['dia'] == hoy.date():
+        return []
+    if not _lock_archivado.acquire(blocking=False):
+        return []
+    try:
+        if _ultima_revision['dia'] == hoy.date():
+            return []
+        _ultima_revision['dia'] = hoy.date()
+    finally:
+        _lock_archivado.release()
+    try:
+        return archivar_meses_cerrados(hoy)
+    except Exception:
+        # Se reintenta en la próxima revisión
+        _ultima_revision['dia'] = None
+        raise
+
+
+def _bucle():
+    while True:
+        try:
+            archivar_si_corresponde()
+        except Exception:
+            # Los meses siguen en la lista activa hasta que un archivado se complete
+            pass
+        time.sleep(INTERVALO_REVISION_ARCHIVO_S)
+
+
+def iniciar_archivador():
+    """Arranca (una sola vez por proceso) el hilo de fondo que archiva los meses cerrados."""
+    global _hilo
+    if not ARCHIVADO_AUTOMATICO:
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='archivo_registros', daemon=True)
+            _hilo.start()
+
+
+def particiones_archivadas():
+    """Lista de dicts {particion, registros, bytes} de los meses archivados, del más reciente al más antiguo."""
+    registros = conteo_archivados()
+    particiones = []
+    for ruta, tamano, _ in obtener_almacen().listar(CARPETA_ARCHIVO):
+        nombre = os.path.basename(ruta)
+        if not (nombre.startswith('registros_') and nombre.endswith('.parquet')):
+            continue
+        particion = nombre[len('registros_'):-len('.parquet')]
+        if not registros.get(particion):
+            # Escrito por un archivado que no llegó a confirmarse
+            continue
+        particiones.append({'particion': particion, 'registros': registros.get(particion, 0), 'bytes': tamano})
+    return sorted(particiones, key=lambda p: p['particion'], reverse=True)
+
+
+def _registros_de_tabla(df):
+    registros = []
+    for fila in df.to_dict('records'):
+        registro = {k: v for k, v in fila.items() if k != COLUMNA_CREADO and v is not None and not (isinstance(v, float) and pd.isna(v))}
+        registro[COLUMNA_ID] = int(registro[COLUMNA_ID])
+        if CAMPO_VERSION_ESQUEMA in registro:
+            registro[CAMPO_VERSION_ESQUEMA] = int(registro[CAMPO_VERSION_ESQUEMA])
+        registros.append(registro)
+    return registros
+
+
+def leer_particion(particion, config):
+    """
+    Dataset (mismo formato que el activo, con las columnas de la configuración vigente) de un mes archivado.
+    Se mantienen en memoria los últimos PARTICIONES_EN_MEMORIA meses leídos; el DataFrame es compartido: no modificarlo.
+    """
+    ruta = ruta_particion(particion)
+    if not obtener_almacen().traer(ruta):
+        raise FileNotFoundError(ruta)
+    info = os.stat(ruta)
+    archivados = conteo_archivados().get(particion, 0)
+    clave = (particion, info.st_mtime_ns, info.st_size, archivados, config["VERSION_ESQUEMA"], tuple(config["COLUMNAS_FINALES"]))
+    with _lock_lecturas:
+        if clave in _lecturas:
+            _lecturas.move_to_end(clave)
+            return _lecturas[clave]
+
+    with medir('archivo.lectura') as m:
+        m['bytes'] = info.st_size
+        tabla = pd.read_parquet(ruta)
+        # Solo las filas confirmadas en el índice de archivados
+        tabla = tabla[tabla[COLUMNA_ID].isin(ids_archivados(particion))]
+        df = dataset_desde_registros(_registros_de_tabla(tabla), config)
+        m['conteo'] = len(df)
+
+    with _lock_lecturas:
+        _lecturas[clave] = df
+        while len(_lecturas) > PARTICIONES_EN_MEMORIA:
+            _lecturas.popitem(last=False)
+    return df
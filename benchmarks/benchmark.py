@@ -0,0 +1,336 @@
+"""
+Banco de pruebas de rendimiento: alta de registros, carga del almacén y exportación a Excel.
+
+Genera datos sintéticos con la forma de config_cols.json (fotos de tamaño real y con
+todas las orientaciones EXIF 1/3/6/8) y mide tiempo, pico de memoria (RSS) y tamaño de
+salida llamando a las funciones de la aplicación sin navegador. Cada medición corre en un
+proceso nuevo, dentro de una carpeta temporal, para no tocar los datos reales ni heredar
+cachés en memoria de otra medición.
+
+Uso (desde la carpeta del proyecto):
+    python benchmarks/benchmark.py ejecutar --tamanos 10 100 1000 --salida resultados.json
+    python benchmarks/benchmark.py comparar base.json resultados.json --umbral 0.10
+
+'comparar' termina con código 1 si alguna métrica empeoró más que el umbral.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+
+CARPETA_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VERSION_RESULTADOS = 1
+ORIENTACIONES_EXIF = (1, 3, 6, 8)
+MODELOS = ['ERT20G3HNW', 'ERTY18G2HNW', 'EFB21G3HNW', 'EQV10H3NSS', 'ERMA15G3HPS']
+
+OPERACION_CARGA = 'cargar_datos_persistentes'
+OPERACION_EXPORTACION_FRIA = 'escribir_reporte_excel'
+OPERACION_EXPORTACION_MINIATURAS = 'escribir_reporte_excel (miniaturas en caché)'
+OPERACION_GUARDADO = 'guardar_registro_y_limpiar'
+METRICAS_COMPARADAS = ('tiempo_s', 'rss_pico_mb', 'tamano_salida_bytes')
+
+
+# ----------------------------------------------------
+# DATOS SINTÉTICOS
+# ----------------------------------------------------
+
+def foto_sintetica(ancho, alto, orientacion, semilla, calidad=90):
+    """JPEG con ruido y degradados (se comprime como una foto real, no como un color plano) y la orientación EXIF indicada."""
+    from PIL import Image
+    random.seed(semilla)
+    ruido = Image.effect_noise((max(1, ancho // 4), max(1, alto // 4)), random.randint(32, 64)).resize((ancho, alto))
+    degradado = Image.linear_gradient('L').resize((ancho, alto))
+    img = Image.merge('RGB', (ruido, degradado, degradado.transpose(Image.FLIP_LEFT_RIGHT)))
+    exif = img.getexif()
+    exif[0x0112] = orientacion
+    salida = io.BytesIO()
+    img.save(salida, format='JPEG', quality=calidad, exif=exif)
+    return salida.getvalue()
+
+
+class ArchivoSubido:
+    """Imita el UploadedFile de Streamlit en lo que usa guardar_registro_y_limpiar."""
+
+    def __init__(self, nombre, datos):
+        self.name = nombre
+        self._datos = datos
+
+    def getbuffer(self):
+        return memoryview(self._datos)
+
+    def getvalue(self):
+        return self._datos
+
+
+def _preparar_carpeta(carpeta, ruta_config):
+    os.makedirs(carpeta, exist_ok=True)
+    shutil.copy(ruta_config, os.path.join(carpeta, 'config_cols.json'))
+    os.chdir(carpeta)
+    sys.path.insert(0, CARPETA_PROYECTO)
+    # Fuera de 'streamlit run' cada st.* avisa que no hay contexto de sesión
+    from streamlit import logger
+    logger.set_log_level('error')
+
+
+def _generar_dataset(carpeta, ruta_config, registros, fotos_distintas, lado_foto, semilla):
+    """Crea el almacén con N registros cuyas fotos se reparten entre un conjunto de fotos distintas ya guardadas."""
+    _preparar_carpeta(carpeta, ruta_config)
+    from almacen_fotos import guardar_foto
+    from almacen_registros import insertar_registro
+
+    with open('config_cols.json', 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    condiciones = config['CONDICIONES_INSPECCION']
+    columnas_imagen = config['COLUMNAS_IMAGEN']
+
+    ancho, alto = lado_foto, lado_foto * 3 // 4
+    rutas = []
+    for n in range(fotos_distintas):
+        datos = foto_sintetica(ancho, alto, ORIENTACIONES_EXIF[n % len(ORIENTACIONES_EXIF)], semilla + n)
+        rutas.append(guardar_foto(datos, 'jpg')[0])
+
+    aleatorio = random.Random(semilla)
+    for i in range(registros):
+        registro = {
+            'MODELO': aleatorio.choice(MODELOS),
+            'SERIE': f"{semilla:04d}{i:08d}",
+            'OBSERVACIONES': aleatorio.choice(['', 'Sin observaciones', 'Rayas leves en la tapa lateral, empaque con golpe en esquina inferior']),
+            **{c: aleatorio.choice(['SÍ', 'NO']) for c in condiciones},
+            # Como en campo, no todas las fotos se completan en cada inspección
+            **{c: rutas[(i * len(columnas_imagen) + j) % len(rutas)] if aleatorio.random() < 0.85 else None for j, c in enumerate(columnas_imagen)},
+        }
+        insertar_registro(registro)
+
+
+# ----------------------------------------------------
+# MEDICIONES (CADA UNA EN SU PROPIO PROCESO)
+# ----------------------------------------------------
+
+def _rss_pico_mb(quien):
+    import resource
+    pico = resource.getrusage(quien).ru_maxrss
+    # Linux informa KiB; macOS, bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def _tamano(rutas):
+    return sum(os.path.getsize(r) for r in rutas if os.path.exists(r))
+
+
+def _tamano_carpeta(carpeta):
+    return _tamano(os.path.join(raiz, nombre) for raiz, _, nombres in os.walk(carpeta) for nombre in nombres)
+
+
+def _medir(operacion, carpeta, ruta_config, guardados, lado_camara, semilla):
+    _preparar_carpeta(carpeta, ruta_config)
+    import resource
+    import streamlit as st
+    import app_principal as ap
+    import preparacion_imagenes
+    from exportacion import escribir_reporte_excel
+
+    subidas = []
+    if operacion == OPERACION_GUARDADO:
+        # Fotos de cámara distintas para cada alta (si se repitieran, el almacén las deduplicaría)
+        for i in range(guardados):
+            subidas.append({
+                c: ArchivoSubido(f"foto_{i}_{j}.jpg", foto_sintetica(lado_camara, lado_camara * 3 // 4, ORIENTACIONES_EXIF[j % len(ORIENTACIONES_EXIF)], semilla * 1000 + i * 100 + j))
+                for j, c in enumerate(ap.COLUMNAS_IMAGEN)
+            })
+        st.session_state['limpiador_key'] = 0
+        st.session_state['excel_listo'] = None
+        fotos_antes = _tamano_carpeta(ap.IMAGE_FOLDER)
+    elif operacion == OPERACION_EXPORTACION_FRIA:
+        shutil.rmtree(ap.CARPETA_MINIATURAS, ignore_errors=True)
+        shutil.rmtree('exportaciones', ignore_errors=True)
+    elif operacion == OPERACION_EXPORTACION_MINIATURAS:
+        shutil.rmtree('exportaciones', ignore_errors=True)
+
+    rss_base_mb = _rss_pico_mb(resource.RUSAGE_SELF)
+    inicio = time.perf_counter()
+
+    if operacion == OPERACION_CARGA:
+        df, _ = ap.cargar_datos_persistentes()
+        salida = [ap.PERSISTENCE_FILE, 'datos_maestro.db', 'datos_maestro.db-wal']
+        extra = {'filas': len(df)}
+    elif operacion == OPERACION_GUARDADO:
+        for n, fotos in enumerate(subidas):
+            condiciones = {c: n % 2 == 0 for c in ap.CONDICIONES_INSPECCION}
+            ap.guardar_registro_y_limpiar(MODELOS[n % len(MODELOS)], f"NUEVA{semilla:04d}{n:06d}", condiciones, 'Alta de prueba', fotos)
+        extra = {'registros_guardados': guardados}
+    else:
+        df, _ = ap.cargar_datos_persistentes()
+        inicio = time.perf_counter()
+        # Directo al motor de exportación: sin la caché de reportes, que se mediría a sí misma
+        salida = [os.path.join('exportaciones', 'benchmark.xlsx')]
+        escribir_reporte_excel(df, ap.ENCABEZADOS, ap.COLUMNAS_IMAGEN, salida[0])
+        extra = {'filas': len(df)}
+
+    tiempo = time.perf_counter() - inicio
+    if operacion == OPERACION_GUARDADO:
+        extra['por_registro_s'] = tiempo / max(1, guardados)
+        # Salida del guardado: lo que ocupan en disco las fotos nuevas (ya normalizadas)
+        tamano_salida = _tamano_carpeta(ap.IMAGE_FOLDER) - fotos_antes
+    else:
+        tamano_salida = _tamano(salida)
+
+    if preparacion_imagenes._pool is not None:
+        preparacion_imagenes._pool.shutdown()
+
+    return {
+        'operacion': operacion,
+        'tiempo_s': tiempo,
+        'rss_pico_mb': _rss_pico_mb(resource.RUSAGE_SELF),
+        'rss_base_mb': rss_base_mb,
+        # Máximo de un solo proceso del pool de imágenes (no la suma)
+        'rss_pico_hijos_mb': _rss_pico_mb(resource.RUSAGE_CHILDREN),
+        'tamano_salida_bytes': tamano_salida,
+        **extra,
+    }
+
+
+def _ejecutar_hijo(cola, funcion, args):
+    try:
+        cola.put(('ok', funcion(*args)))
+    except BaseException as e:
+        cola.put(('error', f"{type(e).__name__}: {e}"))
+
+
+def en_proceso_nuevo(funcion, *args):
+    """Ejecuta funcion(*args) en un proceso 'spawn' recién creado y devuelve su resultado."""
+    contexto = multiprocessing.get_context('spawn')
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=_ejecutar_hijo, args=(cola, funcion, args))
+    proceso.start()
+    estado, valor = cola.get()
+    proceso.join()
+    if estado == 'error':
+        raise RuntimeError(valor)
+    return valor
+
+
+# ----------------------------------------------------
+# COMANDOS
+# ----------------------------------------------------
+
+def ejecutar(args):
+    ruta_config = os.path.abspath(args.config)
+    operaciones = [OPERACION_CARGA, OPERACION_EXPORTACION_FRIA, OPERACION_EXPORTACION_MINIATURAS, OPERACION_GUARDADO]
+    resultados = []
+
+    for registros in args.tamanos:
+        carpeta = tempfile.mkdtemp(prefix=f"benchmark_{registros}_")
+        try:
+            print(f"Generando {registros} registros en {carpeta}...", flush=True)
+            en_proceso_nuevo(_generar_dataset, carpeta, ruta_config, registros, args.fotos_distintas, args.lado_foto, args.semilla)
+
+            # El guardado va al final porque agrega registros al almacén
+            for operacion in operaciones:
+                # La exportación en frío se repite con la caché de miniaturas vacía; la siguiente medición la reutiliza
+                repeticiones = [en_proceso_nuevo(_medir, operacion, carpeta, ruta_config, args.guardados, args.lado_camara, args.semilla + n)
+                                for n in range(args.repeticiones)]
+                resultado = dict(repeticiones[-1])
+                resultado['registros'] = registros
+                resultado['tiempo_s'] = statistics.median(r['tiempo_s'] for r in repeticiones)
+                resultado['tiempos_s'] = [r['tiempo_s'] for r in repeticiones]
+                resultado['rss_pico_mb'] = max(r['rss_pico_mb'] for r in repeticiones)
+                resultados.append(resultado)
+                print(f"  {operacion:<52} {resultado['tiempo_s']:8.2f} s  {resultado['rss_pico_mb']:8.1f} MB  {resultado['tamano_salida_bytes'] / 1e6:9.2f} MB salida", flush=True)
+        finally:
+            if not args.conservar_datos:
+                shutil.rmtree(carpeta, ignore_errors=True)
+
+    informe = {
+        'version': VERSION_RESULTADOS,
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'entorno': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'parametros': {
+            'tamanos': args.tamanos,
+            'repeticiones': args.repeticiones,
+            'fotos_distintas': args.fotos_distintas,
+            'lado_foto': args.lado_foto,
+            'lado_camara': args.lado_camara,
+            'guardados': args.guardados,
+            'semilla': args.semilla,
+        },
+        'resultados': resultados,
+    }
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+
+
+def comparar(args):
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.nuevo, 'r', encoding='utf-8') as f:
+        nuevo = json.load(f)
+
+    if base.get('parametros') != nuevo.get('parametros'):
+        print("⚠️ Las dos ejecuciones usaron parámetros distintos; la comparación puede no ser válida.")
+
+    anteriores = {(r['operacion'], r['registros']): r for r in base['resultados']}
+    regresiones = []
+    for r in nuevo['resultados']:
+        anterior = anteriores.get((r['operacion'], r['registros']))
+        if anterior is None:
+            continue
+        for metrica in METRICAS_COMPARADAS:
+            antes, ahora = anterior.get(metrica), r.get(metrica)
+            if not antes or ahora is None:
+                continue
+            cambio = (ahora - antes) / antes
+            marca = ''
+            if cambio > args.umbral:
+                marca = '  ⚠️ REGRESIÓN'
+                regresiones.append((r['operacion'], r['registros'], metrica, cambio))
+            print(f"{r['operacion']:<52} {r['registros']:>7} {metrica:<20} {antes:14.2f} -> {ahora:14.2f} ({cambio:+.1%}){marca}")
+
+    if regresiones:
+        print(f"\n{len(regresiones)} métrica(s) empeoraron más de {args.umbral:.0%}.")
+        return 1
+    print("\nSin regresiones por encima del umbral.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento (sin navegador).")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    p_ejecutar = comandos.add_parser('ejecutar', help="Genera datos sintéticos y mide cada operación")
+    p_ejecutar.add_argument('--tamanos', type=int, nargs='+', default=[10, 100, 1000], help="Cantidades de registros a medir")
+    p_ejecutar.add_argument('--repeticiones', type=int, default=1, help="Repeticiones por medición (se informa la mediana)")
+    p_ejecutar.add_argument('--fotos-distintas', type=int, default=52, help="Fotos distintas que se reparten entre los registros")
+    p_ejecutar.add_argument('--lado-foto', type=int, default=2048, help="Lado mayor de las fotos guardadas (ya normalizadas)")
+    p_ejecutar.add_argument('--lado-camara', type=int, default=4000, help="Lado mayor de las fotos subidas en la medición de guardado")
+    p_ejecutar.add_argument('--guardados', type=int, default=3, help="Registros con todas sus fotos que se dan de alta en la medición de guardado")
+    p_ejecutar.add_argument('--semilla', type=int, default=1234)
+    p_ejecutar.add_argument('--config', default=os.path.join(CARPETA_PROYECTO, 'config_cols.json'))
+    p_ejecutar.add_argument('--salida', default='resultados_benchmark.json')
+    p_ejecutar.add_argument('--conservar-datos', action='store_true', help="No borra las carpetas temporales con los datos generados")
+    p_ejecutar.set_defaults(funcion=ejecutar)
+
+    p_comparar = comandos.add_parser('comparar', help="Compara dos archivos de resultados y señala regresiones")
+    p_comparar.add_argument('base')
+    p_comparar.add_argument('nuevo')
+    p_comparar.add_argument('--umbral', type=float, default=0.10, help="Empeoramiento relativo tolerado (0.10 = 10%%)")
+    p_comparar.set_defaults(funcion=comparar)
+
+    args = parser.parse_args()
+    sys.exit(args.funcion(args) or 0)
+
+
+if __name__ == '__main__':
+    main()
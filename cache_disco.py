@@ -0,0 +1,49 @@
+import os
+import time
+
+# ----------------------------------------------------
+# CACHÉS EN DISCO CON LÍMITE DE TAMAÑO
+# ----------------------------------------------------
+# Miniaturas, reportes generados y copias locales de fotos remotas se
+# guardan en carpetas que crecen con el uso. Cada acceso renueva la fecha de
+# modificación del archivo, y al superar el límite se borran los usados hace
+# más tiempo (LRU aproximado por fecha).
+
+
+def archivos_en(carpeta):
+    """Lista de (fecha de uso, tamaño, ruta) de los archivos bajo la carpeta (vacía si no existe)."""
+    archivos = []
+    for raiz, _, nombres in os.walk(carpeta):
+        for nombre in nombres:
+            ruta = os.path.join(raiz, nombre)
+            try:
+                info = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, ruta))
+    return archivos
+
+
+def expulsar_antiguos(carpeta, tamano_maximo, proteccion_s=0, excepto=None):
+    """
+    Borra los archivos usados hace más tiempo hasta que la carpeta quepa en tamano_maximo. No se tocan
+    los usados hace menos de proteccion_s segundos ni la ruta excepto. Devuelve los bytes liberados.
+    """
+    archivos = archivos_en(carpeta)
+    total = sum(tamano for _, tamano, _ in archivos)
+    excepto = os.path.abspath(excepto) if excepto else None
+    ahora = time.time()
+    liberados = 0
+
+    for usado, tamano, ruta in sorted(archivos):
+        if total <= tamano_maximo or ahora - usado < proteccion_s:
+            break
+        if excepto and os.path.abspath(ruta) == excepto:
+            continue
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        total -= tamano
+        liberados += tamano
+    return liberados
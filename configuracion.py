@@ -0,0 +1,121 @@
+import os
+import json
+import threading
+from normalizacion_fotos import completar_ajustes
+
+# ----------------------------------------------------
+# CONFIGURACIÓN DE COLUMNAS COMPARTIDA (CON RECARGA EN CALIENTE)
+# ----------------------------------------------------
+# config_cols.json se lee una sola vez por proceso y se vuelve a leer solo
+# cuando cambia su fecha de modificación o su tamaño: en cada ejecución del
+# script el costo es un stat() del archivo. Lo que guarda la página de
+# administración se ve en la siguiente interacción de cualquier sesión, sin
+# reiniciar la aplicación.
+#
+# VERSION_ESQUEMA sube cada vez que cambian las columnas. Cada registro guarda
+# la versión con que se creó y, al leerse, se completa en memoria con las
+# columnas agregadas después (ver migrar_registro); el almacén no se reescribe.
+ARCHIVO_CONFIGURACION = 'config_cols.json'
+CAMPO_VERSION_ESQUEMA = '_version_esquema'
+
+CONFIG_POR_DEFECTO = {
+    "VERSION_ESQUEMA": 1,
+    "CONDICIONES_INSPECCION": ["DAÑO EN EMPAQUE", "DAÑO FISICO", "ACCESORIOS COMPLETOS", "PARILLA EN MAL ESTADO", "PRESENTA RESTOS METALICOS (VIRUTAS)", "TAPAS PRESENTAN OXIDO", "PRESENTA RAYAS", "TARJETA DE GARANTÍA", "TIENE ETIQUETA DE EFICIENCIA ENERGETICA"],
+    "COLUMNAS_IMAGEN": ["FOTO DE SERIE", "FOTO DEL EMPAQUE", "FOTO DE PRODUCTO COMPLETO", "FOTO PARTE TRASERA", "FOTO DE OBSERVACIONES A 50 CM (VIRUTAS)", "FOTO DE OBSERVACIONES CERCA (VIRUTAS)", "FOTO DE OBSERVACIONES A 50 CM (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES CERCA (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES A 50 CM (MANCHAS)", "FOTO DE OBSERVACIONES CERCA (MANCHAS)", "FOTO DE OBSERVACIONES A 50 CM (RAYAS)", "FOTO DE OBSERVACIONES CERCA (RAYAS)", "FOTO DE ACCESORIOS"],
+    "DUPLICADOS_SERIE": "ADVERTIR",
+}
+# Claves calculadas al cargar; no se escriben en el archivo
+CLAVES_DERIVADAS = ('ENCABEZADOS', 'COLUMNAS_FINALES')
+
+_lock = threading.Lock()
+_estado = {'firma': None, 'config': None, 'error': None}
+
+
+def _completar(config):
+    """Agrega valores por defecto y las listas derivadas (ENCABEZADOS, COLUMNAS_FINALES)."""
+    completa = {**CONFIG_POR_DEFECTO, **{k: v for k, v in config.items() if k not in CLAVES_DERIVADAS}}
+    completa["PROCESAMIENTO_FOTOS"] = completar_ajustes(completa.get("PROCESAMIENTO_FOTOS"))
+    completa["ENCABEZADOS"] = ['MODELO', 'SERIE'] + list(completa["CONDICIONES_INSPECCION"]) + ['OBSERVACIONES']
+    completa["COLUMNAS_FINALES"] = completa["ENCABEZADOS"] + list(completa["COLUMNAS_IMAGEN"])
+    return completa
+
+
+def _firma_archivo():
+    try:
+        info = os.stat(ARCHIVO_CONFIGURACION)
+    except FileNotFoundError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+def obtener_configuracion():
+    """
+    Devuelve la configuración vigente (compartida entre sesiones: no debe modificarse).
+    Si el archivo no se puede leer, se mantiene la última configuración válida (o la de por defecto)
+    y el motivo queda en error_configuracion().
+    """
+    firma = _firma_archivo()
+    with _lock:
+        if _estado['config'] is not None and firma == _estado['firma']:
+            return _estado['config']
+
+        if firma is None:
+            _estado.update({'firma': None, 'config': _completar({}), 'error': None})
+            return _estado['config']
+
+        try:
+            with open(ARCHIVO_CONFIGURACION, 'r', encoding='utf-8') as f:
+                _estado.update({'config': _completar(json.load(f)), 'error': None})
+        except Exception as e:
+            _estado['error'] = f"Error al leer {ARCHIVO_CONFIGURACION} (usando UTF-8). Por favor, verifique el formato del archivo. Error: {e}"
+            if _estado['config'] is None:
+                _estado['config'] = _completar({})
+        # Aun con error se recuerda la firma, para no reintentar la lectura en cada ejecución
+        _estado['firma'] = firma
+        return _estado['config']
+
+
+def error_configuracion():
+    """Mensaje del último error de lectura de la configuración, o None."""
+    with _lock:
+        return _estado['error']
+
+
+def guardar_configuracion(nueva):
+    """
+    Guarda la configuración (escritura atómica) y la deja vigente para todas las sesiones.
+    Si cambiaron las columnas, sube VERSION_ESQUEMA. Devuelve la configuración completa guardada.
+    """
+    actual = obtener_configuracion()
+    nueva = {k: v for k, v in nueva.items() if k not in CLAVES_DERIVADAS}
+    version = actual["VERSION_ESQUEMA"]
+    if (list(nueva.get("CONDICIONES_INSPECCION", actual["CONDICIONES_INSPECCION"])) != actual["CONDICIONES_INSPECCION"]
+            or list(nueva.get("COLUMNAS_IMAGEN", actual["COLUMNAS_IMAGEN"])) != actual["COLUMNAS_IMAGEN"]):
+        version += 1
+    nueva = {"VERSION_ESQUEMA": version, **{k: v for k, v in nueva.items() if k != "VERSION_ESQUEMA"}}
+
+    ruta_tmp = f"{ARCHIVO_CONFIGURACION}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(ruta_tmp, 'w', encoding='utf-8') as f:
+        json.dump(nueva, f, indent=4, ensure_ascii=False)
+    os.replace(ruta_tmp, ARCHIVO_CONFIGURACION)
+
+    with _lock:
+        _estado.update({'firma': _firma_archivo(), 'config': _completar(nueva), 'error': None})
+        return _estado['config']
+
+
+def migrar_registro(registro, config):
+    """
+    Completa en memoria un registro guardado con una versión anterior del esquema: las columnas
+    agregadas después quedan en 'NO' (condiciones) o vacías. Un registro al día se devuelve sin copiar.
+    """
+    version = config["VERSION_ESQUEMA"]
+    if registro.get(CAMPO_VERSION_ESQUEMA, 0) >= version:
+        return registro
+
+    migrado = dict(registro)
+    for columna in config["COLUMNAS_FINALES"]:
+        if columna not in migrado:
+            migrado[columna] = 'NO' if columna in config["CONDICIONES_INSPECCION"] else None
+    migrado[CAMPO_VERSION_ESQUEMA] = version
+    return migrado
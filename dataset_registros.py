@@ -0,0 +1,206 @@
+import threading
+import numpy as np
+import pandas as pd
+from almacen_registros import COLUMNA_ID, normalizar_clave, leer_registros_con_marca, leer_cambios_desde
+from configuracion import migrar_registro
+
+# ----------------------------------------------------
+# DATASET EN MEMORIA COMPARTIDO POR TODAS LAS SESIONES
+# ----------------------------------------------------
+# Un único DataFrame por proceso, indexado por el id del registro, que se
+# actualiza solo con los cambios del almacén posteriores a su última marca.
+# Las sesiones lo leen sin copiarlo: cada cambio produce un DataFrame nuevo
+# y el anterior sigue siendo válido para quien lo esté usando.
+#
+# Junto al DataFrame se mantienen índices en memoria SERIE -> ids y
+# (MODELO, SERIE) -> ids, cargados una vez por proceso y actualizados con los
+# mismos cambios, para detectar duplicados y buscar unidades en O(1).
+#
+# Las columnas viven en arreglos con lugar de sobra al final: un alta escribe
+# sus filas a continuación y el DataFrame nuevo es una vista sobre las primeras
+# filas, sin copiar las anteriores (los DataFrames ya entregados no ven las
+# filas agregadas después). Solo al llenarse los arreglos, o ante un cambio o
+# una baja, se copia el conjunto; la capacidad se duplica en cada copia.
+#
+# Los registros de una versión anterior del esquema de columnas se completan
+# al leerse (configuracion.migrar_registro); si cambia la configuración, el
+# dataset se rearma una vez por proceso, no una vez por sesión.
+VALORES_CONDICION = ['NO', 'SÍ']
+TIPO_CONDICION = pd.CategoricalDtype(categories=VALORES_CONDICION)
+CAPACIDAD_MINIMA = 1024
+
+_lock = threading.Lock()
+_estado = {'df': None, 'marca': 0, 'esquema': None, 'por_serie': {}, 'por_modelo_serie': {}, 'arreglos': None}
+
+
+def _indexar(df):
+    for id_registro, modelo, serie in zip(df.index, df['MODELO'], df['SERIE']):
+        serie = normalizar_clave(serie)
+        _estado['por_serie'].setdefault(serie, set()).add(id_registro)
+        _estado['por_modelo_serie'].setdefault((normalizar_clave(modelo), serie), set()).add(id_registro)
+
+
+def _desindexar(df):
+    for id_registro, modelo, serie in zip(df.index, df['MODELO'], df['SERIE']):
+        serie = normalizar_clave(serie)
+        for indice, clave in ((_estado['por_serie'], serie), (_estado['por_modelo_serie'], (normalizar_clave(modelo), serie))):
+            ids = indice.get(clave)
+            if ids is not None:
+                ids.discard(id_registro)
+                if not ids:
+                    del indice[clave]
+
+
+def _a_dataframe(registros, columnas, condiciones):
+    """Convierte una lista de registros en el formato del dataset (columnas fijas, condiciones categóricas)."""
+    df = pd.DataFrame.from_records(registros, columns=[COLUMNA_ID] + [c for c in columnas if c != COLUMNA_ID])
+    df = df.set_index(COLUMNA_ID)
+    for col in df.columns:
+        if col in condiciones:
+            df[col] = df[col].where(df[col].isin(VALORES_CONDICION), 'NO').astype(TIPO_CONDICION)
+        else:
+            df[col] = df[col].fillna('').astype(object)
+    return df
+
+
+def dataset_vacio(columnas, condiciones):
+    """Dataset sin registros, con las mismas columnas y tipos que el compartido."""
+    return _a_dataframe([], columnas, condiciones)
+
+
+def dataset_desde_registros(registros, config):
+    """Dataset con las columnas de la configuración a partir de registros sueltos (ej. los de un mes archivado)."""
+    return _a_dataframe([migrar_registro(r, config) for r in registros], config["COLUMNAS_FINALES"], config["CONDICIONES_INSPECCION"])
+
+
+def _esquema(config):
+    return (config["VERSION_ESQUEMA"], config["COLUMNAS_FINALES"], config["CONDICIONES_INSPECCION"])
+
+
+def _reservar(df, capacidad):
+    """Copia el dataset a arreglos con lugar para 'capacidad' filas y devuelve la vista sobre sus filas."""
+    capacidad = max(capacidad, len(df), CAPACIDAD_MINIMA)
+    ids = np.empty(capacidad, dtype=np.int64)
+    ids[:len(df)] = df.index.to_numpy(dtype=np.int64)
+    columnas = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            arreglo = np.zeros(capacidad, dtype=np.int8)
+            arreglo[:len(df)] = df[col].array.codes
+        else:
+            arreglo = np.empty(capacidad, dtype=object)
+            arreglo[:len(df)] = df[col].to_numpy(dtype=object)
+        columnas[col] = arreglo
+    _estado['arreglos'] = {'ids': ids, 'columnas': columnas, 'filas': len(df)}
+    return _vista()
+
+
+def _vista():
+    """DataFrame sobre las filas ocupadas de los arreglos, sin copiarlas."""
+    arreglos = _estado['arreglos']
+    n = arreglos['filas']
+    indice = pd.Index(arreglos['ids'][:n], name=COLUMNA_ID, copy=False)
+    datos = {}
+    for col, arreglo in arreglos['columnas'].items():
+        if arreglo.dtype == np.int8:
+            valores = pd.Categorical.from_codes(arreglo[:n], dtype=TIPO_CONDICION, validate=False)
+        else:
+            valores = arreglo[:n]
+        datos[col] = pd.Series(valores, index=indice, dtype=valores.dtype, copy=False)
+    return pd.DataFrame(datos, copy=False)
+
+
+def _agregar_al_final(nuevos):
+    """Escribe las filas nuevas a continuación de las existentes (duplicando la capacidad si no entran)."""
+    arreglos = _estado['arreglos']
+    n, k = arreglos['filas'], len(nuevos)
+    if n + k > len(arreglos['ids']):
+        _reservar(_estado['df'], 2 * (n + k))
+        arreglos = _estado['arreglos']
+    arreglos['ids'][n:n + k] = nuevos.index.to_numpy(dtype=np.int64)
+    for col, arreglo in arreglos['columnas'].items():
+        if arreglo.dtype == np.int8:
+            arreglo[n:n + k] = nuevos[col].array.codes
+        else:
+            arreglo[n:n + k] = nuevos[col].to_numpy(dtype=object)
+    arreglos['filas'] = n + k
+    return _vista()
+
+
+def _recargar(config):
+    registros, marca = leer_registros_con_marca()
+    df = dataset_desde_registros(registros, config)
+    _estado.update({
+        'marca': marca,
+        'esquema': _esquema(config),
+        'por_serie': {},
+        'por_modelo_serie': {},
+    })
+    _indexar(df)
+    _estado['df'] = _reservar(df, 2 * len(df))
+
+
+def _aplicar_cambios(cambios, config):
+    df = _estado['df']
+    columnas, condiciones = config["COLUMNAS_FINALES"], config["CONDICIONES_INSPECCION"]
+    eliminados = [id_registro for id_registro, registro in cambios if registro is None]
+    vigentes = {id_registro: migrar_registro(registro, config) for id_registro, registro in cambios if registro is not None}
+
+    modificados = [i for i in vigentes if i in df.index]
+    salientes = [i for i in eliminados + modificados if i in df.index]
+    nuevos = _a_dataframe(list(vigentes.values()), columnas, condiciones) if vigentes else None
+    ultimo_id = df.index[-1] if len(df) else 0
+    # Lo habitual son altas con ids crecientes: van al final, sin copiar lo anterior
+    if not salientes and nuevos is not None and nuevos.index.is_monotonic_increasing and nuevos.index[0] > ultimo_id:
+        _indexar(nuevos)
+        _estado['df'] = _agregar_al_final(nuevos)
+        return
+
+    if salientes:
+        _desindexar(df.loc[salientes])
+        df = df.drop(index=salientes)
+    if nuevos is not None:
+        _indexar(nuevos)
+        df = pd.concat([df, nuevos]).sort_index()
+    _estado['df'] = _reservar(df, 2 * len(df))
+
+
+def obtener_dataset(config):
+    """
+    Devuelve (df, marca): el dataset compartido al día con el almacén y la marca del último cambio incluido,
+    con las columnas de la configuración indicada. Si no hubo cambios, el costo es una sola consulta indexada,
+    sin importar el tamaño del historial.
+    """
+    with _lock:
+        if _estado['df'] is None or _estado['esquema'] != _esquema(config):
+            _recargar(config)
+        else:
+            cambios, marca = leer_cambios_desde(_estado['marca'])
+            if cambios is None:
+                _recargar(config)
+            elif cambios:
+                _aplicar_cambios(cambios, config)
+                _estado['marca'] = marca
+        return _estado['df'], _estado['marca']
+
+
+def buscar_por_serie(serie, modelo=None):
+    """Ids (ordenados) de los registros con esa SERIE, o con ese MODELO y SERIE, según el índice en memoria."""
+    with _lock:
+        if modelo is None:
+            ids = _estado['por_serie'].get(normalizar_clave(serie), ())
+        else:
+            ids = _estado['por_modelo_serie'].get((normalizar_clave(modelo), normalizar_clave(serie)), ())
+        return sorted(ids)
+
+
+def filtrar_dataset(df, modelo='', serie='', condicion=None, valor_condicion=None):
+    """Filtra por texto contenido en MODELO/SERIE (sin distinguir mayúsculas) y por el valor de una condición."""
+    mascara = pd.Series(True, index=df.index)
+    if modelo:
+        mascara &= df['MODELO'].astype(str).str.contains(modelo, case=False, regex=False)
+    if serie:
+        mascara &= df['SERIE'].astype(str).str.contains(serie, case=False, regex=False)
+    if condicion and valor_condicion and condicion in df.columns:
+        mascara &= df[condicion] == valor_condicion
+    return df[mascara]
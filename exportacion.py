@@ -0,0 +1,532 @@
+import os
+import re
+import json
+import hashlib
+import zipfile
+import tempfile
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.drawing.image import Image as OpenpyxlImage
+from openpyxl.utils import get_column_letter
+from openpyxl.styles import Alignment, PatternFill, Font
+from almacen_fotos import CARPETA_FOTOS, hash_desde_ruta
+from almacenamiento import traer_archivos
+from almacen_registros import fechas_alta
+from cache_disco import expulsar_antiguos
+from metricas import Acumulador, medir
+from miniaturas import programar_limite_cache
+from preparacion_imagenes import preparar_imagenes, es_ruta_valida
+
+# ----------------------------------------------------
+# MOTOR DE EXPORTACIÓN A EXCEL (STREAMING)
+# ----------------------------------------------------
+# El libro se escribe en modo write_only de openpyxl: encabezados, estilos,
+# filas e imágenes en una sola pasada hacia adelante, directo a un archivo en
+# disco. Las filas se vuelcan a medida que se añaden y las imágenes se guardan
+# en una carpeta temporal y se leen de a una durante wb.save, de modo que la
+# memoria no crece con el número de registros.
+CARPETA_EXPORTACIONES = 'exportaciones'
+
+# Caché de reportes terminados, indexada por el contenido de los registros y la configuración de columnas
+CARPETA_CACHE_EXPORTACIONES = os.path.join(CARPETA_EXPORTACIONES, 'cache')
+VERSION_EXPORTACION = 1
+TAMANO_MAXIMO_CACHE_EXPORTACIONES = 2 * 1024 * 1024 * 1024
+
+# --- Constantes de Formato para Excel ---
+ALTURA_ENCABEZADO_PT = 60
+ALTURA_FILA_DATOS_PT = 75
+ANCHO_COLUMNA_NORMAL_UNITS = 14
+ANCHO_COLUMNA_OBSERVACIONES_UNITS = 28
+IMAGEN_WIDTH = 150
+IMAGEN_HEIGHT = 150
+ALINEACION_CENTRO = Alignment(horizontal='center', vertical='center', wrap_text=True)
+RELLENO_VERDE_AZULADO = PatternFill(start_color='20B2AA', end_color='20B2AA', fill_type='solid')
+FUENTE_ENCABEZADO = Font(color='FFFFFF', bold=True)
+FUENTE_VINCULO = Font(color='0563C1', underline='single')
+
+
+def _celda(ws, valor, encabezado=False):
+    celda = WriteOnlyCell(ws, value=valor)
+    celda.alignment = ALINEACION_CENTRO
+    if encabezado:
+        celda.fill = RELLENO_VERDE_AZULADO
+        celda.font = FUENTE_ENCABEZADO
+    return celda
+
+
+def _valor_texto(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    return valor
+
+
+def escribir_reporte_excel(df, encabezados, columnas_imagen, ruta_salida, progreso=None):
+    """
+    Escribe el reporte (texto con formato + fotos incrustadas) en ruta_salida.
+    Devuelve la lista de avisos [(nivel, mensaje)] con nivel 'warning' o 'error'.
+    progreso(hechas, total) recibe el avance por imagen.
+    """
+    avisos = []
+    columnas_texto = [c for c in encabezados if c in df.columns]
+    columnas_foto = [c for c in columnas_imagen if c in df.columns]
+    # Las fases que se repiten por fila o por imagen se suman y se registran una vez por reporte
+    tiempos = Acumulador()
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+
+    # En write_only los anchos de columna deben definirse antes de la primera fila
+    for idx, col_name in enumerate(columnas_texto + columnas_foto, start=1):
+        col_letter = get_column_letter(idx)
+        if col_name == 'OBSERVACIONES':
+            ws.column_dimensions[col_letter].width = ANCHO_COLUMNA_OBSERVACIONES_UNITS
+        else:
+            ws.column_dimensions[col_letter].width = ANCHO_COLUMNA_NORMAL_UNITS
+
+    ws.row_dimensions[1].height = ALTURA_ENCABEZADO_PT
+    ws.append([_celda(ws, c, encabezado=True) for c in columnas_texto + columnas_foto])
+    ws.row_dimensions.pop(1, None)
+
+    filas_texto = df[columnas_texto].itertuples(index=False, name=None)
+    filas_escritas = 0
+
+    def escribir_filas_hasta(total):
+        nonlocal filas_escritas
+        with tiempos.medir('exportacion.filas_texto') as m:
+            m['conteo'] = max(0, total - filas_escritas)
+            while filas_escritas < total:
+                fila_excel = filas_escritas + 2
+                ws.row_dimensions[fila_excel].height = ALTURA_FILA_DATOS_PT
+                ws.append([_celda(ws, _valor_texto(v)) for v in next(filas_texto)])
+                # La dimensión ya quedó escrita en el flujo; se descarta para no acumularla
+                ws.row_dimensions.pop(fila_excel, None)
+                filas_escritas += 1
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_salida)), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(ruta_salida))) as carpeta_imagenes:
+        filas_rutas = df[columnas_foto].values.tolist()
+        preparadas = iter(preparar_imagenes(filas_rutas, IMAGEN_WIDTH, IMAGEN_HEIGHT, progreso=progreso, tiempos=tiempos))
+
+        n = 0
+        while True:
+            # Tiempo que el hilo del reporte pasa esperando imágenes del pool (o leyéndolas de la caché)
+            with tiempos.medir('exportacion.espera_imagenes'):
+                siguiente = next(preparadas, None)
+            if siguiente is None:
+                break
+            indice_fila, indice_columna, path_check, datos_imagen, error = siguiente
+            n += 1
+
+            # Las filas de texto se escriben a la par de las imágenes que llegan del pool
+            escribir_filas_hasta(indice_fila + 1)
+            columna_letra = get_column_letter(len(columnas_texto) + indice_columna + 1)
+
+            if error:
+                avisos.append(('warning', f"⚠️ Error al procesar imagen '{path_check}': {error}. Insertando sin rotación."))
+            if datos_imagen is None:
+                avisos.append(('error', f"❌ Error crítico al insertar imagen original: {error}"))
+                continue
+
+            try:
+                with tiempos.medir('exportacion.add_image') as m:
+                    # Los bytes se pasan a disco: openpyxl solo los vuelve a leer al guardar, de a uno
+                    ruta_imagen = os.path.join(carpeta_imagenes, f"{n}.img")
+                    with open(ruta_imagen, 'wb') as f:
+                        f.write(datos_imagen)
+                    img = OpenpyxlImage(ruta_imagen)
+                    img.width = IMAGEN_WIDTH
+                    img.height = IMAGEN_HEIGHT
+                    ws.add_image(img, f'{columna_letra}{indice_fila + 2}')
+                    m['bytes'] = len(datos_imagen)
+            except Exception as e:
+                avisos.append(('error', f"❌ Error crítico al insertar imagen '{path_check}': {e}"))
+
+        escribir_filas_hasta(len(df))
+        tiempos.registrar()
+        with medir('exportacion.wb_save') as m:
+            wb.save(ruta_salida)
+            m['bytes'] = os.path.getsize(ruta_salida)
+
+    return avisos
+
+
+def generar_reporte(df, encabezados, columnas_imagen, progreso=None):
+    """
+    Devuelve (ruta, avisos) del reporte Excel, reutilizando la caché de reportes si el contenido no cambió.
+    Un reporte con avisos no se guarda en caché, para reintentar las fotos fallidas la próxima vez.
+    """
+    # La clave y el reporte necesitan las fotos en disco
+    traer_fotos(df, columnas_imagen)
+    with medir('exportacion.clave') as m:
+        clave = clave_exportacion(df, encabezados, columnas_imagen)
+        m['conteo'] = len(df)
+    ruta_cache = exportacion_en_cache(clave)
+    if ruta_cache:
+        return ruta_cache, []
+
+    ruta_salida = nueva_ruta_exportacion()
+    try:
+        with medir('exportacion.total') as m:
+            m['conteo'] = len(df)
+            avisos = escribir_reporte_excel(df, encabezados, columnas_imagen, ruta_salida, progreso=progreso)
+            m['bytes'] = os.path.getsize(ruta_salida)
+    except Exception:
+        if os.path.exists(ruta_salida):
+            os.remove(ruta_salida)
+        raise
+    programar_limite_cache()
+
+    if avisos:
+        return ruta_salida, avisos
+    return guardar_exportacion_en_cache(ruta_salida, clave), avisos
+
+
+# ----------------------------------------------------
+# EXPORTACIÓN POR PARTES (VARIOS LIBROS EN UN ZIP)
+# ----------------------------------------------------
+# Para reportes muy grandes: los registros se dividen en partes (por cantidad
+# de filas, por mes de alta o por MODELO), cada parte es un libro con el mismo
+# formato que el reporte único y varias partes se generan a la vez. Cada libro
+# se añade al ZIP en cuanto termina y se borra, así que en disco solo conviven
+# el ZIP y las partes en proceso, y nada se acumula en memoria.
+CRITERIOS_PARTES = {
+    'FILAS': 'Por cantidad de filas',
+    'FECHA': 'Por mes de alta',
+    'MODELO': 'Por MODELO',
+}
+FILAS_POR_PARTE_POR_DEFECTO = 500
+PARTES_EN_PARALELO = int(os.environ.get('PARTES_EXPORTACION_EN_PARALELO', 2))
+
+
+def _nombre_seguro(texto):
+    return re.sub(r'[^0-9A-Za-z_-]+', '_', str(texto).strip()).strip('_') or 'SIN_VALOR'
+
+
+def dividir_en_partes(df, criterio='FILAS', filas_por_parte=FILAS_POR_PARTE_POR_DEFECTO):
+    """
+    Devuelve [(nombre_archivo, df_parte)] según el criterio. Un grupo (mes o MODELO) con más
+    filas que filas_por_parte se divide a su vez en varias partes.
+    """
+    if criterio not in CRITERIOS_PARTES:
+        raise ValueError(f"Criterio de división no soportado: {criterio}")
+    filas_por_parte = max(1, int(filas_por_parte))
+
+    if criterio == 'FECHA':
+        fechas = fechas_alta()
+        claves = pd.Series([str(fechas.get(i, ''))[:7] or 'SIN_FECHA' for i in df.index], index=df.index)
+        grupos = [(f"Mes_{mes}", df[claves == mes]) for mes in sorted(claves.unique())]
+    elif criterio == 'MODELO':
+        claves = df['MODELO'].astype(str).str.strip().str.upper()
+        grupos = [(f"Modelo_{_nombre_seguro(modelo)}", df[claves == modelo]) for modelo in sorted(claves.unique())]
+    else:
+        grupos = [("Parte", df)]
+
+    partes = []
+    for prefijo, df_grupo in grupos:
+        trozos = range(0, len(df_grupo), filas_por_parte)
+        for n, inicio in enumerate(trozos, start=1):
+            sufijo = f"_{n:03d}" if len(trozos) > 1 or criterio == 'FILAS' else ''
+            partes.append((f"{prefijo}{sufijo}.xlsx", df_grupo.iloc[inicio:inicio + filas_por_parte]))
+    return partes
+
+
+def _contar_fotos(df, columnas_imagen):
+    columnas_foto = [c for c in columnas_imagen if c in df.columns]
+    return sum(1 for rutas in df[columnas_foto].itertuples(index=False, name=None) for r in rutas if es_ruta_valida(r))
+
+
+def escribir_reporte_zip(partes, encabezados, columnas_imagen, ruta_salida, progreso=None, en_paralelo=None):
+    """
+    Escribe cada parte como un libro Excel y las va añadiendo a un ZIP en ruta_salida a medida que terminan.
+    Devuelve la lista de avisos, con el nombre de la parte al inicio de cada mensaje.
+    progreso(hechas, total) recibe el avance sumado de todas las partes.
+    """
+    en_paralelo = en_paralelo or PARTES_EN_PARALELO
+    avisos = []
+    lock = threading.Lock()
+    hechas_por_parte = [0] * len(partes)
+    totales_por_parte = [_contar_fotos(df_parte, columnas_imagen) for _, df_parte in partes]
+
+    def progreso_parte(indice):
+        def informar(hechas, total):
+            if progreso is None:
+                return
+            with lock:
+                hechas_por_parte[indice] = hechas
+                totales_por_parte[indice] = total
+                progreso(sum(hechas_por_parte), sum(totales_por_parte))
+        return informar
+
+    carpeta = os.path.dirname(os.path.abspath(ruta_salida))
+    os.makedirs(carpeta, exist_ok=True)
+    if progreso:
+        progreso(0, sum(totales_por_parte))
+
+    with tempfile.TemporaryDirectory(dir=carpeta) as carpeta_partes, \
+            ThreadPoolExecutor(max_workers=en_paralelo, thread_name_prefix='exportacion-parte') as executor, \
+            zipfile.ZipFile(ruta_salida, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        futuros = {}
+        for indice, (nombre, df_parte) in enumerate(partes):
+            ruta_parte = os.path.join(carpeta_partes, f"{indice}.xlsx")
+            futuro = executor.submit(escribir_reporte_excel, df_parte, encabezados, columnas_imagen, ruta_parte, progreso_parte(indice))
+            futuros[futuro] = (nombre, ruta_parte)
+
+        try:
+            for futuro in as_completed(futuros):
+                nombre, ruta_parte = futuros[futuro]
+                # El xlsx ya viene comprimido: se guarda tal cual dentro del ZIP
+                for nivel, mensaje in futuro.result():
+                    avisos.append((nivel, f"[{nombre}] {mensaje}"))
+                zf.write(ruta_parte, arcname=nombre)
+                os.remove(ruta_parte)
+        except Exception:
+            for pendiente in futuros:
+                pendiente.cancel()
+            raise
+
+    return avisos
+
+
+def generar_reporte_zip(df, encabezados, columnas_imagen, criterio='FILAS', filas_por_parte=FILAS_POR_PARTE_POR_DEFECTO, progreso=None):
+    """Devuelve (ruta, avisos) del ZIP con el reporte dividido en partes, reutilizando la caché de reportes."""
+    partes = dividir_en_partes(df, criterio, filas_por_parte)
+    division = [[nombre, [int(i) for i in df_parte.index]] for nombre, df_parte in partes]
+    traer_fotos(df, columnas_imagen)
+    clave = clave_exportacion(df, encabezados, columnas_imagen, sufijo='.zip', extra=division)
+    ruta_cache = exportacion_en_cache(clave, sufijo='.zip')
+    if ruta_cache:
+        return ruta_cache, []
+
+    ruta_salida = nueva_ruta_exportacion(sufijo='.zip')
+    try:
+        with medir('exportacion_zip.total') as m:
+            m['conteo'] = len(df)
+            avisos = escribir_reporte_zip(partes, encabezados, columnas_imagen, ruta_salida, progreso=progreso)
+            m['bytes'] = os.path.getsize(ruta_salida)
+    except Exception:
+        if os.path.exists(ruta_salida):
+            os.remove(ruta_salida)
+        raise
+    programar_limite_cache()
+
+    if avisos:
+        return ruta_salida, avisos
+    return guardar_exportacion_en_cache(ruta_salida, clave, sufijo='.zip'), avisos
+
+
+# ----------------------------------------------------
+# EXPORTACIÓN CON FOTOS VINCULADAS (XLSX LIVIANO + FOTOS + PARQUET)
+# ----------------------------------------------------
+# Para el intercambio diario: un ZIP con el libro de texto (las celdas de foto
+# son vínculos relativos a fotos/), las fotos copiadas tal cual, sin
+# decodificarlas ni re-codificarlas, y el dataset completo en Parquet para
+# análisis. El costo es básicamente copiar bytes.
+SUFIJO_VINCULADO = '.vinculado.zip'
+NOMBRE_LIBRO_VINCULADO = 'Reporte.xlsx'
+NOMBRE_PARQUET_VINCULADO = 'datos.parquet'
+CARPETA_FOTOS_VINCULADAS = 'fotos'
+
+
+def _nombres_en_archivo(df, columnas_foto):
+    """Devuelve {ruta_en_disco: ruta_relativa_en_el_zip} para cada foto válida, sin repetir nombres."""
+    nombres = {}
+    usados = set()
+    for rutas in df[columnas_foto].itertuples(index=False, name=None):
+        for ruta in rutas:
+            if not es_ruta_valida(ruta):
+                continue
+            ruta = str(ruta).strip()
+            if ruta in nombres:
+                continue
+            base, extension = os.path.splitext(os.path.basename(ruta))
+            nombre, n = f"{base}{extension}", 1
+            while nombre in usados:
+                n += 1
+                nombre = f"{base}_{n}{extension}"
+            usados.add(nombre)
+            nombres[ruta] = f"{CARPETA_FOTOS_VINCULADAS}/{nombre}"
+    return nombres
+
+
+def _escribir_libro_vinculado(df, columnas_texto, columnas_foto, nombres, ruta_salida):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for idx, col_name in enumerate(columnas_texto + columnas_foto, start=1):
+        ancho = ANCHO_COLUMNA_OBSERVACIONES_UNITS if col_name == 'OBSERVACIONES' else ANCHO_COLUMNA_NORMAL_UNITS
+        ws.column_dimensions[get_column_letter(idx)].width = ancho
+
+    ws.row_dimensions[1].height = ALTURA_ENCABEZADO_PT
+    ws.append([_celda(ws, c, encabezado=True) for c in columnas_texto + columnas_foto])
+    ws.row_dimensions.pop(1, None)
+
+    for textos, rutas in zip(df[columnas_texto].itertuples(index=False, name=None), df[columnas_foto].itertuples(index=False, name=None)):
+        fila = [_celda(ws, _valor_texto(v)) for v in textos]
+        for ruta in rutas:
+            destino = nombres.get(str(ruta).strip()) if es_ruta_valida(ruta) else None
+            celda = _celda(ws, "Ver foto" if destino else None)
+            if destino:
+                celda.hyperlink = destino
+                celda.font = FUENTE_VINCULO
+            fila.append(celda)
+        ws.append(fila)
+    wb.save(ruta_salida)
+
+
+def _escribir_parquet(df, columnas_foto, nombres, ruta_salida):
+    """Dataset completo (con el id de cada registro) y las fotos como rutas relativas dentro del ZIP."""
+    datos = df.reset_index()
+    for col in columnas_foto:
+        datos[col] = [nombres.get(str(r).strip()) if es_ruta_valida(r) else None for r in datos[col]]
+    datos.to_parquet(ruta_salida, index=False, compression='zstd')
+
+
+def escribir_reporte_vinculado(df, encabezados, columnas_imagen, ruta_salida, progreso=None):
+    """
+    Escribe en ruta_salida un ZIP con el libro de texto (fotos como vínculos relativos), las fotos
+    sin re-codificar y el dataset en Parquet. Devuelve la lista de avisos; progreso(hechas, total) por foto.
+    """
+    avisos = []
+    columnas_texto = [c for c in encabezados if c in df.columns]
+    columnas_foto = [c for c in columnas_imagen if c in df.columns]
+    nombres = _nombres_en_archivo(df, columnas_foto)
+    if progreso:
+        progreso(0, len(nombres))
+
+    carpeta = os.path.dirname(os.path.abspath(ruta_salida))
+    os.makedirs(carpeta, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=carpeta) as carpeta_tmp, \
+            zipfile.ZipFile(ruta_salida, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        ruta_libro = os.path.join(carpeta_tmp, NOMBRE_LIBRO_VINCULADO)
+        with medir('exportacion_vinculada.libro') as m:
+            _escribir_libro_vinculado(df, columnas_texto, columnas_foto, nombres, ruta_libro)
+            m['conteo'] = len(df)
+        # El xlsx y las fotos ya vienen comprimidos: se guardan tal cual
+        zf.write(ruta_libro, arcname=NOMBRE_LIBRO_VINCULADO, compress_type=zipfile.ZIP_STORED)
+
+        try:
+            ruta_parquet = os.path.join(carpeta_tmp, NOMBRE_PARQUET_VINCULADO)
+            with medir('exportacion_vinculada.parquet'):
+                _escribir_parquet(df, columnas_foto, nombres, ruta_parquet)
+            zf.write(ruta_parquet, arcname=NOMBRE_PARQUET_VINCULADO, compress_type=zipfile.ZIP_STORED)
+        except ImportError:
+            avisos.append(('warning', "⚠️ No se incluyó el archivo Parquet: falta instalar 'pyarrow'."))
+
+        with medir('exportacion_vinculada.fotos') as m:
+            for hechas, (ruta, destino) in enumerate(nombres.items(), start=1):
+                try:
+                    zf.write(ruta, arcname=destino, compress_type=zipfile.ZIP_STORED)
+                    m['bytes'] += os.path.getsize(ruta)
+                except OSError as e:
+                    avisos.append(('error', f"❌ No se pudo copiar la foto '{ruta}': {e}"))
+                if progreso:
+                    progreso(hechas, len(nombres))
+            m['conteo'] = len(nombres)
+
+    return avisos
+
+
+def generar_reporte_vinculado(df, encabezados, columnas_imagen, progreso=None):
+    """Devuelve (ruta, avisos) del ZIP con fotos vinculadas, reutilizando la caché de reportes."""
+    traer_fotos(df, columnas_imagen)
+    clave = clave_exportacion(df, encabezados, columnas_imagen, sufijo=SUFIJO_VINCULADO, extra=[int(i) for i in df.index])
+    ruta_cache = exportacion_en_cache(clave, sufijo=SUFIJO_VINCULADO)
+    if ruta_cache:
+        return ruta_cache, []
+
+    ruta_salida = nueva_ruta_exportacion(sufijo=SUFIJO_VINCULADO)
+    try:
+        with medir('exportacion_vinculada.total') as m:
+            m['conteo'] = len(df)
+            avisos = escribir_reporte_vinculado(df, encabezados, columnas_imagen, ruta_salida, progreso=progreso)
+            m['bytes'] = os.path.getsize(ruta_salida)
+    except Exception:
+        if os.path.exists(ruta_salida):
+            os.remove(ruta_salida)
+        raise
+
+    if avisos:
+        return ruta_salida, avisos
+    return guardar_exportacion_en_cache(ruta_salida, clave, sufijo=SUFIJO_VINCULADO), avisos
+
+
+def nueva_ruta_exportacion(sufijo='.xlsx'):
+    """Reserva un archivo nuevo dentro de la carpeta de exportaciones y devuelve su ruta."""
+    os.makedirs(CARPETA_EXPORTACIONES, exist_ok=True)
+    fd, ruta = tempfile.mkstemp(suffix=sufijo, dir=CARPETA_EXPORTACIONES)
+    os.close(fd)
+    return ruta
+
+
+# ----------------------------------------------------
+# CACHÉ DE REPORTES GENERADOS
+# ----------------------------------------------------
+
+def traer_fotos(df, columnas_imagen):
+    """Con almacenamiento remoto, descarga en paralelo a la caché local las fotos del reporte que falten."""
+    columnas_foto = [c for c in columnas_imagen if c in df.columns]
+    rutas = {
+        str(r).strip() for rutas in df[columnas_foto].itertuples(index=False, name=None) for r in rutas
+        if str(r).strip().startswith(CARPETA_FOTOS + os.sep)
+    }
+    traer_archivos(rutas)
+
+
+def _firma_foto(ruta):
+    """Identidad de una foto para la clave del reporte: su hash si está en el nombre, o ruta, tamaño y fecha de modificación."""
+    if not es_ruta_valida(ruta):
+        return None
+    ruta = str(ruta).strip()
+    if hash_desde_ruta(ruta):
+        return ruta
+    info = os.stat(ruta)
+    return [ruta, info.st_size, info.st_mtime_ns]
+
+
+def clave_exportacion(df, encabezados, columnas_imagen, sufijo='.xlsx', extra=None):
+    """
+    Clave (SHA-256) del reporte: depende de las columnas configuradas, del texto de cada registro y de sus fotos.
+    extra permite incluir en la clave otros datos que cambian el resultado (ej. la división en partes).
+    """
+    columnas_texto = [c for c in encabezados if c in df.columns]
+    columnas_foto = [c for c in columnas_imagen if c in df.columns]
+
+    h = hashlib.sha256()
+    h.update(json.dumps([VERSION_EXPORTACION, sufijo, IMAGEN_WIDTH, IMAGEN_HEIGHT, columnas_texto, columnas_foto, extra], ensure_ascii=False).encode('utf-8'))
+    for textos, rutas in zip(df[columnas_texto].itertuples(index=False, name=None), df[columnas_foto].itertuples(index=False, name=None)):
+        fila = [[_valor_texto(v) for v in textos], [_firma_foto(r) for r in rutas]]
+        h.update(json.dumps(fila, ensure_ascii=False, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+def ruta_exportacion_cache(clave, sufijo='.xlsx'):
+    return os.path.join(CARPETA_CACHE_EXPORTACIONES, f"{clave}{sufijo}")
+
+
+def exportacion_en_cache(clave, sufijo='.xlsx'):
+    """Ruta del reporte ya generado para esa clave (y lo marca como usado), o None."""
+    ruta = ruta_exportacion_cache(clave, sufijo)
+    if not os.path.exists(ruta):
+        return None
+    os.utime(ruta)
+    return ruta
+
+
+def guardar_exportacion_en_cache(ruta_generada, clave, sufijo='.xlsx'):
+    """Mueve un reporte recién generado a la caché y devuelve su ruta definitiva."""
+    os.makedirs(CARPETA_CACHE_EXPORTACIONES, exist_ok=True)
+    ruta = ruta_exportacion_cache(clave, sufijo)
+    os.replace(ruta_generada, ruta)
+    aplicar_limite_cache_exportaciones(excepto=ruta)
+    return ruta
+
+
+def es_exportacion_en_cache(ruta):
+    return os.path.dirname(os.path.abspath(ruta)) == os.path.abspath(CARPETA_CACHE_EXPORTACIONES)
+
+
+def aplicar_limite_cache_exportaciones(tamano_maximo=TAMANO_MAXIMO_CACHE_EXPORTACIONES, excepto=None):
+    """Elimina los reportes en caché usados hace más tiempo hasta respetar el límite de tamaño."""
+    expulsar_antiguos(CARPETA_CACHE_EXPORTACIONES, tamano_maximo, excepto=excepto)
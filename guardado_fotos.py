@@ -0,0 +1,54 @@
+from almacen_fotos import guardar_foto
+from normalizacion_fotos import normalizar_foto
+from miniaturas import guardar_miniatura, recordar_hash
+from exportacion import IMAGEN_WIDTH, IMAGEN_HEIGHT
+from metricas import medir_en
+
+# ----------------------------------------------------
+# GUARDADO DE UNA FOTO SUBIDA
+# ----------------------------------------------------
+# Camino único para toda foto que entra a la aplicación (formulario o
+# importación masiva): normalización según la configuración, almacén
+# direccionado por contenido y miniatura para el Excel, generada una sola vez.
+
+# Las fotos originales (si se conservan) se guardan en el registro bajo "<COLUMNA> [ORIGINAL]"
+SUFIJO_ORIGINAL = '[ORIGINAL]'
+
+
+def guardar_foto_subida(datos, extension, ajustes, nombre='', tiempos=None):
+    """
+    Normaliza y guarda una foto y genera su miniatura. Devuelve (ruta, ruta_original, avisos):
+    ruta_original solo si se conserva el original y la normalización lo cambió; avisos son mensajes
+    de fallos no fatales (la foto se guarda igual). tiempos es un metricas.Acumulador opcional.
+    """
+    avisos = []
+    datos_foto = datos
+    extension_foto = extension
+
+    # Normalización única: orientación, tamaño máximo y re-compresión según la configuración
+    if ajustes["ACTIVO"]:
+        try:
+            with medir_en(tiempos, 'guardado.normalizacion') as m:
+                m['bytes'] = len(datos)
+                datos_foto, extension_normalizada = normalizar_foto(datos, ajustes)
+            extension_foto = extension_normalizada or extension
+        except Exception as e:
+            avisos.append(f"⚠️ No se pudo normalizar la foto '{nombre}': {e}. Se guarda tal como se subió.")
+
+    ruta_original = None
+    with medir_en(tiempos, 'guardado.almacen_fotos') as m:
+        m['bytes'] = len(datos_foto)
+        ruta, hash_foto = guardar_foto(datos_foto, extension_foto)
+        if ajustes["CONSERVAR_ORIGINAL"] and datos_foto is not datos:
+            ruta_original = guardar_foto(datos, extension)[0]
+            m['bytes'] += len(datos)
+
+    # Miniatura para el Excel generada una sola vez, al subir la foto
+    try:
+        with medir_en(tiempos, 'guardado.miniatura'):
+            recordar_hash(ruta, hash_foto)
+            guardar_miniatura(datos_foto, IMAGEN_WIDTH, IMAGEN_HEIGHT, hash_original=hash_foto)
+    except Exception as e:
+        avisos.append(f"⚠️ No se pudo generar la miniatura de '{nombre}': {e}. Se generará al exportar.")
+
+    return ruta, ruta_original, avisos
@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from almacen_registros import ids_por_serie, insertar_registros, normalizar_clave
+from configuracion import CAMPO_VERSION_ESQUEMA
+from guardado_fotos import SUFIJO_ORIGINAL, guardar_foto_subida
+from metricas import medir
+from miniaturas import programar_limite_cache
+from preparacion_imagenes import PROCESOS_PREPARACION
+
+# ----------------------------------------------------
+# IMPORTACIÓN MASIVA (ZIP DE FOTOS + MANIFIESTO)
+# ----------------------------------------------------
+# Cada fila del manifiesto (CSV o Excel con MODELO, SERIE, condiciones y
+# OBSERVACIONES) es una unidad. Sus fotos se buscan en el ZIP por convención
+# de nombres y pasan por el mismo guardado que el formulario (normalización,
+# almacén por contenido y miniatura) en un pool de hilos: Pillow y hashlib
+# liberan el GIL en el trabajo pesado. Los registros se confirman en lotes,
+# de modo que un corte a mitad de la carga conserva los lotes ya guardados.
+#
+# La importación corre como trabajo en segundo plano (ver trabajos_exportacion):
+# el ZIP subido se copia a CARPETA_IMPORTACIONES para no depender de la sesión
+# y el informe por fila queda allí en JSON, así que recargar la página o perder
+# la conexión no la interrumpe.
+LOTE_IMPORTACION = int(os.environ.get('LOTE_IMPORTACION', 200))
+HILOS_IMPORTACION = int(os.environ.get('HILOS_IMPORTACION', 0)) or PROCESOS_PREPARACION
+EXTENSIONES_FOTO = {'.jpg', '.jpeg', '.png', '.webp'}
+# Tamaño máximo del ZIP de fotos por importación. Streamlit mantiene el archivo subido en memoria
+# mientras dura la sesión: el límite acota esa memoria; cargas mayores se dividen en varios ZIP
+TAMANO_MAXIMO_ZIP_MB = int(os.environ.get('TAMANO_MAXIMO_ZIP_IMPORTACION_MB', 500))
+CARPETA_IMPORTACIONES = 'importaciones'
+RETENCION_ARCHIVOS_IMPORTACION_S = 24 * 3600
+VALORES_SI = {'SI', 'S', 'X', '1', 'TRUE', 'VERDADERO', 'YES', 'Y'}
+
+ESTADO_IMPORTADO = 'IMPORTADO'
+ESTADO_OMITIDO = 'OMITIDO'
+ESTADO_ERROR = 'ERROR'
+
+
+def clave_nombre(texto):
+    """Forma comparable de un nombre de archivo, SERIE o columna: sin acentos, en mayúsculas y con '_' como separador."""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^0-9A-Z]+', '_', texto.upper()).strip('_')
+
+
+def _es_si(valor):
+    return clave_nombre(valor) in VALORES_SI
+
+
+def leer_manifiesto(archivo, nombre_archivo):
+    """Lee el manifiesto (CSV con cualquier separador, o Excel .xlsx) con todas las celdas como texto."""
+    if nombre_archivo.lower().endswith('.xlsx'):
+        df = pd.read_excel(archivo, dtype=str)
+    else:
+        df = pd.read_csv(archivo, dtype=str, sep=None, engine='python', encoding='utf-8-sig')
+    df.columns = [str(c).strip().upper() for c in df.columns]
+    return df.fillna('')
+
+
+def _fichas_columna(columnas_imagen):
+    """Variantes con que se puede nombrar cada columna de foto en un archivo: su nombre, '3' y '03'."""
+    fichas = {}
+    for numero, columna in enumerate(columnas_imagen, start=1):
+        for ficha in (clave_nombre(columna), str(numero), f"{numero:02d}"):
+            fichas.setdefault(ficha, columna)
+    # Las más largas primero, para que 'FOTO_DE_SERIE' no se confunda con un sufijo numérico
+    return sorted(fichas.items(), key=lambda f: -len(f[0]))
+
+
+def indexar_fotos_zip(nombres_zip, columnas_imagen):
+    """
+    Asocia los archivos del ZIP a (SERIE, columna) según la convención de nombres:
+    '<SERIE>/<COLUMNA>.jpg' o '<SERIE>_<COLUMNA>.jpg', donde COLUMNA es el nombre de la
+    columna de foto (sin importar acentos, mayúsculas ni separadores) o su número (1, 01...).
+    Devuelve ({(clave_serie, columna): nombre_en_zip}, {clave_nombre_archivo: nombre_en_zip}).
+    """
+    fichas = _fichas_columna(columnas_imagen)
+    por_serie = {}
+    por_nombre = {}
+    for nombre in nombres_zip:
+        raiz, extension = os.path.splitext(nombre)
+        if extension.lower() not in EXTENSIONES_FOTO or os.path.basename(nombre).startswith('.'):
+            continue
+        por_nombre.setdefault(clave_nombre(os.path.basename(nombre)), nombre)
+        partes = [p for p in raiz.replace('\\', '/').split('/') if p]
+        base = clave_nombre(partes[-1])
+
+        if len(partes) >= 2:
+            columna = dict(fichas).get(base)
+            if columna:
+                por_serie.setdefault((clave_nombre(partes[-2]), columna), nombre)
+                continue
+        for ficha, columna in fichas:
+            if base.endswith(f"_{ficha}") and len(base) > len(ficha) + 1:
+                por_serie.setdefault((base[:-len(ficha) - 1], columna), nombre)
+                break
+    return por_serie, por_nombre
+
+
+def _fotos_de_fila(fila, columnas_imagen, por_serie, por_nombre):
+    """{columna: nombre_en_zip} de una fila: primero el archivo indicado en el manifiesto, si no la convención."""
+    clave_serie = clave_nombre(fila['SERIE'])
+    fotos, faltantes = {}, []
+    for columna in columnas_imagen:
+        indicado = str(fila.get(columna.upper(), '')).strip()
+        if indicado:
+            nombre = por_nombre.get(clave_nombre(os.path.basename(indicado)))
+            if nombre:
+                fotos[columna] = nombre
+            else:
+                faltantes.append(indicado)
+        elif (clave_serie, columna) in por_serie:
+            fotos[columna] = por_serie[(clave_serie, columna)]
+    return fotos, faltantes
+
+
+def importar(manifiesto, zf, config, progreso=None, lote=LOTE_IMPORTACION, hilos=HILOS_IMPORTACION):
+    """
+    Importa las filas del manifiesto con sus fotos del ZIP (zipfile.ZipFile abierto, o None) y devuelve el
+    informe: una lista de dicts por fila con FILA, MODELO, SERIE, ESTADO, FOTOS y DETALLE.
+    progreso(filas_procesadas, total) se llama tras cada lote.
+    """
+    columnas_imagen = config["COLUMNAS_IMAGEN"]
+    bloquear = config["DUPLICADOS_SERIE"] == 'BLOQUEAR'
+    por_serie, por_nombre = indexar_fotos_zip(zf.namelist() if zf is not None else [], columnas_imagen)
+
+    informe = []
+    validas = []
+    series_vistas = set()
+    for indice, fila in manifiesto.iterrows():
+        # Número de fila como se ve en Excel (con el encabezado en la fila 1)
+        entrada = {'FILA': int(indice) + 2, 'MODELO': fila.get('MODELO', '').strip(), 'SERIE': fila.get('SERIE', '').strip(), 'ESTADO': ESTADO_ERROR, 'FOTOS': 0, 'DETALLE': ''}
+        informe.append(entrada)
+        if not entrada['MODELO'] or not entrada['SERIE']:
+            entrada['DETALLE'] = "Faltan MODELO o SERIE."
+            continue
+        clave = normalizar_clave(entrada['SERIE'])
+        if clave in series_vistas:
+            entrada['DETALLE'] = "SERIE repetida dentro del manifiesto."
+            continue
+        series_vistas.add(clave)
+        existentes = ids_por_serie(entrada['SERIE'])
+        if existentes and bloquear:
+            entrada['ESTADO'] = ESTADO_OMITIDO
+            entrada['DETALLE'] = f"La SERIE ya fue inspeccionada (registro #{existentes[0]})."
+            continue
+        fotos, faltantes = _fotos_de_fila(fila, columnas_imagen, por_serie, por_nombre)
+        avisos = [f"No está en el ZIP: {f}" for f in faltantes]
+        if existentes:
+            avisos.append(f"La SERIE ya había sido inspeccionada (registro #{existentes[0]}).")
+        validas.append((entrada, fila, fotos, avisos))
+
+    hechas = len(informe) - len(validas)
+    if progreso:
+        progreso(hechas, len(informe))
+
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='importacion') as executor:
+        for inicio in range(0, len(validas), lote):
+            with medir('importacion.lote') as m:
+                m['conteo'] = _importar_lote(validas[inicio:inicio + lote], zf, config, bloquear, executor, hilos)
+            hechas += len(validas[inicio:inicio + lote])
+            if progreso:
+                progreso(hechas, len(informe))
+
+    programar_limite_cache()
+    return informe
+
+
+def _nueva_ruta(sufijo):
+    os.makedirs(CARPETA_IMPORTACIONES, exist_ok=True)
+    fd, ruta = tempfile.mkstemp(suffix=sufijo, dir=CARPETA_IMPORTACIONES)
+    os.close(fd)
+    return ruta
+
+
+def _purgar_archivos():
+    """Borra ZIPs e informes de importaciones viejas (de trabajos que ya no se van a consultar)."""
+    ahora = time.time()
+    for nombre in os.listdir(CARPETA_IMPORTACIONES):
+        ruta = os.path.join(CARPETA_IMPORTACIONES, nombre)
+        try:
+            if ahora - os.path.getmtime(ruta) > RETENCION_ARCHIVOS_IMPORTACION_S:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+
+def guardar_zip(archivo):
+    """
+    Copia a disco el ZIP de fotos subido (o cualquier archivo abierto) y devuelve su ruta, para que la
+    importación no dependa de la sesión. Lanza zipfile.BadZipFile si no es un ZIP válido.
+    """
+    ruta = _nueva_ruta('.zip')
+    _purgar_archivos()
+    try:
+        archivo.seek(0)
+        with open(ruta, 'wb') as f:
+            shutil.copyfileobj(archivo, f, 1024 * 1024)
+        if not zipfile.is_zipfile(ruta):
+            raise zipfile.BadZipFile("el archivo no tiene el formato ZIP")
+    except Exception:
+        os.remove(ruta)
+        raise
+    return ruta
+
+
+def importar_zip(manifiesto, ruta_zip, config, progreso=None):
+    """
+    Importa el manifiesto con las fotos del ZIP guardado con guardar_zip (o sin fotos si ruta_zip es None).
+    El ZIP se borra al terminar, haya funcionado o no. Devuelve la ruta del informe (lista de filas en JSON).
+    """
+    try:
+        if ruta_zip is None:
+            informe = importar(manifiesto, None, config, progreso=progreso)
+        else:
+            with zipfile.ZipFile(ruta_zip) as zf:
+                informe = importar(manifiesto, zf, config, progreso=progreso)
+    finally:
+        if ruta_zip is not None and os.path.exists(ruta_zip):
+            os.remove(ruta_zip)
+
+    ruta_informe = _nueva_ruta('.json')
+    with open(ruta_informe, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, ensure_ascii=False)
+    return ruta_informe
+
+
+def leer_informe(ruta_informe):
+    """Informe por fila de una importación terminada."""
+    with open(ruta_informe, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _importar_lote(filas, zf, config, bloquear, executor, hilos):
+    """Guarda las fotos de un lote en paralelo e inserta sus registros en una sola transacción. Devuelve las fotos procesadas."""
+    ajustes = config["PROCESAMIENTO_FOTOS"]
+    tareas = [(n, columna, nombre) for n, (_, _, fotos, _) in enumerate(filas) for columna, nombre in fotos.items()]
+    resultados = [{} for _ in filas]
+
+    # El ZIP se lee en este hilo (zipfile no admite lecturas concurrentes); los hilos solo reciben bytes.
+    # La ventana acota cuántas fotos leídas esperan en memoria.
+    pendientes = deque()
+    siguiente = 0
+    while siguiente < len(tareas) or pendientes:
+        while siguiente < len(tareas) and len(pendientes) < hilos * 2:
+            n, columna, nombre = tareas[siguiente]
+            try:
+                datos = zf.read(nombre)
+                futuro = executor.submit(guardar_foto_subida, datos, os.path.splitext(nombre)[1].lstrip('.'), ajustes, nombre)
+            except Exception as e:
+                futuro = e
+            pendientes.append((n, columna, nombre, futuro))
+            siguiente += 1
+
+        n, columna, nombre, futuro = pendientes.popleft()
+        try:
+            if isinstance(futuro, Exception):
+                raise futuro
+            resultados[n][columna] = futuro.result()
+        except Exception as e:
+            filas[n][3].append(f"No se pudo guardar '{nombre}': {e}")
+
+    registros = []
+    for (entrada, fila, _, avisos), guardadas in zip(filas, resultados):
+        registro = {
+            'MODELO': entrada['MODELO'],
+            'SERIE': entrada['SERIE'],
+            'OBSERVACIONES': str(fila.get('OBSERVACIONES', '')).strip(),
+            **{c: 'SÍ' if _es_si(fila.get(c.upper(), '')) else 'NO' for c in config["CONDICIONES_INSPECCION"]},
+            CAMPO_VERSION_ESQUEMA: config["VERSION_ESQUEMA"],
+        }
+        for columna in config["COLUMNAS_IMAGEN"]:
+            ruta, ruta_original, avisos_foto = guardadas.get(columna, (None, None, []))
+            registro[columna] = ruta
+            if ruta_original:
+                registro[f"{columna} {SUFIJO_ORIGINAL}"] = ruta_original
+            avisos.extend(avisos_foto)
+        entrada['FOTOS'] = len(guardadas)
+        registros.append(registro)
+
+    try:
+        ids = insertar_registros(registros, bloquear_serie_duplicada=bloquear)
+    except Exception as e:
+        for entrada, _, _, avisos in filas:
+            entrada['DETALLE'] = "; ".join(avisos + [f"No se pudo guardar el lote: {e}"])
+        return len(tareas)
+
+    for (entrada, _, _, avisos), id_registro in zip(filas, ids):
+        if id_registro is None:
+            # Otra sesión guardó la misma SERIE mientras se procesaba el lote
+            entrada['ESTADO'] = ESTADO_OMITIDO
+            avisos.append("La SERIE fue registrada por otro inspector durante la importación.")
+        else:
+            entrada['ESTADO'] = ESTADO_IMPORTADO
+            avisos.insert(0, f"Registro #{id_registro}.")
+        entrada['DETALLE'] = " ".join(avisos)
+    return len(tareas)
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from logging.handlers import RotatingFileHandler
+
+# ----------------------------------------------------
+# MÉTRICAS DE RENDIMIENTO POR FASE
+# ----------------------------------------------------
+# Cada fase medida (ej. 'exportacion.wb_save') acumula en el proceso un
+# histograma de duraciones, los bytes procesados y el RSS máximo observado.
+# Cada observación se escribe además como una línea JSON en el log de
+# métricas. El resumen (p50/p95) se muestra en la página de administración y
+# el volcado en formato de texto de Prometheus puede descargarse desde allí o
+# escribirse en un archivo para el recolector de node_exporter. Ese archivo lo
+# reescribe un hilo de fondo, a lo sumo una vez por intervalo, para que medir
+# una fase no cueste una escritura en disco.
+ARCHIVO_LOG_METRICAS = os.environ.get('ARCHIVO_LOG_METRICAS', 'metricas.log')
+ARCHIVO_METRICAS_PROMETHEUS = os.environ.get('ARCHIVO_METRICAS_PROMETHEUS')
+INTERVALO_ESCRITURA_PROMETHEUS_S = float(os.environ.get('INTERVALO_METRICAS_PROMETHEUS_S', 15))
+TAMANO_MAXIMO_LOG_BYTES = 10 * 1024 * 1024
+COPIAS_LOG = 3
+PREFIJO_PROMETHEUS = 'inspeccion'
+LIMITES_DURACION_S = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_fases = {}
+_lock = threading.Lock()
+_log = None
+_escritura_pendiente = threading.Event()
+_hilo_escritura = None
+_hilo_escritura_lock = threading.Lock()
+
+
+def _logger():
+    global _log
+    if _log is None:
+        _log = logging.getLogger('metricas')
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+        try:
+            manejador = RotatingFileHandler(ARCHIVO_LOG_METRICAS, maxBytes=TAMANO_MAXIMO_LOG_BYTES, backupCount=COPIAS_LOG, encoding='utf-8')
+            manejador.setFormatter(logging.Formatter('%(message)s'))
+            _log.addHandler(manejador)
+        except OSError:
+            # Sin permiso de escritura las métricas siguen disponibles en memoria
+            _log.addHandler(logging.NullHandler())
+    return _log
+
+
+def rss_actual_bytes():
+    """Memoria residente actual del proceso (en Linux desde /proc; en otros sistemas, el pico)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == 'darwin' else pico * 1024
+
+
+def registrar(fase, duracion_s, bytes_procesados=0, conteo=1, rss_bytes=None):
+    """
+    Agrega una observación de la fase al histograma del proceso y la escribe en el log de métricas.
+    conteo indica cuántos elementos (ej. imágenes) abarca la observación.
+    """
+    rss_bytes = rss_bytes if rss_bytes is not None else rss_actual_bytes()
+    with _lock:
+        metrica = _fases.setdefault(fase, {
+            'observaciones': 0,
+            'suma_s': 0.0,
+            'maximo_s': 0.0,
+            'cubetas': [0] * (len(LIMITES_DURACION_S) + 1),
+            'bytes': 0,
+            'elementos': 0,
+            'rss_maximo_bytes': 0,
+        })
+        metrica['observaciones'] += 1
+        metrica['suma_s'] += duracion_s
+        metrica['maximo_s'] = max(metrica['maximo_s'], duracion_s)
+        metrica['cubetas'][_indice_cubeta(duracion_s)] += 1
+        metrica['bytes'] += bytes_procesados
+        metrica['elementos'] += conteo
+        metrica['rss_maximo_bytes'] = max(metrica['rss_maximo_bytes'], rss_bytes)
+
+    _logger().info(json.dumps({
+        'ts': round(time.time(), 3),
+        'pid': os.getpid(),
+        'fase': fase,
+        'duracion_s': round(duracion_s, 6),
+        'bytes': bytes_procesados,
+        'elementos': conteo,
+        'rss_bytes': rss_bytes,
+    }, ensure_ascii=False))
+
+    if ARCHIVO_METRICAS_PROMETHEUS:
+        _programar_escritura()
+
+
+def _bucle_escritura():
+    while True:
+        _escritura_pendiente.wait()
+        _escritura_pendiente.clear()
+        if ARCHIVO_METRICAS_PROMETHEUS:
+            escribir_prometheus(ARCHIVO_METRICAS_PROMETHEUS)
+        # Las observaciones que lleguen mientras tanto se escriben juntas en la próxima vuelta
+        time.sleep(INTERVALO_ESCRITURA_PROMETHEUS_S)
+
+
+def _programar_escritura():
+    """Pide al hilo de fondo que reescriba el archivo de Prometheus, sin esperarlo."""
+    global _hilo_escritura
+    with _hilo_escritura_lock:
+        if _hilo_escritura is None:
+            _hilo_escritura = threading.Thread(target=_bucle_escritura, name='metricas_prometheus', daemon=True)
+            _hilo_escritura.start()
+    _escritura_pendiente.set()
+
+
+def _indice_cubeta(duracion_s):
+    for indice, limite in enumerate(LIMITES_DURACION_S):
+        if duracion_s <= limite:
+            return indice
+    return len(LIMITES_DURACION_S)
+
+
+@contextmanager
+def medir(fase):
+    """
+    Mide la duración de un bloque y la registra como una observación de la fase.
+    El bloque puede informar sus bytes y elementos: with medir('fase') as m: m['bytes'] = n
+    También sirve como decorador de funciones.
+    """
+    datos = {'bytes': 0, 'conteo': 1}
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    finally:
+        registrar(fase, time.perf_counter() - inicio, datos['bytes'], datos['conteo'])
+
+
+class Acumulador:
+    """
+    Suma el tiempo de una fase que se repite muchas veces (ej. una por imagen) y la registra
+    como una sola observación al final, para no escribir una línea de log por elemento.
+    """
+
+    def __init__(self):
+        self.fases = {}
+
+    def sumar(self, fase, duracion_s, bytes_procesados=0, conteo=1):
+        total = self.fases.setdefault(fase, [0.0, 0, 0])
+        total[0] += duracion_s
+        total[1] += bytes_procesados
+        total[2] += conteo
+
+    @contextmanager
+    def medir(self, fase):
+        datos = {'bytes': 0, 'conteo': 1}
+        inicio = time.perf_counter()
+        try:
+            yield datos
+        finally:
+            self.sumar(fase, time.perf_counter() - inicio, datos['bytes'], datos['conteo'])
+
+    def registrar(self):
+        rss_bytes = rss_actual_bytes()
+        for fase, (duracion_s, bytes_procesados, conteo) in self.fases.items():
+            registrar(fase, duracion_s, bytes_procesados, conteo, rss_bytes)
+        self.fases = {}
+
+
+def medir_en(tiempos, fase):
+    """Mide el bloque en el Acumulador tiempos, o no mide nada si es None (mismo uso que medir)."""
+    return tiempos.medir(fase) if tiempos is not None else nullcontext({'bytes': 0, 'conteo': 1})
+
+
+def _percentil(metrica, cuantil):
+    """Percentil estimado desde el histograma (interpolando dentro de la cubeta)."""
+    total = metrica['observaciones']
+    if not total:
+        return None
+    objetivo = cuantil * total
+    acumulado = 0
+    for indice, cantidad in enumerate(metrica['cubetas']):
+        if cantidad and acumulado + cantidad >= objetivo:
+            inferior = LIMITES_DURACION_S[indice - 1] if indice > 0 else 0.0
+            superior = LIMITES_DURACION_S[indice] if indice < len(LIMITES_DURACION_S) else metrica['maximo_s']
+            return min(inferior + (superior - inferior) * (objetivo - acumulado) / cantidad, metrica['maximo_s'])
+        acumulado += cantidad
+    return metrica['maximo_s']
+
+
+def resumen():
+    """Lista de dicts por fase (ordenada por nombre) con conteo, p50, p95, máximo, bytes y RSS máximo."""
+    with _lock:
+        copia = {fase: dict(m, cubetas=list(m['cubetas'])) for fase, m in _fases.items()}
+    return [{
+        'fase': fase,
+        'observaciones': m['observaciones'],
+        'elementos': m['elementos'],
+        'p50_s': _percentil(m, 0.50),
+        'p95_s': _percentil(m, 0.95),
+        'maximo_s': m['maximo_s'],
+        'total_s': m['suma_s'],
+        'bytes': m['bytes'],
+        'rss_maximo_bytes': m['rss_maximo_bytes'],
+    } for fase, m in sorted(copia.items())]
+
+
+def reiniciar():
+    """Descarta las métricas acumuladas en el proceso."""
+    with _lock:
+        _fases.clear()
+
+
+def texto_prometheus():
+    """Volcado de las métricas del proceso en el formato de texto de Prometheus."""
+    with _lock:
+        copia = {fase: dict(m, cubetas=list(m['cubetas'])) for fase, m in _fases.items()}
+
+    p = PREFIJO_PROMETHEUS
+    lineas = [
+        f"# HELP {p}_fase_duracion_segundos Duración de cada fase instrumentada.",
+        f"# TYPE {p}_fase_duracion_segundos histogram",
+    ]
+    for fase, m in sorted(copia.items()):
+        acumulado = 0
+        for limite, cantidad in zip(list(LIMITES_DURACION_S) + ['+Inf'], m['cubetas']):
+            acumulado += cantidad
+            lineas.append(f'{p}_fase_duracion_segundos_bucket{{fase="{fase}",le="{limite}"}} {acumulado}')
+        lineas.append(f'{p}_fase_duracion_segundos_sum{{fase="{fase}"}} {m["suma_s"]:.6f}')
+        lineas.append(f'{p}_fase_duracion_segundos_count{{fase="{fase}"}} {m["observaciones"]}')
+
+    lineas += [f"# HELP {p}_fase_bytes_total Bytes procesados por cada fase.", f"# TYPE {p}_fase_bytes_total counter"]
+    lineas += [f'{p}_fase_bytes_total{{fase="{fase}"}} {m["bytes"]}' for fase, m in sorted(copia.items())]
+    lineas += [f"# HELP {p}_fase_elementos_total Elementos (ej. imágenes) procesados por cada fase.", f"# TYPE {p}_fase_elementos_total counter"]
+    lineas += [f'{p}_fase_elementos_total{{fase="{fase}"}} {m["elementos"]}' for fase, m in sorted(copia.items())]
+    lineas += [
+        f"# HELP {p}_proceso_rss_bytes Memoria residente actual del proceso.",
+        f"# TYPE {p}_proceso_rss_bytes gauge",
+        f"{p}_proceso_rss_bytes {rss_actual_bytes()}",
+    ]
+    return "\n".join(lineas) + "\n"
+
+
+def escribir_prometheus(ruta):
+    """Escribe el volcado de Prometheus en un archivo (reemplazo atómico, apto para el recolector de textfile)."""
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        with open(ruta_tmp, 'w', encoding='utf-8') as f:
+            f.write(texto_prometheus())
+        os.replace(ruta_tmp, ruta)
+    except OSError:
+        pass
@@ -0,0 +1,220 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image, ImageOps
+from almacen_fotos import hash_desde_ruta
+from cache_disco import archivos_en, expulsar_antiguos
+from metricas import medir_en
+from normalizacion_fotos import aplanar_a_rgb
+
+# ----------------------------------------------------
+# CACHÉ DE MINIATURAS PARA EL REPORTE EXCEL
+# ----------------------------------------------------
+# Las miniaturas se indexan por el contenido de la foto original (SHA-256) y por
+# los parámetros con que se generaron, de modo que una foto modificada o un
+# cambio de tamaño producen una clave nueva y la entrada vieja queda "obsoleta"
+# hasta que la expulsión por tamaño la elimina.
+CARPETA_MINIATURAS = 'cache_miniaturas'
+VERSION_MINIATURA = 1
+ESCALA_MINIATURA = 2  # Se generan al doble del tamaño mostrado para que no se vean borrosas
+CALIDAD_JPEG_MINIATURA = 80
+TAMANO_MAXIMO_CACHE_BYTES = 512 * 1024 * 1024
+TAMANO_BLOQUE_LECTURA = 1024 * 1024
+MAX_HASHES_MEMORIZADOS = 65536
+# La expulsión recorre toda la caché: la hace un hilo de fondo, a lo sumo una vez por intervalo,
+# para que guardar o exportar no pague un costo que crece con el historial
+INTERVALO_LIMITE_CACHE_S = 60
+
+_hashes_archivos = OrderedDict()
+_hashes_lock = threading.Lock()
+_limite_pendiente = threading.Event()
+_hilo_limite = None
+_hilo_limite_lock = threading.Lock()
+
+
+def hash_contenido(datos):
+    """Devuelve el SHA-256 (hex) de un bloque de bytes."""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _calcular_hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE_LECTURA), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _clave_archivo(ruta):
+    info = os.stat(ruta)
+    return (ruta, info.st_size, info.st_mtime_ns)
+
+
+def hash_archivo(ruta, calcular=True):
+    """
+    Devuelve el SHA-256 del archivo, memorizado en el proceso mientras no cambie su tamaño ni su fecha.
+    Con calcular=False solo consulta la memoria y devuelve None si el hash no se conoce todavía.
+    Las fotos direccionadas por contenido ya llevan el hash en el nombre y no se leen.
+    """
+    hash_nombre = hash_desde_ruta(ruta)
+    if hash_nombre:
+        return hash_nombre
+    clave = _clave_archivo(ruta)
+    with _hashes_lock:
+        if clave in _hashes_archivos:
+            _hashes_archivos.move_to_end(clave)
+            return _hashes_archivos[clave]
+    if not calcular:
+        return None
+    hash_original = _calcular_hash_archivo(ruta)
+    recordar_hash(ruta, hash_original, clave)
+    return hash_original
+
+
+def recordar_hash(ruta, hash_original, clave=None):
+    """Registra el hash ya conocido de un archivo (ej. calculado al subirlo o en otro proceso)."""
+    clave = clave or _clave_archivo(ruta)
+    with _hashes_lock:
+        _hashes_archivos[clave] = hash_original
+        _hashes_archivos.move_to_end(clave)
+        while len(_hashes_archivos) > MAX_HASHES_MEMORIZADOS:
+            _hashes_archivos.popitem(last=False)
+
+
+def ruta_miniatura(hash_original, ancho, alto):
+    """Ruta en caché de la miniatura de una foto (según su hash) para un tamaño dado."""
+    nombre = f"{hash_original}_{ancho}x{alto}_v{VERSION_MINIATURA}.jpg"
+    return os.path.join(CARPETA_MINIATURAS, hash_original[:2], nombre)
+
+
+def generar_miniatura(datos, ancho, alto, tiempos=None):
+    """
+    Decodifica la foto a escala reducida, corrige la orientación EXIF y la re-codifica como JPEG.
+    Si se pasa un metricas.Acumulador, suma en él el tiempo de cada etapa.
+    """
+    caja = (ancho * ESCALA_MINIATURA, alto * ESCALA_MINIATURA)
+
+    with Image.open(BytesIO(datos)) as img_pil:
+        with medir_en(tiempos, 'miniatura.decodificacion') as m:
+            # draft() permite que el decodificador JPEG trabaje directamente a 1/2, 1/4 u 1/8 de resolución
+            img_pil.draft('RGB', caja)
+            img_pil.load()
+            m['bytes'] = len(datos)
+        with medir_en(tiempos, 'miniatura.rotacion'):
+            img_pil = ImageOps.exif_transpose(img_pil)
+        with medir_en(tiempos, 'miniatura.escalado'):
+            img_pil.thumbnail(caja)
+            img_pil = aplanar_a_rgb(img_pil)
+
+        with medir_en(tiempos, 'miniatura.codificacion') as m:
+            salida = BytesIO()
+            img_pil.save(salida, format='JPEG', quality=CALIDAD_JPEG_MINIATURA, optimize=True)
+            m['bytes'] = salida.tell()
+        return salida.getvalue()
+
+
+def _escribir_atomico(ruta, datos):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(ruta_tmp, 'wb') as f:
+        f.write(datos)
+    os.replace(ruta_tmp, ruta)
+
+
+def guardar_miniatura(datos, ancho, alto, hash_original=None, tiempos=None):
+    """Crea (si no existe) la miniatura de unos bytes de foto y devuelve su ruta en caché."""
+    if hash_original is None:
+        hash_original = hash_contenido(datos)
+    ruta = ruta_miniatura(hash_original, ancho, alto)
+
+    if os.path.exists(ruta):
+        os.utime(ruta)  # Marca de uso para la expulsión LRU
+        return ruta
+
+    _escribir_atomico(ruta, generar_miniatura(datos, ancho, alto, tiempos=tiempos))
+    return ruta
+
+
+def miniatura_en_cache(ruta_original, ancho, alto):
+    """Ruta de la miniatura si ya está en caché y el hash del original se conoce sin leerlo; si no, None."""
+    hash_original = hash_archivo(ruta_original, calcular=False)
+    if hash_original is None:
+        return None
+    ruta = ruta_miniatura(hash_original, ancho, alto)
+    if not os.path.exists(ruta):
+        return None
+    os.utime(ruta)
+    return ruta
+
+
+def obtener_miniatura(ruta_original, ancho, alto, tiempos=None):
+    """Devuelve la ruta de la miniatura de una foto en disco, regenerándola solo si falta o está obsoleta."""
+    hash_original = hash_archivo(ruta_original)
+    ruta = ruta_miniatura(hash_original, ancho, alto)
+
+    if os.path.exists(ruta):
+        os.utime(ruta)
+        return ruta
+
+    with medir_en(tiempos, 'miniatura.lectura') as m:
+        with open(ruta_original, 'rb') as f:
+            datos = f.read()
+        m['bytes'] = len(datos)
+    return guardar_miniatura(datos, ancho, alto, hash_original=hash_original, tiempos=tiempos)
+
+
+def tamano_cache():
+    """Devuelve (cantidad de miniaturas, bytes ocupados) de la caché."""
+    archivos = archivos_en(CARPETA_MINIATURAS)
+    return len(archivos), sum(tamano for _, tamano, _ in archivos)
+
+
+def aplicar_limite_cache(tamano_maximo=TAMANO_MAXIMO_CACHE_BYTES):
+    """Expulsa las miniaturas usadas hace más tiempo hasta que la caché quepa en el límite. Devuelve los bytes liberados."""
+    return expulsar_antiguos(CARPETA_MINIATURAS, tamano_maximo)
+
+
+def _bucle_limite():
+    while True:
+        _limite_pendiente.wait()
+        _limite_pendiente.clear()
+        try:
+            aplicar_limite_cache()
+        except Exception:
+            # Se reintenta con el próximo pedido
+            pass
+        time.sleep(INTERVALO_LIMITE_CACHE_S)
+
+
+def programar_limite_cache():
+    """Pide la expulsión por tamaño al hilo de fondo del proceso, sin esperarla."""
+    global _hilo_limite
+    with _hilo_limite_lock:
+        if _hilo_limite is None:
+            _hilo_limite = threading.Thread(target=_bucle_limite, name='limite_miniaturas', daemon=True)
+            _hilo_limite.start()
+    _limite_pendiente.set()
+
+
+def reconstruir_cache(rutas_originales, ancho, alto):
+    """Vacía la caché y regenera las miniaturas de las fotos indicadas. Devuelve (generadas, errores)."""
+    for _, _, ruta in archivos_en(CARPETA_MINIATURAS):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+    with _hashes_lock:
+        _hashes_archivos.clear()
+
+    generadas, errores = 0, 0
+    for ruta_original in rutas_originales:
+        try:
+            obtener_miniatura(ruta_original, ancho, alto)
+            generadas += 1
+        except Exception:
+            errores += 1
+    aplicar_limite_cache()
+    return generadas, errores
@@ -0,0 +1,104 @@
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# ----------------------------------------------------
+# NORMALIZACIÓN DE FOTOS AL SUBIRLAS
+# ----------------------------------------------------
+# Se aplica una sola vez al guardar: orientación EXIF, reducción al lado
+# máximo configurado y re-codificación sin metadatos (salvo el perfil de
+# color). Así las fotos ocupan menos disco y la exportación ya no tiene que
+# rotarlas ni decodificar originales de 12 MP.
+AJUSTES_FOTOS_POR_DEFECTO = {
+    "ACTIVO": True,
+    "LADO_MAXIMO_PX": 2048,
+    "FORMATO": "JPEG",
+    "CALIDAD": 85,
+    "CONSERVAR_ORIGINAL": False
+}
+FORMATOS_SALIDA = {"JPEG": "jpg", "WEBP": "webp"}
+# Segmentos JPEG que solo llevan metadatos (EXIF/GPS, XMP, IPTC, comentarios...). Se conservan
+# APP0 (JFIF), APP2 (perfil de color ICC) y APP14 (Adobe, indica el espacio de color)
+SEGMENTOS_METADATOS_JPEG = frozenset(range(0xE1, 0xF0)) - {0xE2, 0xEE} | {0xFE}
+
+
+def completar_ajustes(ajustes):
+    """Devuelve los ajustes de normalización con los valores por defecto para las claves que falten."""
+    return {**AJUSTES_FOTOS_POR_DEFECTO, **(ajustes or {})}
+
+
+def aplanar_a_rgb(img_pil):
+    """Pasa la imagen a RGB; las transparencias (RGBA, LA, P) se componen sobre fondo blanco."""
+    if img_pil.mode in ('RGBA', 'LA', 'P'):
+        img_pil = img_pil.convert('RGBA')
+        fondo = Image.new('RGB', img_pil.size, (255, 255, 255))
+        fondo.paste(img_pil, mask=img_pil.split()[-1])
+        return fondo
+    if img_pil.mode != 'RGB':
+        return img_pil.convert('RGB')
+    return img_pil
+
+
+def quitar_metadatos_jpeg(datos):
+    """Quita los segmentos de metadatos de un JPEG sin re-codificar la imagen (sin pérdida)."""
+    if datos[:2] != b'\xff\xd8':
+        raise ValueError("La foto no es un JPEG.")
+    partes = [b'\xff\xd8']
+    i = 2
+    while i + 4 <= len(datos):
+        if datos[i] != 0xFF:
+            raise ValueError("JPEG con un segmento inválido.")
+        marcador = datos[i + 1]
+        if marcador == 0xFF:
+            # Relleno entre segmentos
+            i += 1
+            continue
+        if marcador in (0xDA, 0xD9):
+            # Inicio de los datos comprimidos (o fin de imagen): el resto se copia tal cual
+            partes.append(datos[i:])
+            return b''.join(partes)
+        largo = int.from_bytes(datos[i + 2:i + 4], 'big')
+        if marcador not in SEGMENTOS_METADATOS_JPEG:
+            partes.append(datos[i:i + 2 + largo])
+        i += 2 + largo
+    raise ValueError("JPEG incompleto.")
+
+
+def normalizar_foto(datos, ajustes):
+    """
+    Devuelve (bytes, extension) de la foto normalizada según los ajustes, siempre sin metadatos.
+    Si un JPEG no necesita rotarse ni reducirse y la re-codificación no lo achica, solo se le quitan los
+    metadatos, sin pérdida.
+    """
+    ajustes = completar_ajustes(ajustes)
+    formato = ajustes["FORMATO"].upper()
+    if formato not in FORMATOS_SALIDA:
+        raise ValueError(f"Formato de salida no soportado: {ajustes['FORMATO']}")
+    lado_maximo = int(ajustes["LADO_MAXIMO_PX"])
+
+    with Image.open(BytesIO(datos)) as img_pil:
+        formato_original = img_pil.format
+        icc_profile = img_pil.info.get('icc_profile')
+        orientacion = img_pil.getexif().get(0x0112, 1)
+        requiere_reduccion = max(img_pil.size) > lado_maximo
+
+        # draft() deja que el decodificador JPEG reduzca a 1/2, 1/4 u 1/8 mientras lee
+        img_pil.draft('RGB', (lado_maximo, lado_maximo))
+        img_pil = ImageOps.exif_transpose(img_pil)
+        img_pil.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+
+        # WEBP conserva la transparencia; JPEG no la admite
+        if formato == 'JPEG' or img_pil.mode not in ('RGB', 'RGBA'):
+            img_pil = aplanar_a_rgb(img_pil)
+
+        salida = BytesIO()
+        opciones = {'quality': int(ajustes["CALIDAD"])}
+        if icc_profile:
+            opciones['icc_profile'] = icc_profile
+        if formato == 'JPEG':
+            opciones['optimize'] = True
+        img_pil.save(salida, format=formato, **opciones)
+
+    normalizada = salida.getvalue()
+    if formato_original == 'JPEG' and orientacion == 1 and not requiere_reduccion and len(normalizada) >= len(datos):
+        return quitar_metadatos_jpeg(datos), FORMATOS_SALIDA['JPEG']
+    return normalizada, FORMATOS_SALIDA[formato]
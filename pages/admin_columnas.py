@@ -1,39 +1,30 @@
 import streamlit as st
-import json
 import os
+import time
 import shutil 
+from exportacion import IMAGEN_WIDTH, IMAGEN_HEIGHT
+from almacen_registros import ARCHIVO_CSV_ANTERIOR, eliminar_todos
+from almacen_fotos import CARPETA_FOTOS
+from normalizacion_fotos import FORMATOS_SALIDA
+from configuracion import obtener_configuracion, error_configuracion, guardar_configuracion
+from miniaturas import CARPETA_MINIATURAS, reconstruir_cache, tamano_cache
+from metricas import resumen, texto_prometheus, reiniciar, rss_actual_bytes
+from almacen_registros import estado_recoleccion
+from recolector_fotos import ARCHIVOS_POR_PASO, INTERVALO_RECOLECCION_S, GRACIA_RECOLECCION_S, recolectar_paso
+from archivo_registros import CARPETA_ARCHIVO, MESES_ACTIVOS, primera_particion_activa, archivar_meses_cerrados, particiones_archivadas
+from almacenamiento import obtener_almacen
 
 # ----------------------------------------------------
 # DEFINICIÓN DE ARCHIVOS
 # ----------------------------------------------------
-CONFIG_FILE = 'config_cols.json'
-PERSISTENCE_FILE = 'datos_maestro.csv' 
-IMAGE_FOLDER = 'imagenes_persistentes' 
-
-# Función para cargar la configuración de columnas (con UTF-8)
-def load_config():
-    """Carga la configuración actual desde el archivo JSON, usando UTF-8."""
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f: 
-                return json.load(f)
-        except Exception as e:
-            st.error(f"Error al leer config_cols.json: {e}. Se cargará la configuración de emergencia.")
-            return {
-                "CONDICIONES_INSPECCION": ["DAÑO EN EMPAQUE", "DAÑO FISICO", "ACCESORIOS COMPLETOS"],
-                "COLUMNAS_IMAGEN": ["FOTO DE SERIE", "FOTO DEL EMPAQUE"]
-            }
-    return {
-        "CONDICIONES_INSPECCION": ["DAÑO EN EMPAQUE", "DAÑO FISICO", "ACCESORIOS COMPLETOS", "PARILLA EN MAL ESTADO", "PRESENTA RESTOS METALICOS (VIRUTAS)", "TAPAS PRESENTAN OXIDO", "PRESENTA RAYAS", "TARJETA DE GARANTÍA", "TIENE ETIQUETA DE EFICIENCIA ENERGETICA"],
-        "COLUMNAS_IMAGEN": ["FOTO DE SERIE", "FOTO DEL EMPAQUE", "FOTO DE PRODUCTO COMPLETO", "FOTO PARTE TRASERA", "FOTO DE OBSERVACIONES A 50 CM (VIRUTAS)", "FOTO DE OBSERVACIONES CERCA (VIRUTAS)", "FOTO DE OBSERVACIONES A 50 CM (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES CERCA (OXIDO EN TAPILLAS)", "FOTO DE OBSERVACIONES A 50 CM (MANCHAS)", "FOTO DE OBSERVACIONES CERCA (MANCHAS)", "FOTO DE OBSERVACIONES A 50 CM (RAYAS)", "FOTO DE OBSERVACIONES CERCA (RAYAS)", "FOTO DE ACCESORIOS"]
-    }
+PERSISTENCE_FILE = ARCHIVO_CSV_ANTERIOR
+IMAGE_FOLDER = CARPETA_FOTOS
 
 def save_config(new_config):
-    """Guarda la nueva configuración en el archivo JSON (con UTF-8)."""
+    """Guarda la nueva configuración; queda vigente para todas las sesiones sin reiniciar la aplicación."""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f: # Uso de UTF-8 para guardar
-            json.dump(new_config, f, indent=4, ensure_ascii=False) # ensure_ascii=False para guardar acentos
-        st.success("✅ Configuración de columnas guardada. Los cambios serán visibles al usar la aplicación.")
+        guardada = guardar_configuracion(new_config)
+        st.success(f"✅ Configuración de columnas guardada (esquema v{guardada['VERSION_ESQUEMA']}). Los cambios se aplican en la próxima interacción de cada usuario.")
     except Exception as e:
         st.error(f"❌ Error al guardar la configuración: {e}")
 
@@ -45,7 +36,9 @@ def admin_page_main():
     st.title("⚙️ Administración de Columnas Dinámicas")
     st.markdown("Aquí puede añadir o eliminar las opciones de chequeo y las columnas de fotos. Cada opción debe estar en una **línea separada**.")
 
-    current_config = load_config()
+    current_config = obtener_configuracion()
+    if error_configuracion():
+        st.error(f"{error_configuracion()} Se muestra la última configuración válida.")
 
     # --- Bloque de Condiciones de Inspección ---
     st.header("1. Condiciones de Inspección (Checkboxes)")
@@ -69,6 +62,48 @@ def admin_page_main():
         key="imagenes_input"
     )
 
+    # --- Bloque de Procesamiento de Fotos ---
+    st.header("3. Procesamiento de Fotos al Subirlas")
+    current_ajustes = current_config["PROCESAMIENTO_FOTOS"]
+
+    ajuste_activo = st.checkbox(
+        "Normalizar fotos al guardarlas (corregir orientación, reducir tamaño y re-comprimir)",
+        value=current_ajustes["ACTIVO"],
+        key="fotos_activo"
+    )
+    col_lado, col_formato, col_calidad = st.columns(3)
+    ajuste_lado = col_lado.number_input(
+        "Lado máximo (px)", min_value=320, max_value=8000, step=64,
+        value=int(current_ajustes["LADO_MAXIMO_PX"]), key="fotos_lado"
+    )
+    formatos = list(FORMATOS_SALIDA)
+    ajuste_formato = col_formato.selectbox(
+        "Formato", formatos,
+        index=formatos.index(current_ajustes["FORMATO"].upper()) if current_ajustes["FORMATO"].upper() in formatos else 0,
+        key="fotos_formato"
+    )
+    ajuste_calidad = col_calidad.slider(
+        "Calidad", min_value=40, max_value=100,
+        value=int(current_ajustes["CALIDAD"]), key="fotos_calidad"
+    )
+    ajuste_original = st.checkbox(
+        "Conservar también la foto original (ocupa más disco)",
+        value=current_ajustes["CONSERVAR_ORIGINAL"],
+        key="fotos_original"
+    )
+
+    # --- Bloque de Control de Duplicados ---
+    st.header("4. SERIE Duplicada")
+    politicas = {"ADVERTIR": "Advertir y guardar igualmente", "BLOQUEAR": "No guardar una SERIE ya inspeccionada"}
+    current_politica = current_config["DUPLICADOS_SERIE"]
+    ajuste_duplicados = st.radio(
+        "Al añadir un registro cuya SERIE ya existe:",
+        list(politicas),
+        index=list(politicas).index(current_politica) if current_politica in politicas else 0,
+        format_func=politicas.get,
+        key="politica_duplicados"
+    )
+
     st.markdown("---")
 
     if st.button("💾 Guardar y Aplicar Cambios de Columnas", type="primary"):
@@ -80,28 +115,164 @@ def admin_page_main():
         # Crear la nueva configuración
         new_config = {
             "CONDICIONES_INSPECCION": new_condiciones_list,
-            "COLUMNAS_IMAGEN": new_imagenes_list
+            "COLUMNAS_IMAGEN": new_imagenes_list,
+            "PROCESAMIENTO_FOTOS": {
+                "ACTIVO": ajuste_activo,
+                "LADO_MAXIMO_PX": int(ajuste_lado),
+                "FORMATO": ajuste_formato,
+                "CALIDAD": int(ajuste_calidad),
+                "CONSERVAR_ORIGINAL": ajuste_original
+            },
+            "DUPLICADOS_SERIE": ajuste_duplicados
         }
         
         # Guardar y notificar al usuario
         save_config(new_config)
-        st.warning("⚠️ Nota: Para que los cambios sean visibles en el formulario de Home, debe recargar la aplicación.")
 
     st.markdown("---")
-    st.header("3. Herramientas de Datos")
+    st.header("5. Herramientas de Datos")
+
+    # Caché de miniaturas usada por la exportación a Excel
+    cantidad_min, bytes_min = tamano_cache()
+    st.caption(f"Caché de miniaturas: {cantidad_min} archivos, {bytes_min / (1024 * 1024):.1f} MB")
+
+    if st.button("🖼️ Reconstruir Caché de Miniaturas", type="secondary"):
+        rutas_fotos = []
+        if os.path.exists(IMAGE_FOLDER):
+            for raiz, _, nombres in os.walk(IMAGE_FOLDER):
+                rutas_fotos.extend(os.path.join(raiz, nombre) for nombre in nombres)
+
+        with st.spinner('⏳ Regenerando miniaturas...'):
+            generadas, errores = reconstruir_cache(rutas_fotos, IMAGEN_WIDTH, IMAGEN_HEIGHT)
+
+        if errores:
+            st.warning(f"⚠️ {generadas} miniaturas regeneradas, {errores} fotos no se pudieron procesar.")
+        else:
+            st.success(f"✅ {generadas} miniaturas regeneradas.")
 
     # Opción para limpiar todos los datos
     if st.button("🔥 ELIMINAR TODOS LOS REGISTROS Y ARCHIVOS PERSISTENTES", type="secondary"):
         
-        if st.checkbox("Confirmo que deseo ELIMINAR PERMANENTEMENTE todos los registros (CSV) y todas las fotos (Carpeta de imágenes). ESTO ES IRREVERSIBLE.", key='confirm_delete'):
+        if st.checkbox("Confirmo que deseo ELIMINAR PERMANENTEMENTE todos los registros (almacén de datos) y todas las fotos (Carpeta de imágenes). ESTO ES IRREVERSIBLE.", key='confirm_delete'):
             
+            eliminar_todos()
             if os.path.exists(PERSISTENCE_FILE):
                  os.remove(PERSISTENCE_FILE)
-            if os.path.exists(IMAGE_FOLDER):
-                 shutil.rmtree(IMAGE_FOLDER) 
+            obtener_almacen().vaciar(IMAGE_FOLDER)
+            if os.path.exists(CARPETA_MINIATURAS):
+                 shutil.rmtree(CARPETA_MINIATURAS) 
+            obtener_almacen().vaciar(CARPETA_ARCHIVO)
             
             st.success("✅ Registros persistentes y archivos de imágenes eliminados con éxito. Vuelva a la página principal y reinicie la aplicación.")
         else:
             st.info("Debe confirmar la eliminación.")
 
+    st.markdown("---")
+    st.header("6. Archivo Histórico")
+    mostrar_archivo()
+
+    st.markdown("---")
+    st.header("7. Limpieza de Fotos Huérfanas")
+    mostrar_recoleccion()
+
+    st.markdown("---")
+    st.header("8. Métricas de Rendimiento")
+    mostrar_metricas()
+
+
+def mostrar_recoleccion():
+    """Totales de la limpieza en segundo plano de fotos que ningún registro usa, y un paso manual."""
+    st.caption(
+        f"Un proceso de fondo revisa {ARCHIVOS_POR_PASO} fotos cada {INTERVALO_RECOLECCION_S:.0f} s y borra las que ningún "
+        f"registro (activo o archivado) usa y tienen más de {GRACIA_RECOLECCION_S / 3600:.0f} h."
+    )
+    if st.button("🧹 Ejecutar un Paso de Limpieza Ahora"):
+        try:
+            resultado = recolectar_paso()
+        except Exception as e:
+            st.error(f"❌ Error en la limpieza: {e}")
+        else:
+            if resultado is None:
+                st.info("La limpieza ya está en curso en otro proceso. Intente de nuevo en unos segundos.")
+            else:
+                examinados, borrados, liberados = resultado
+                st.success(f"✅ {examinados} fotos revisadas, {borrados} borradas ({liberados / (1024 * 1024):.1f} MB liberados).")
+
+    estado = estado_recoleccion()
+    col_mb, col_borradas, col_vueltas = st.columns(3)
+    col_mb.metric("MB liberados", f"{estado['bytes_liberados'] / (1024 * 1024):.1f}")
+    col_borradas.metric("Fotos borradas", estado['borrados'])
+    col_vueltas.metric("Recorridos completos", estado['vueltas'])
+    posicion = f"carpeta {estado['hoja']}" if estado['hoja'] else "inicio"
+    ultimo = time.strftime('%Y-%m-%d %H:%M', time.localtime(estado['ultimo_paso'])) if estado['ultimo_paso'] else "nunca"
+    st.caption(f"{estado['examinados']} fotos revisadas en total. Posición del recorrido: {posicion}. Último paso: {ultimo}.")
+
+
+def mostrar_archivo():
+    """Meses archivados en Parquet y archivado manual de los meses que ya salieron de la ventana activa."""
+    st.caption(
+        f"La lista principal conserva los últimos {MESES_ACTIVOS} meses (desde {primera_particion_activa()}). "
+        "Los anteriores se archivan automáticamente una vez por día; se consultan y exportan desde la página principal."
+    )
+    if st.button("🗄️ Archivar Meses Cerrados Ahora"):
+        try:
+            with st.spinner("Archivando..."):
+                archivados = archivar_meses_cerrados()
+        except Exception as e:
+            st.error(f"❌ Error al archivar: {e}")
+        else:
+            if archivados:
+                st.success("✅ Archivados: " + ", ".join(f"{mes} ({cantidad} registros)" for mes, cantidad in archivados))
+            else:
+                st.info("No hay meses cerrados pendientes de archivar.")
+
+    try:
+        particiones = particiones_archivadas()
+    except ImportError:
+        st.warning("⚠️ Para el archivo histórico falta instalar 'pyarrow'.")
+        return
+    if particiones:
+        st.dataframe(
+            [{'Mes': p['particion'], 'Registros': p['registros'], 'Tamaño (MB)': round(p['bytes'] / (1024 * 1024), 2)} for p in particiones],
+            use_container_width=True,
+            hide_index=True
+        )
+    else:
+        st.info("Todavía no hay meses archivados.")
+
+
+def mostrar_metricas():
+    """Resumen por fase (p50/p95) de las exportaciones y guardados hechos por este proceso desde que arrancó."""
+    st.caption(f"Memoria residente del proceso: {rss_actual_bytes() / (1024 * 1024):.0f} MB")
+
+    filas = resumen()
+    if not filas:
+        st.info("Todavía no hay métricas: se registran al añadir registros y al generar reportes.")
+        return
+
+    st.dataframe(
+        [{
+            'Fase': f['fase'],
+            'Veces': f['observaciones'],
+            'Elementos': f['elementos'],
+            'p50 (s)': round(f['p50_s'], 3),
+            'p95 (s)': round(f['p95_s'], 3),
+            'Máx. (s)': round(f['maximo_s'], 3),
+            'Total (s)': round(f['total_s'], 2),
+            'MB procesados': round(f['bytes'] / (1024 * 1024), 1),
+            'RSS máx. (MB)': round(f['rss_maximo_bytes'] / (1024 * 1024)),
+        } for f in filas],
+        use_container_width=True,
+        hide_index=True
+    )
+
+    texto = texto_prometheus()
+    col_descarga, col_reinicio = st.columns(2)
+    col_descarga.download_button("⬇️ Descargar Métricas (Prometheus)", data=texto, file_name="metricas.prom", mime="text/plain")
+    if col_reinicio.button("🔄 Reiniciar Métricas"):
+        reiniciar()
+        st.rerun()
+    with st.expander("Ver volcado en formato Prometheus"):
+        st.code(texto, language='text')
+
 admin_page_main()
\ No newline at end of file
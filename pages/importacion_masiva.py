@@ -0,0 +1,169 @@
+import os
+import streamlit as st
+import zipfile
+import pandas as pd
+from configuracion import obtener_configuracion, error_configuracion
+from importacion import guardar_zip, leer_informe, leer_manifiesto, ESTADO_IMPORTADO, ESTADO_OMITIDO, ESTADO_ERROR, LOTE_IMPORTACION, TAMANO_MAXIMO_ZIP_MB
+from trabajos_exportacion import enviar_importacion, consultar_trabajo, ESTADO_EN_COLA, ESTADO_LISTO, ESTADO_ERROR as ESTADO_TRABAJO_ERROR
+
+# ----------------------------------------------------
+# PÁGINA DE IMPORTACIÓN MASIVA
+# ----------------------------------------------------
+# La importación se envía a la cola de trabajos en segundo plano: la página
+# solo consulta su avance, y el id queda en la URL para retomarla si se recarga.
+
+def iniciar_importacion(manifiesto, archivo_zip, config):
+    """Copia el ZIP a disco y encola la importación; guarda el id del trabajo en la sesión y en la URL."""
+    try:
+        ruta_zip = guardar_zip(archivo_zip) if archivo_zip is not None else None
+    except zipfile.BadZipFile as e:
+        st.session_state['error_importacion'] = f"❌ El archivo de fotos no es un ZIP válido: {e}"
+        return
+
+    id_trabajo = enviar_importacion(manifiesto, ruta_zip, config)
+    if id_trabajo is None:
+        if ruta_zip is not None:
+            os.remove(ruta_zip)
+        st.session_state['error_importacion'] = "⚠️ Hay demasiados trabajos en proceso en este momento. Intente de nuevo en unos minutos."
+        return
+
+    st.session_state['error_importacion'] = None
+    st.session_state['informe_importacion'] = None
+    st.session_state['trabajo_importacion'] = id_trabajo
+    st.query_params['importacion'] = id_trabajo
+
+
+@st.fragment(run_every=1)
+def mostrar_progreso_importacion():
+    """Consulta el trabajo de importación cada segundo y muestra el informe cuando termina."""
+    id_trabajo = st.session_state.get('trabajo_importacion')
+    if not id_trabajo:
+        return
+
+    estado = consultar_trabajo(id_trabajo)
+    if estado is None or estado['estado'] in (ESTADO_LISTO, ESTADO_TRABAJO_ERROR):
+        st.session_state['trabajo_importacion'] = None
+        st.query_params.pop('importacion', None)
+        if estado is not None and estado['estado'] == ESTADO_LISTO:
+            st.session_state['informe_importacion'] = leer_informe(estado['ruta'])
+        elif estado is not None:
+            st.session_state['error_importacion'] = f"❌ La importación se detuvo: {estado['error']}. Los lotes ya confirmados quedaron guardados."
+        st.rerun()
+
+    if estado['estado'] == ESTADO_EN_COLA:
+        st.info("⏳ Importación en cola, esperando un procesador libre...")
+        return
+
+    hechas, total = estado['hechas'], estado['total']
+    if not total:
+        st.progress(0.0, text="⏳ Validando el manifiesto...")
+        return
+    texto = f"⏳ Importando... {hechas}/{total} filas"
+    if estado['eta_s'] is not None:
+        texto += f" (faltan ~{int(estado['eta_s']) + 1} s)"
+    st.progress(hechas / total, text=texto)
+
+
+def importacion_page_main():
+    st.title("📦 Importación Masiva de Inspecciones")
+
+    # Importación en segundo plano (se recupera desde la URL tras recargar la página)
+    if 'trabajo_importacion' not in st.session_state:
+        st.session_state['trabajo_importacion'] = st.query_params.get('importacion')
+    if 'error_importacion' not in st.session_state:
+        st.session_state['error_importacion'] = None
+
+    if st.session_state['trabajo_importacion']:
+        st.caption("La importación sigue aunque cierre o recargue la página.")
+        mostrar_progreso_importacion()
+        return
+    if st.session_state['error_importacion']:
+        st.error(st.session_state['error_importacion'])
+
+    config = obtener_configuracion()
+    if error_configuracion():
+        st.error(f"{error_configuracion()} Se usa la última configuración válida.")
+
+    columnas_imagen = config["COLUMNAS_IMAGEN"]
+    with st.expander("📖 Formato del manifiesto y del ZIP", expanded=False):
+        st.markdown(
+            "**Manifiesto** (CSV o Excel .xlsx): una fila por unidad con las columnas `MODELO`, `SERIE`, "
+            "`OBSERVACIONES` y una columna por condición de inspección (`SÍ`, `X` o `1` marcan la condición; "
+            "vacío es `NO`).\n\n"
+            f"**Fotos** (ZIP de hasta {TAMANO_MAXIMO_ZIP_MB} MB; para cargas mayores, divida las unidades en varios ZIP "
+            "con su propio manifiesto): cada foto se asocia a su columna por el nombre del archivo, de cualquiera de estas formas:\n"
+            "- `<SERIE>/<COLUMNA>.jpg` (una carpeta por unidad)\n"
+            "- `<SERIE>_<COLUMNA>.jpg`\n"
+            "- Una columna del manifiesto con el nombre de la columna de foto y el nombre del archivo como valor.\n\n"
+            "`<COLUMNA>` es el nombre de la columna de foto (sin importar mayúsculas, acentos ni espacios) "
+            "o su número según el orden siguiente:"
+        )
+        st.dataframe(
+            [{'N°': n, 'Columna de foto': c} for n, c in enumerate(columnas_imagen, start=1)],
+            hide_index=True,
+            use_container_width=True
+        )
+        plantilla = pd.DataFrame(columns=config["ENCABEZADOS"])
+        st.download_button(
+            "⬇️ Descargar Plantilla de Manifiesto (CSV)",
+            data=plantilla.to_csv(index=False).encode('utf-8-sig'),
+            file_name="manifiesto_plantilla.csv",
+            mime="text/csv"
+        )
+
+    archivo_manifiesto = st.file_uploader("Manifiesto (CSV o Excel)", type=['csv', 'xlsx'], key='manifiesto_importacion')
+    # Límite propio de esta página: el del resto del sitio queda en el valor por defecto de Streamlit
+    archivo_zip = st.file_uploader("Fotos (ZIP)", type=['zip'], key='zip_importacion', max_upload_size=TAMANO_MAXIMO_ZIP_MB)
+
+    if archivo_manifiesto is None:
+        st.info("Suba el manifiesto para comenzar. El ZIP de fotos es opcional (se importan los registros sin fotos).")
+        if st.session_state.get('informe_importacion'):
+            mostrar_informe(st.session_state['informe_importacion'])
+        return
+
+    try:
+        manifiesto = leer_manifiesto(archivo_manifiesto, archivo_manifiesto.name)
+    except Exception as e:
+        st.error(f"❌ No se pudo leer el manifiesto: {e}")
+        return
+
+    faltantes = [c for c in ('MODELO', 'SERIE') if c not in manifiesto.columns]
+    if faltantes:
+        st.error(f"❌ Al manifiesto le faltan las columnas obligatorias: {', '.join(faltantes)}.")
+        return
+    desconocidas = [c for c in config["CONDICIONES_INSPECCION"] if c.upper() not in manifiesto.columns]
+    if desconocidas:
+        st.warning(f"⚠️ Condiciones sin columna en el manifiesto (se importarán como 'NO'): {', '.join(desconocidas)}")
+
+    st.caption(f"{len(manifiesto)} filas en el manifiesto. Los registros se guardan en lotes de {LOTE_IMPORTACION}.")
+
+    st.button("🚀 Importar", type="primary", on_click=iniciar_importacion, args=(manifiesto, archivo_zip, config))
+
+    informe = st.session_state.get('informe_importacion')
+    if informe:
+        mostrar_informe(informe)
+
+
+def mostrar_informe(informe):
+    """Resumen por estado y detalle por fila de la última importación, descargable como CSV."""
+    df_informe = pd.DataFrame(informe)
+    conteo = df_informe['ESTADO'].value_counts()
+    col_ok, col_omitidas, col_error = st.columns(3)
+    col_ok.metric("✅ Importadas", int(conteo.get(ESTADO_IMPORTADO, 0)))
+    col_omitidas.metric("⏭️ Omitidas", int(conteo.get(ESTADO_OMITIDO, 0)))
+    col_error.metric("❌ Con error", int(conteo.get(ESTADO_ERROR, 0)))
+
+    if conteo.get(ESTADO_IMPORTADO, 0):
+        st.success("✅ Los registros importados ya están disponibles en la página principal.")
+
+    solo_problemas = st.checkbox("Mostrar solo filas omitidas o con error", value=True)
+    vista = df_informe[df_informe['ESTADO'] != ESTADO_IMPORTADO] if solo_problemas else df_informe
+    st.dataframe(vista, use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Descargar Informe de Importación (CSV)",
+        data=df_informe.to_csv(index=False).encode('utf-8-sig'),
+        file_name="informe_importacion.csv",
+        mime="text/csv"
+    )
+
+importacion_page_main()
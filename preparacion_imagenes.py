@@ -0,0 +1,165 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from metricas import Acumulador
+from miniaturas import obtener_miniatura, miniatura_en_cache, hash_archivo, recordar_hash
+
+# ----------------------------------------------------
+# PREPARACIÓN DE IMÁGENES EN PARALELO
+# ----------------------------------------------------
+# Etapa previa al anclaje con openpyxl: cada foto se convierte en los bytes
+# listos para incrustar (miniatura en caché) usando un pool de procesos.
+# El hilo de Streamlit solo recibe bytes terminados, en orden fila/columna.
+
+def _cpus_disponibles():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Configurables por variable de entorno (ej. en Cloud Run)
+PROCESOS_PREPARACION = int(os.environ.get('PROCESOS_PREPARACION_IMAGENES', 0)) or _cpus_disponibles()
+# Máximo de imágenes en vuelo (enviadas al pool y aún no consumidas) para acotar la memoria
+MAX_IMAGENES_EN_VUELO = int(os.environ.get('MAX_IMAGENES_EN_VUELO', 0)) or PROCESOS_PREPARACION * 4
+# Por debajo de esta cantidad de fotos no compensa arrancar procesos
+MIN_IMAGENES_PARA_POOL = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obtener_pool():
+    """Pool de procesos compartido por todo el proceso de Streamlit (se crea una sola vez)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' evita heredar los hilos del servidor de Streamlit al hacer fork
+            _pool = ProcessPoolExecutor(
+                max_workers=PROCESOS_PREPARACION,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _descartar_pool(pool):
+    """Descarta un pool roto (ej. un proceso murió por falta de memoria); el próximo uso crea uno nuevo."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def es_ruta_valida(ruta):
+    """Indica si el valor guardado en una columna de foto apunta a un archivo existente."""
+    path_check = str(ruta).strip()
+    return bool(path_check) and path_check.lower() not in ('none', 'nan') and os.path.exists(path_check)
+
+
+def preparar_imagen(ruta, ancho, alto):
+    """
+    Devuelve (bytes_para_incrustar, error, hash_original, tiempos). Si falla la miniatura se devuelven
+    los bytes originales sin rotar. El hash se devuelve para que el proceso principal lo memorice,
+    y los tiempos por etapa ({fase: [segundos, bytes, conteo]}) para sumarlos a sus métricas.
+    """
+    tiempos = Acumulador()
+    try:
+        with open(obtener_miniatura(ruta, ancho, alto, tiempos=tiempos), 'rb') as f:
+            return f.read(), None, hash_archivo(ruta), tiempos.fases
+    except Exception as e:
+        try:
+            with open(ruta, 'rb') as f:
+                return f.read(), str(e), None, tiempos.fases
+        except Exception as e2:
+            return None, str(e2), None, tiempos.fases
+
+
+def _leer_si_en_cache(ruta, ancho, alto):
+    """Bytes de la miniatura si ya está en caché (sin pasar por el pool), o None."""
+    try:
+        ruta_min = miniatura_en_cache(ruta, ancho, alto)
+        if ruta_min is None:
+            return None
+        with open(ruta_min, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def preparar_imagenes(filas_rutas, ancho, alto, procesos=None, max_en_vuelo=None, progreso=None, tiempos=None):
+    """
+    Genera (indice_fila, indice_columna, ruta, bytes, error) para cada foto válida, en orden fila/columna.
+    filas_rutas es una lista de filas, cada una con la lista de rutas de sus columnas de foto.
+    Las miniaturas ya presentes en caché se leen directamente; solo las faltantes van al pool.
+    Si se indica, progreso(hechas, total) se llama al arrancar y tras cada imagen entregada,
+    y el metricas.Acumulador tiempos recibe el tiempo de cada etapa medido en los procesos.
+    """
+    procesos = procesos or PROCESOS_PREPARACION
+    max_en_vuelo = max_en_vuelo or MAX_IMAGENES_EN_VUELO
+
+    tareas = [
+        (indice_fila, indice_columna, str(ruta).strip())
+        for indice_fila, rutas in enumerate(filas_rutas)
+        for indice_columna, ruta in enumerate(rutas)
+        if es_ruta_valida(ruta)
+    ]
+
+    if progreso:
+        progreso(0, len(tareas))
+
+    usar_pool = procesos > 1 and len(tareas) >= MIN_IMAGENES_PARA_POOL
+    pool = _obtener_pool() if usar_pool else None
+    pendientes = deque()
+    siguiente = 0
+    entregadas = 0
+
+    while siguiente < len(tareas) or pendientes:
+        # Se mantiene la ventana llena sin superar el límite de imágenes en vuelo
+        while siguiente < len(tareas) and len(pendientes) < max_en_vuelo:
+            indice_fila, indice_columna, ruta = tareas[siguiente]
+            inicio = time.perf_counter()
+            datos = _leer_si_en_cache(ruta, ancho, alto)
+            if datos is not None:
+                tiempos_cache = {'miniatura.en_cache': [time.perf_counter() - inicio, len(datos), 1]}
+                pendientes.append((indice_fila, indice_columna, ruta, (datos, None, None, tiempos_cache)))
+            elif pool is not None:
+                try:
+                    pendientes.append((indice_fila, indice_columna, ruta, pool.submit(preparar_imagen, ruta, ancho, alto)))
+                except BrokenProcessPool:
+                    _descartar_pool(pool)
+                    pool = None
+                    continue
+            else:
+                pendientes.append((indice_fila, indice_columna, ruta, preparar_imagen(ruta, ancho, alto)))
+            siguiente += 1
+
+        indice_fila, indice_columna, ruta, resultado = pendientes.popleft()
+        if not isinstance(resultado, tuple):
+            try:
+                resultado = resultado.result()
+            except BrokenProcessPool:
+                # El resto de la exportación (incluidas las fotos ya enviadas) se prepara en este proceso
+                if pool is not None:
+                    _descartar_pool(pool)
+                    pool = None
+                resultado = preparar_imagen(ruta, ancho, alto)
+            except Exception as e:
+                resultado = (None, str(e), None, {})
+
+        datos, error, hash_original, tiempos_imagen = resultado
+        if tiempos is not None:
+            for fase, (duracion_s, bytes_procesados, conteo) in tiempos_imagen.items():
+                tiempos.sumar(fase, duracion_s, bytes_procesados, conteo)
+        if hash_original:
+            try:
+                recordar_hash(ruta, hash_original)
+            except OSError:
+                pass
+        yield indice_fila, indice_columna, ruta, datos, error
+        entregadas += 1
+        if progreso:
+            progreso(entregadas, len(tareas))
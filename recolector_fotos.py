@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+from almacen_fotos import CARPETA_FOTOS, PREFIJO_TEMPORAL, SUFIJO_RETIRADA, eliminar_foto
+from almacenamiento import obtener_almacen, aplicar_limite_cache_local
+from almacen_registros import rutas_referenciadas, tomar_turno_recoleccion, registrar_paso_recoleccion, liberar_turno_recoleccion
+from metricas import medir
+
+# ----------------------------------------------------
+# LIMPIEZA INCREMENTAL DE FOTOS HUÉRFANAS
+# ----------------------------------------------------
+# Subidas abandonadas, envíos fallidos o registros editados fuera de la
+# aplicación dejan en imagenes_persistentes archivos que ningún registro usa.
+# Un hilo de fondo por proceso recorre la carpeta de a poco: en cada paso
+# examina como máximo ARCHIVOS_POR_PASO archivos a partir del cursor guardado
+# en la base, consulta en el índice fotos_registros (y el de archivados) cuáles
+# siguen en uso y borra el resto si son más viejos que el periodo de gracia.
+# Ninguna sesión recorre la carpeta al atender una interacción.
+#
+# Solo se consideran referencias las rutas dentro de la carpeta de fotos tal
+# como las guarda la aplicación ('imagenes_persistentes/ab/cd/<hash>.jpg').
+#
+# Con almacenamiento remoto se recorre el listado del bucket (en el mismo
+# orden, con el mismo cursor) contra la misma base de registros (ver
+# almacen_registros), y el hilo también mantiene la caché local de fotos
+# dentro de su límite.
+ARCHIVOS_POR_PASO = int(os.environ.get('RECOLECCION_ARCHIVOS_POR_PASO', 200))
+INTERVALO_RECOLECCION_S = float(os.environ.get('RECOLECCION_INTERVALO_S', 30))
+# Más largo que el de almacen_fotos: cubre formularios que quedan abiertos mucho tiempo
+GRACIA_RECOLECCION_S = float(os.environ.get('RECOLECCION_GRACIA_S', 24 * 3600))
+# '0' desactiva el hilo de fondo (queda el botón de la página de administración)
+RECOLECCION_AUTOMATICA = os.environ.get('RECOLECCION_AUTOMATICA', '1') != '0'
+# Si un proceso muere a mitad de un paso, otro puede retomarlo pasado este tiempo
+DURACION_TURNO_S = 300
+# Raíz de la carpeta de fotos (fotos anteriores al almacén por hash y temporales de subida)
+HOJA_RAIZ = ''
+INTERVALO_LIMITE_CACHE_S = 600
+
+_hilo = None
+_hilo_lock = threading.Lock()
+
+
+def _es_prefijo(nombre):
+    return len(nombre) == 2 and all(c in '0123456789abcdef' for c in nombre)
+
+
+def _subcarpetas(ruta):
+    try:
+        return sorted(e.name for e in os.scandir(ruta) if e.is_dir() and _es_prefijo(e.name))
+    except FileNotFoundError:
+        return []
+
+
+def _hojas_desde(hoja_inicial):
+    """Carpetas con fotos en el orden del recorrido (raíz y luego 'ab/cd'), desde hoja_inicial inclusive."""
+    if hoja_inicial is None or hoja_inicial == HOJA_RAIZ:
+        yield HOJA_RAIZ
+    inicio_ab = (hoja_inicial or '')[:2]
+    for ab in _subcarpetas(CARPETA_FOTOS):
+        if ab < inicio_ab:
+            continue
+        for cd in _subcarpetas(os.path.join(CARPETA_FOTOS, ab)):
+            hoja = f"{ab}/{cd}"
+            if hoja_inicial is None or hoja >= hoja_inicial:
+                yield hoja
+
+
+def _archivos(hoja, despues_de):
+    """(nombre, ruta, stat) de los archivos de la hoja, ordenados por nombre, posteriores a despues_de."""
+    carpeta = os.path.join(CARPETA_FOTOS, *hoja.split('/')) if hoja else CARPETA_FOTOS
+    try:
+        entradas = sorted((e for e in os.scandir(carpeta) if e.is_file(follow_symlinks=False)), key=lambda e: e.name)
+    except FileNotFoundError:
+        return
+    for e in entradas:
+        if despues_de is not None and e.name <= despues_de:
+            continue
+        try:
+            yield e.name, os.path.join(carpeta, e.name), e.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+
+
+def _recorrido_local(hoja, nombre):
+    """(hoja, nombre, ruta, tamaño, fecha) de las fotos en disco a partir del cursor."""
+    for hoja_actual in _hojas_desde(hoja):
+        despues_de = nombre if hoja_actual == hoja else None
+        for nombre_archivo, ruta, info in _archivos(hoja_actual, despues_de):
+            yield hoja_actual, nombre_archivo, ruta, info.st_size, info.st_mtime
+
+
+def _recorrido_remoto(almacen, hoja, nombre):
+    """(hoja, nombre, ruta, tamaño, fecha) de los objetos del bucket a partir del cursor."""
+    despues_de = None
+    if nombre is not None:
+        despues_de = os.path.join(CARPETA_FOTOS, *(hoja.split('/') if hoja else []), nombre)
+    for ruta, tamano, fecha in almacen.listar(CARPETA_FOTOS, despues_de):
+        hoja_actual, nombre_archivo = os.path.split(os.path.relpath(ruta, CARPETA_FOTOS))
+        yield hoja_actual.replace(os.sep, '/'), nombre_archivo, ruta, tamano, fecha
+
+
+def _es_temporal(nombre):
+    return nombre.startswith(PREFIJO_TEMPORAL) or nombre.endswith(SUFIJO_RETIRADA)
+
+
+def _eliminar_temporal(ruta, tamano):
+    """Borra una subida abandonada o una foto retirada por un borrado interrumpido (que se restaura si sigue en uso)."""
+    try:
+        if ruta.endswith(SUFIJO_RETIRADA):
+            original = ruta[:-len(SUFIJO_RETIRADA)]
+            if original in rutas_referenciadas([original]) and not os.path.exists(original):
+                os.replace(ruta, original)
+                return 0
+        os.remove(ruta)
+        return tamano
+    except FileNotFoundError:
+        return 0
+
+
+def recolectar_paso(max_archivos=ARCHIVOS_POR_PASO, gracia_s=GRACIA_RECOLECCION_S):
+    """
+    Examina hasta max_archivos fotos a partir del cursor y borra las que no usa ningún registro y son más
+    viejas que gracia_s (también temporales de subida abandonadas). Devuelve (examinados, borrados, bytes)
+    o None si otro proceso tiene el turno.
+    """
+    ahora = time.time()
+    estado = tomar_turno_recoleccion(ahora, DURACION_TURNO_S)
+    if estado is None:
+        return None
+
+    examinados = borrados = bytes_liberados = 0
+    hoja, nombre = estado['hoja'], estado['nombre']
+    almacen = obtener_almacen()
+    recorrido = _recorrido_remoto(almacen, hoja, nombre) if almacen.remoto else _recorrido_local(hoja, nombre)
+    vuelta_completa = True
+    candidatas = []
+
+    def eliminar_sin_uso():
+        nonlocal borrados, bytes_liberados
+        en_uso = rutas_referenciadas(candidatas)
+        for ruta in candidatas:
+            if ruta not in en_uso:
+                liberados = eliminar_foto(ruta, gracia_s)
+                if liberados:
+                    borrados += 1
+                    bytes_liberados += liberados
+        candidatas.clear()
+
+    try:
+        with medir('recoleccion.paso') as m:
+            for hoja_actual, nombre_archivo, ruta, tamano, fecha in recorrido:
+                if examinados >= max_archivos:
+                    vuelta_completa = False
+                    break
+                if hoja_actual != hoja:
+                    # Se consulta el índice una vez por carpeta
+                    eliminar_sin_uso()
+                examinados += 1
+                hoja, nombre = hoja_actual, nombre_archivo
+                if ahora - fecha < gracia_s:
+                    continue
+                if _es_temporal(nombre_archivo):
+                    liberados = _eliminar_temporal(ruta, tamano)
+                    if liberados:
+                        borrados += 1
+                        bytes_liberados += liberados
+                else:
+                    candidatas.append(ruta)
+            eliminar_sin_uso()
+            m['bytes'] = bytes_liberados
+            m['conteo'] = examinados
+    except Exception:
+        liberar_turno_recoleccion()
+        raise
+
+    if vuelta_completa:
+        # Se recorrió hasta el final: la próxima vuelta empieza de nuevo desde la raíz
+        hoja, nombre = None, None
+    registrar_paso_recoleccion(time.time(), hoja, nombre, examinados, borrados, bytes_liberados, vuelta_completa)
+    return examinados, borrados, bytes_liberados
+
+
+def _bucle():
+    ultimo_limite_cache = 0.0
+    while True:
+        time.sleep(INTERVALO_RECOLECCION_S)
+        try:
+            recolectar_paso()
+            if time.time() - ultimo_limite_cache >= INTERVALO_LIMITE_CACHE_S:
+                ultimo_limite_cache = time.time()
+                aplicar_limite_cache_local(CARPETA_FOTOS)
+        except Exception:
+            # Un fallo puntual (ej. base ocupada) no detiene la limpieza: se reintenta en el próximo paso
+            pass
+
+
+def iniciar_recolector():
+    """Arranca (una sola vez por proceso) el hilo de fondo que limpia las fotos huérfanas."""
+    global _hilo
+    if not RECOLECCION_AUTOMATICA:
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name='recolector_fotos', daemon=True)
+            _hilo.start()
@@ -0,0 +1,23 @@
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import almacen_registros
+import dataset_registros
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    """Almacén de registros vacío en una carpeta temporal (las rutas de la aplicación son relativas)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(almacen_registros, '_local', threading.local())
+    monkeypatch.setattr(almacen_registros, '_base_preparada', False)
+    monkeypatch.setattr(almacen_registros, '_csv_revisados', set())
+    monkeypatch.setattr(dataset_registros, '_estado', {'df': None, 'marca': 0, 'esquema': None, 'por_serie': {}, 'por_modelo_serie': {}, 'arreglos': None})
+    yield almacen_registros
+    con = getattr(almacen_registros._local, 'con', None)
+    if con is not None:
+        con.close()
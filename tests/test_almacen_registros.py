@@ -0,0 +1,138 @@
+import threading
+import pandas as pd
+from almacen_registros import COLUMNA_ID
+
+
+def test_alta_cambio_y_baja(almacen):
+    id_a = almacen.insertar_registro({'MODELO': 'M1', 'SERIE': 'S-1'})
+    id_b = almacen.insertar_registro({'MODELO': 'M2', 'SERIE': 'S-2'})
+    assert id_b > id_a
+    assert [r['SERIE'] for r in almacen.leer_registros()] == ['S-1', 'S-2']
+
+    assert almacen.actualizar_registro(id_a, {'OBSERVACIONES': 'rayado', COLUMNA_ID: 999})
+    assert almacen.leer_registros()[0] == {'MODELO': 'M1', 'SERIE': 'S-1', 'OBSERVACIONES': 'rayado', COLUMNA_ID: id_a}
+    assert not almacen.actualizar_registro(999, {'SERIE': 'x'})
+
+    assert almacen.eliminar_registro(id_a)
+    assert not almacen.eliminar_registro(id_a)
+    assert [r[COLUMNA_ID] for r in almacen.leer_registros()] == [id_b]
+
+
+def test_alta_en_lote(almacen):
+    almacen.insertar_registro({'MODELO': 'M1', 'SERIE': 'S-1'})
+    ids = almacen.insertar_registros(
+        [{'MODELO': 'M1', 'SERIE': 's-1 '}, {'MODELO': 'M1', 'SERIE': 'S-2'}, {'MODELO': 'M2', 'SERIE': 'S-2'}],
+        bloquear_serie_duplicada=True,
+    )
+    assert ids[0] is None and ids[1] is not None and ids[2] is None
+    assert almacen.ids_por_serie('S-2') == [ids[1]]
+    assert almacen.ids_por_serie('s-2', modelo='m1') == [ids[1]]
+
+
+def test_migracion_unica_desde_csv(almacen, tmp_path):
+    ruta_csv = tmp_path / 'datos_maestro.csv'
+    pd.DataFrame({'MODELO': ['M1', 'M2'], 'SERIE': ['S-1', '007']}).to_csv(ruta_csv, index=False)
+
+    assert almacen.migrar_desde_csv(str(ruta_csv)) == 2
+    assert not ruta_csv.exists() and (tmp_path / 'datos_maestro.csv.migrado').exists()
+    # Las series se conservan como texto
+    assert [r['SERIE'] for r in almacen.leer_registros()] == ['S-1', '007']
+    assert almacen.migrar_desde_csv(str(ruta_csv)) == 0
+
+
+def test_migracion_no_pisa_un_almacen_con_datos(almacen, tmp_path):
+    almacen.insertar_registro({'MODELO': 'M1', 'SERIE': 'S-1'})
+    sentencias = []
+    almacen._conexion().set_trace_callback(sentencias.append)
+    ruta_csv = tmp_path / 'datos_maestro.csv'
+    pd.DataFrame({'MODELO': ['M9'], 'SERIE': ['S-9']}).to_csv(ruta_csv, index=False)
+    assert almacen.migrar_desde_csv(str(ruta_csv)) == 0
+    # No hace falta el bloqueo de escritura para saber que no se importa
+    assert not any(s.startswith('BEGIN') for s in sentencias)
+    # Se marca igual, para no volver a revisarlo en cada recarga
+    assert not ruta_csv.exists() and (tmp_path / 'datos_maestro.csv.migrado').exists()
+    assert len(almacen.leer_registros()) == 1
+
+
+def test_migracion_se_revisa_una_vez_por_proceso(almacen, tmp_path):
+    ruta_csv = tmp_path / 'datos_maestro.csv'
+    assert almacen.migrar_desde_csv(str(ruta_csv)) == 0
+    # Un CSV que aparece después ya no se lee ni toma el bloqueo de escritura en este proceso
+    pd.DataFrame({'MODELO': ['M1'], 'SERIE': ['S-1']}).to_csv(ruta_csv, index=False)
+    sentencias = []
+    almacen._conexion().set_trace_callback(sentencias.append)
+    assert almacen.migrar_desde_csv(str(ruta_csv)) == 0
+    assert ruta_csv.exists() and sentencias == []
+
+
+def test_cambios_desde_una_marca(almacen):
+    id_a = almacen.insertar_registro({'MODELO': 'M1', 'SERIE': 'S-1'})
+    _, marca = almacen.leer_registros_con_marca()
+    assert almacen.leer_cambios_desde(marca) == ([], marca)
+
+    id_b = almacen.insertar_registro({'MODELO': 'M2', 'SERIE': 'S-2'})
+    almacen.actualizar_registro(id_b, {'SERIE': 'S-3'})
+    almacen.eliminar_registro(id_a)
+    cambios, nueva_marca = almacen.leer_cambios_desde(marca)
+    # Un solo cambio por registro, en orden, con su estado final
+    assert cambios == [(id_b, {'MODELO': 'M2', 'SERIE': 'S-3', COLUMNA_ID: id_b}), (id_a, None)]
+    assert nueva_marca > marca
+    assert almacen.leer_cambios_desde(nueva_marca) == ([], nueva_marca)
+
+
+def test_cambios_purgados_piden_recarga(almacen):
+    _, marca = almacen.leer_registros_con_marca()
+    for i in range(5):
+        almacen.insertar_registro({'MODELO': 'M', 'SERIE': f'S-{i}'})
+    _, marca_reciente = almacen.leer_registros_con_marca()
+    almacen.insertar_registro({'MODELO': 'M', 'SERIE': 'S-5'})
+
+    almacen.purgar_cambios(max_retenidos=1)
+    assert almacen.leer_cambios_desde(marca) == (None, marca)
+    cambios, _ = almacen.leer_cambios_desde(marca_reciente)
+    assert [r['SERIE'] for _, r in cambios] == ['S-5']
+
+
+def test_serie_duplicada_bloqueada_entre_sesiones(almacen):
+    resultados = []
+    barrera = threading.Barrier(8)
+
+    def alta(i):
+        barrera.wait()
+        # Cada hilo usa su propia conexión, como las sesiones de Streamlit
+        resultados.append(almacen.insertar_registro({'MODELO': f'M{i}', 'SERIE': ' s-100 '}, bloquear_serie_duplicada=True))
+
+    hilos = [threading.Thread(target=alta, args=(i,)) for i in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(resultados) == 8
+    assert len([r for r in resultados if r is not None]) == 1
+    assert len(almacen.ids_por_serie('S-100')) == 1
+
+
+def test_eliminar_todos(almacen):
+    almacen.insertar_registros([{'MODELO': 'M', 'SERIE': f'S-{i}'} for i in range(3)])
+    almacen.eliminar_todos()
+    assert almacen.leer_registros() == []
+    assert almacen.ids_por_serie('S-1') == []
+
+
+def test_archivado_deja_activos_los_registros_cambiados_al_escribir(almacen):
+    ids = almacen.insertar_registros([{'MODELO': 'M', 'SERIE': f'S-{i}'} for i in range(3)])
+    almacen._conexion().execute("UPDATE registros SET creado = '2026-07-15 10:00:00'")
+    escritos = []
+
+    def escribir(filas):
+        # Mientras se escribe el archivo las demás sesiones siguen pudiendo guardar
+        escritos.extend(id_registro for id_registro, _, _ in filas)
+        almacen.actualizar_registro(ids[0], {'OBSERVACIONES': 'corregido'})
+        almacen.eliminar_registro(ids[1])
+
+    assert almacen.archivar_particion('2026-07', escribir) == 1
+    assert escritos == ids
+    assert almacen.ids_archivados('2026-07') == {ids[2]}
+    assert [r[COLUMNA_ID] for r in almacen.leer_registros()] == [ids[0]]
+    assert almacen.ids_por_serie('S-2') == [ids[2]]
@@ -0,0 +1,120 @@
+import os
+import time
+from datetime import datetime, timezone
+import pytest
+
+moto = pytest.importorskip('moto')
+
+import almacenamiento
+import almacen_registros
+import archivo_registros
+from almacen_registros import COLUMNA_ID
+from configuracion import obtener_configuracion
+
+BUCKET = 'inspecciones'
+
+
+@pytest.fixture
+def s3(almacen, monkeypatch):
+    """Almacenamiento S3 (moto, en el proceso) con un bucket vacío; devuelve el cliente boto3 para inspeccionarlo."""
+    import boto3
+
+    for variable in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        monkeypatch.setenv(variable, 'prueba')
+    with moto.mock_aws():
+        cliente = boto3.client('s3', region_name='us-east-1')
+        cliente.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(almacenamiento, '_almacen', almacenamiento.AlmacenS3(BUCKET, 'app/', region='us-east-1'))
+        yield cliente
+
+
+def _claves(cliente, prefijo='app/'):
+    return sorted(o['Key'] for o in cliente.list_objects_v2(Bucket=BUCKET, Prefix=prefijo).get('Contents', []))
+
+
+def _escribir_local(ruta, datos):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as f:
+        f.write(datos)
+
+
+def test_subir_y_reutilizar(s3):
+    almacen = almacenamiento.obtener_almacen()
+    ruta = os.path.join('imagenes_persistentes', 'ab', 'cd', 'foto.jpg')
+    _escribir_local(ruta, b'original')
+    almacen.subir(ruta)
+    assert _claves(s3) == ['app/imagenes_persistentes/ab/cd/foto.jpg']
+
+    # Con reutilizar, un objeto existente no se vuelve a subir (ni hace falta la copia local): solo se renueva su fecha
+    os.remove(ruta)
+    almacen.subir(ruta, reutilizar=True)
+    assert almacen.info(ruta)[0] == len(b'original')
+    # Si no existe, se sube
+    otra = os.path.join('imagenes_persistentes', 'ab', 'cd', 'otra.jpg')
+    _escribir_local(otra, b'nueva')
+    almacen.subir(otra, reutilizar=True)
+    assert s3.get_object(Bucket=BUCKET, Key='app/' + otra.replace(os.sep, '/'))['Body'].read() == b'nueva'
+
+
+def test_traer_descarga_solo_lo_que_falta(s3):
+    almacen = almacenamiento.obtener_almacen()
+    ruta = os.path.join('imagenes_persistentes', 'ab', 'cd', 'foto.jpg')
+    _escribir_local(ruta, b'x' * 1000)
+    almacen.subir(ruta)
+    os.remove(ruta)
+
+    assert almacenamiento.traer_archivos([ruta, ruta]) == 1
+    with open(ruta, 'rb') as f:
+        assert f.read() == b'x' * 1000
+    assert almacenamiento.traer_archivos([ruta]) == 0
+
+    faltante = os.path.join('imagenes_persistentes', 'ab', 'cd', 'no_existe.jpg')
+    assert not almacen.traer(faltante)
+    assert os.listdir(os.path.dirname(ruta)) == ['foto.jpg']
+
+
+def test_listar_despues_de_y_vaciar(s3):
+    almacen = almacenamiento.obtener_almacen()
+    rutas = [os.path.join('imagenes_persistentes', 'ab', nombre) for nombre in ('a.jpg', 'b.jpg', 'c.jpg')]
+    for ruta in rutas:
+        _escribir_local(ruta, b'1')
+        almacen.subir(ruta)
+
+    assert [r for r, _, _ in almacen.listar('imagenes_persistentes')] == rutas
+    assert [r for r, _, _ in almacen.listar('imagenes_persistentes', despues_de=rutas[1])] == [rutas[2]]
+
+    almacen.vaciar('imagenes_persistentes')
+    assert _claves(s3) == [] and not os.path.exists('imagenes_persistentes')
+
+
+def test_limite_de_la_cache_local(s3):
+    almacen = almacenamiento.obtener_almacen()
+    vieja = os.path.join('imagenes_persistentes', 'ab', 'vieja.jpg')
+    reciente = os.path.join('imagenes_persistentes', 'ab', 'reciente.jpg')
+    for ruta in (vieja, reciente):
+        _escribir_local(ruta, b'y' * 100)
+        almacen.subir(ruta)
+    hace_dos_horas = time.time() - 7200
+    os.utime(vieja, (hace_dos_horas, hace_dos_horas))
+
+    assert almacenamiento.aplicar_limite_cache_local('imagenes_persistentes', 0) == 100
+    # Solo se borra la copia local; la usada hace poco está protegida
+    assert not os.path.exists(vieja) and os.path.exists(reciente)
+    assert len(_claves(s3)) == 2
+    assert almacen.traer(vieja)
+
+
+def test_archivo_ida_y_vuelta(s3):
+    ids = almacen_registros.insertar_registros([{'MODELO': 'M', 'SERIE': f'S-{i}'} for i in range(3)])
+    almacen_registros._conexion().execute("UPDATE registros SET creado = '2026-07-15 10:00:00' WHERE id <= ?", (ids[1],))
+
+    assert archivo_registros.archivar_meses_cerrados(datetime(2026, 10, 1, tzinfo=timezone.utc)) == [('2026-07', 2)]
+    ruta = archivo_registros.ruta_particion('2026-07')
+    assert 'app/' + ruta.replace(os.sep, '/') in _claves(s3)
+
+    # Otra instancia (sin la copia local) lo descarga al leerlo
+    os.remove(ruta)
+    df = archivo_registros.leer_particion('2026-07', obtener_configuracion())
+    assert list(df.index) == ids[:2]
+    assert list(df['SERIE']) == ['S-0', 'S-1']
+    assert [r[COLUMNA_ID] for r in almacen_registros.leer_registros()] == [ids[2]]
@@ -0,0 +1,77 @@
+import json
+import os
+import pytest
+import configuracion
+from configuracion import CAMPO_VERSION_ESQUEMA, obtener_configuracion, guardar_configuracion, error_configuracion, migrar_registro
+
+
+@pytest.fixture
+def carpeta(tmp_path, monkeypatch):
+    """Configuración sin leer todavía, con config_cols.json en una carpeta temporal."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(configuracion, '_estado', {'firma': None, 'config': None, 'error': None})
+    return tmp_path
+
+
+def _escribir(carpeta, config, mtime_ns):
+    ruta = carpeta / configuracion.ARCHIVO_CONFIGURACION
+    ruta.write_text(json.dumps(config), encoding='utf-8')
+    os.utime(ruta, ns=(mtime_ns, mtime_ns))
+
+
+def test_sin_archivo_usa_la_configuracion_por_defecto(carpeta):
+    config = obtener_configuracion()
+    assert config["CONDICIONES_INSPECCION"] == configuracion.CONFIG_POR_DEFECTO["CONDICIONES_INSPECCION"]
+    assert config["COLUMNAS_FINALES"][:2] == ['MODELO', 'SERIE']
+    assert config["PROCESAMIENTO_FOTOS"]["ACTIVO"] is True
+
+
+def test_se_relee_solo_si_cambia_el_archivo(carpeta, monkeypatch):
+    _escribir(carpeta, {"CONDICIONES_INSPECCION": ["A"], "COLUMNAS_IMAGEN": ["F1"]}, 1_000_000_000)
+    config = obtener_configuracion()
+    assert config["ENCABEZADOS"] == ['MODELO', 'SERIE', 'A', 'OBSERVACIONES']
+    assert config["COLUMNAS_FINALES"][-1] == 'F1'
+
+    lecturas = []
+    abrir = open
+    monkeypatch.setattr('builtins.open', lambda *a, **k: lecturas.append(a[0]) or abrir(*a, **k))
+    assert obtener_configuracion() is config
+    assert lecturas == []
+
+    _escribir(carpeta, {"CONDICIONES_INSPECCION": ["A", "B"], "COLUMNAS_IMAGEN": ["F1"]}, 2_000_000_000)
+    assert obtener_configuracion()["CONDICIONES_INSPECCION"] == ["A", "B"]
+    assert lecturas == [configuracion.ARCHIVO_CONFIGURACION]
+
+
+def test_archivo_invalido_conserva_la_ultima_configuracion(carpeta):
+    _escribir(carpeta, {"CONDICIONES_INSPECCION": ["A"]}, 1_000_000_000)
+    config = obtener_configuracion()
+    (carpeta / configuracion.ARCHIVO_CONFIGURACION).write_text('{roto', encoding='utf-8')
+    assert obtener_configuracion() is config
+    assert configuracion.ARCHIVO_CONFIGURACION in error_configuracion()
+
+
+def test_guardar_sube_la_version_solo_si_cambian_las_columnas(carpeta):
+    actual = obtener_configuracion()
+    guardada = guardar_configuracion({**actual, "DUPLICADOS_SERIE": "BLOQUEAR"})
+    assert guardada["VERSION_ESQUEMA"] == actual["VERSION_ESQUEMA"]
+    assert obtener_configuracion()["DUPLICADOS_SERIE"] == "BLOQUEAR"
+    # Las claves derivadas no se escriben en el archivo
+    assert 'ENCABEZADOS' not in json.loads((carpeta / configuracion.ARCHIVO_CONFIGURACION).read_text(encoding='utf-8'))
+
+    guardada = guardar_configuracion({**guardada, "COLUMNAS_IMAGEN": guardada["COLUMNAS_IMAGEN"] + ["FOTO NUEVA"]})
+    assert guardada["VERSION_ESQUEMA"] == actual["VERSION_ESQUEMA"] + 1
+    assert obtener_configuracion() is guardada
+
+
+def test_migrar_registro_completa_las_columnas_nuevas():
+    config = {"VERSION_ESQUEMA": 2, "CONDICIONES_INSPECCION": ["A", "B"],
+              "COLUMNAS_FINALES": ['MODELO', 'SERIE', 'A', 'B', 'OBSERVACIONES', 'F1', 'F2']}
+    antiguo = {'MODELO': 'M', 'SERIE': 'S', 'A': 'SÍ', 'F1': 'foto.jpg', CAMPO_VERSION_ESQUEMA: 1}
+
+    migrado = migrar_registro(antiguo, config)
+    assert migrado == {'MODELO': 'M', 'SERIE': 'S', 'A': 'SÍ', 'B': 'NO', 'OBSERVACIONES': None,
+                       'F1': 'foto.jpg', 'F2': None, CAMPO_VERSION_ESQUEMA: 2}
+    # El registro guardado no se modifica, y uno al día se devuelve tal cual
+    assert antiguo[CAMPO_VERSION_ESQUEMA] == 1 and 'B' not in antiguo
+    assert migrar_registro(migrado, config) is migrado
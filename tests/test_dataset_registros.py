@@ -0,0 +1,80 @@
+import numpy as np
+import dataset_registros
+from almacen_registros import insertar_registro, actualizar_registro, eliminar_registro, purgar_cambios
+from configuracion import obtener_configuracion
+from dataset_registros import obtener_dataset, buscar_por_serie, filtrar_dataset
+
+
+def test_dataset_sigue_los_cambios_del_almacen(almacen):
+    config = obtener_configuracion()
+    id_a = insertar_registro({'MODELO': 'M1', 'SERIE': 'S-1'})
+    df, marca = obtener_dataset(config)
+    assert list(df.index) == [id_a]
+    assert list(df.columns) == config["COLUMNAS_FINALES"]
+    # Columnas no guardadas: condiciones en 'NO', el resto vacías
+    assert df.loc[id_a, config["CONDICIONES_INSPECCION"][0]] == 'NO'
+    assert df.loc[id_a, 'OBSERVACIONES'] == ''
+
+    id_b = insertar_registro({'MODELO': 'M2', 'SERIE': 'S-2'})
+    actualizar_registro(id_a, {'SERIE': 'S-9'})
+    eliminar_registro(id_b)
+    id_c = insertar_registro({'MODELO': 'M1', 'SERIE': 'S-3'})
+
+    df_nuevo, marca_nueva = obtener_dataset(config)
+    assert marca_nueva > marca
+    assert list(df_nuevo.index) == [id_a, id_c]
+    assert df_nuevo.loc[id_a, 'SERIE'] == 'S-9'
+    # El DataFrame anterior no se modificó
+    assert list(df.index) == [id_a] and df.loc[id_a, 'SERIE'] == 'S-1'
+
+    assert buscar_por_serie('s-9') == [id_a]
+    assert buscar_por_serie('S-1') == []
+    assert buscar_por_serie('S-2') == []
+    assert buscar_por_serie('S-3', modelo='m1') == [id_c]
+
+
+def test_dataset_se_recarga_si_se_purgaron_sus_cambios(almacen):
+    config = obtener_configuracion()
+    insertar_registro({'MODELO': 'M1', 'SERIE': 'S-1'})
+    obtener_dataset(config)
+    for i in range(3):
+        insertar_registro({'MODELO': 'M2', 'SERIE': f'S-{i + 10}'})
+    purgar_cambios(max_retenidos=1)
+
+    df, _ = obtener_dataset(config)
+    assert len(df) == 4
+    assert buscar_por_serie('S-11') == [list(df.index)[2]]
+
+
+def test_filtrar_dataset(almacen):
+    config = obtener_configuracion()
+    condicion = config["CONDICIONES_INSPECCION"][0]
+    insertar_registro({'MODELO': 'Nevera X', 'SERIE': 'A-1', condicion: 'SÍ'})
+    insertar_registro({'MODELO': 'Cocina', 'SERIE': 'A-2'})
+    df, _ = obtener_dataset(config)
+
+    assert list(filtrar_dataset(df, modelo='nevera')['SERIE']) == ['A-1']
+    assert list(filtrar_dataset(df, condicion=condicion, valor_condicion='NO')['SERIE']) == ['A-2']
+    assert len(filtrar_dataset(df, serie='a-')) == 2
+
+
+def test_altas_no_copian_el_dataset_en_cada_guardado(almacen, monkeypatch):
+    config = obtener_configuracion()
+    monkeypatch.setattr(dataset_registros, 'CAPACIDAD_MINIMA', 4)
+    copias = []
+    reservar = dataset_registros._reservar
+    monkeypatch.setattr(dataset_registros, '_reservar', lambda df, capacidad: copias.append(len(df)) or reservar(df, capacidad))
+
+    insertar_registro({'MODELO': 'M0', 'SERIE': 'S-0'})
+    df_inicial, _ = obtener_dataset(config)
+    for i in range(1, 65):
+        insertar_registro({'MODELO': f'M{i}', 'SERIE': f'S-{i}'})
+        df, _ = obtener_dataset(config)
+
+    assert len(df) == 65 and list(df['SERIE'])[-1] == 'S-64'
+    # Una carga inicial y una copia cada vez que se duplica la capacidad, no una por guardado
+    assert len(copias) <= 6
+    assert np.shares_memory(df['SERIE'].to_numpy(), obtener_dataset(config)[0]['SERIE'].to_numpy())
+    # Los DataFrames ya entregados no ven las filas nuevas
+    assert list(df_inicial['SERIE']) == ['S-0']
+    assert buscar_por_serie('S-64') == [df.index[-1]]
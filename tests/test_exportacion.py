@@ -0,0 +1,174 @@
+import os
+import zipfile
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+from openpyxl.utils.units import pixels_to_EMU
+from PIL import Image
+import exportacion
+from almacen_fotos import CARPETA_FOTOS
+from almacen_registros import COLUMNA_ID
+
+
+@pytest.fixture
+def fotos(tmp_path, monkeypatch):
+    """Tres fotos en disco (con nombres sin hash) y las carpetas de la aplicación en una carpeta temporal."""
+    monkeypatch.chdir(tmp_path)
+    rutas = []
+    for i, color in enumerate(['red', 'green', 'blue']):
+        ruta = tmp_path / f'foto_{i}.jpg'
+        Image.new('RGB', (80, 60), color).save(ruta, format='JPEG')
+        rutas.append(str(ruta))
+    return rutas
+
+
+def _df(fotos):
+    return pd.DataFrame({
+        'MODELO': ['M1', 'M2', 'M1'],
+        'OBSERVACIONES': ['rayado', None, ''],
+        'FOTO_1': [fotos[0], '', fotos[1]],
+        'FOTO_2': [None, fotos[2], 'no_existe.jpg'],
+    }, index=[10, 11, 12])
+
+
+def test_reporte_excel_con_formato_y_fotos_ancladas(fotos, tmp_path):
+    ruta = tmp_path / 'salida' / 'reporte.xlsx'
+    avisos = exportacion.escribir_reporte_excel(_df(fotos), ['MODELO', 'OBSERVACIONES'], ['FOTO_1', 'FOTO_2'], str(ruta))
+    assert avisos == []
+
+    ws = load_workbook(ruta).active
+    assert [c.value for c in ws[1]] == ['MODELO', 'OBSERVACIONES', 'FOTO_1', 'FOTO_2']
+    assert [ws.cell(fila, 1).value for fila in range(2, 5)] == ['M1', 'M2', 'M1']
+    assert ws.cell(3, 2).value is None
+    assert ws.cell(1, 1).fill.start_color.rgb.endswith('20B2AA') and ws.cell(1, 1).font.bold
+
+    assert ws.row_dimensions[1].height == exportacion.ALTURA_ENCABEZADO_PT
+    assert all(ws.row_dimensions[fila].height == exportacion.ALTURA_FILA_DATOS_PT for fila in range(2, 5))
+    assert ws.column_dimensions['A'].width == exportacion.ANCHO_COLUMNA_NORMAL_UNITS
+    assert ws.column_dimensions['B'].width == exportacion.ANCHO_COLUMNA_OBSERVACIONES_UNITS
+
+    # Cada foto válida queda anclada en su fila y columna (anclas base 0), con el tamaño configurado
+    anclas = sorted((img.anchor._from.row, img.anchor._from.col) for img in ws._images)
+    assert anclas == [(1, 2), (2, 3), (3, 2)]
+    emu = pixels_to_EMU(exportacion.IMAGEN_WIDTH), pixels_to_EMU(exportacion.IMAGEN_HEIGHT)
+    assert {(img.anchor.ext.width, img.anchor.ext.height) for img in ws._images} == {emu}
+
+
+def test_reporte_excel_sin_fotos_escribe_todas_las_filas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame({'MODELO': [f'M{i}' for i in range(5)], 'FOTO_1': [''] * 5})
+    assert exportacion.escribir_reporte_excel(df, ['MODELO'], ['FOTO_1'], str(tmp_path / 'r.xlsx')) == []
+
+    ws = load_workbook(tmp_path / 'r.xlsx').active
+    assert ws.max_row == 6
+    assert ws.cell(6, 1).value == 'M4'
+    assert not ws._images
+
+
+def test_clave_exportacion_cambia_solo_si_cambia_el_resultado(fotos):
+    df = _df(fotos)
+    encabezados, columnas_imagen = ['MODELO', 'OBSERVACIONES'], ['FOTO_1', 'FOTO_2']
+    clave = exportacion.clave_exportacion(df, encabezados, columnas_imagen)
+    assert exportacion.clave_exportacion(df.copy(), encabezados, columnas_imagen) == clave
+
+    texto = df.copy()
+    texto.loc[11, 'OBSERVACIONES'] = 'golpe'
+    assert exportacion.clave_exportacion(texto, encabezados, columnas_imagen) != clave
+    assert exportacion.clave_exportacion(df, ['MODELO'], columnas_imagen) != clave
+    assert exportacion.clave_exportacion(df, encabezados, columnas_imagen, sufijo='.zip') != clave
+    assert exportacion.clave_exportacion(df, encabezados, columnas_imagen, extra=[1]) != clave
+
+    # Una foto reemplazada en la misma ruta (otro tamaño y fecha) invalida el reporte
+    Image.new('RGB', (90, 70), 'white').save(fotos[2], format='JPEG')
+    os.utime(fotos[2], ns=(1, 1))
+    assert exportacion.clave_exportacion(df, encabezados, columnas_imagen) != clave
+
+
+def test_clave_de_fotos_por_contenido_no_lee_el_disco(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ruta = os.path.join(CARPETA_FOTOS, 'ab', 'ab' + '0' * 62 + '.jpg')
+    os.makedirs(os.path.dirname(ruta))
+    with open(ruta, 'wb') as f:
+        f.write(b'uno')
+    df = pd.DataFrame({'MODELO': ['M1'], 'FOTO_1': [ruta]})
+    clave = exportacion.clave_exportacion(df, ['MODELO'], ['FOTO_1'])
+    # El nombre ya identifica el contenido: la fecha de modificación no cuenta
+    os.utime(ruta, ns=(1, 1))
+    assert exportacion.clave_exportacion(df, ['MODELO'], ['FOTO_1']) == clave
+
+
+def test_reporte_en_cache_se_reutiliza(fotos, monkeypatch):
+    df = _df(fotos)
+    ruta, avisos = exportacion.generar_reporte(df, ['MODELO'], ['FOTO_1', 'FOTO_2'])
+    assert avisos == [] and exportacion.es_exportacion_en_cache(ruta)
+
+    monkeypatch.setattr(exportacion, 'escribir_reporte_excel', lambda *a, **k: pytest.fail('no debe regenerarse'))
+    assert exportacion.generar_reporte(df.copy(), ['MODELO'], ['FOTO_1', 'FOTO_2']) == (ruta, [])
+
+
+def test_dividir_en_partes_por_filas():
+    df = pd.DataFrame({'MODELO': ['M'] * 5}, index=range(10, 15))
+    partes = exportacion.dividir_en_partes(df, 'FILAS', filas_por_parte=2)
+    assert [(nombre, list(p.index)) for nombre, p in partes] == [
+        ('Parte_001.xlsx', [10, 11]), ('Parte_002.xlsx', [12, 13]), ('Parte_003.xlsx', [14])]
+    assert [n for n, _ in exportacion.dividir_en_partes(df, 'FILAS', filas_por_parte=0)][-1] == 'Parte_005.xlsx'
+    with pytest.raises(ValueError):
+        exportacion.dividir_en_partes(df, 'COLOR')
+
+
+def test_dividir_en_partes_por_modelo():
+    df = pd.DataFrame({'MODELO': ['Nevera X', ' nevera x', 'Cocina/4', 'Cocina/4', 'Cocina/4']}, index=range(5))
+    partes = exportacion.dividir_en_partes(df, 'MODELO', filas_por_parte=2)
+    # Sin distinguir mayúsculas ni espacios; los grupos grandes se dividen y los nombres son seguros
+    assert [(nombre, list(p.index)) for nombre, p in partes] == [
+        ('Modelo_COCINA_4_001.xlsx', [2, 3]), ('Modelo_COCINA_4_002.xlsx', [4]), ('Modelo_NEVERA_X.xlsx', [0, 1])]
+
+
+def test_dividir_en_partes_por_mes_de_alta(almacen):
+    ids = almacen.insertar_registros([{'MODELO': 'M', 'SERIE': f'S-{i}'} for i in range(4)])
+    con = almacen._conexion()
+    con.execute("UPDATE registros SET creado = '2020-07-31 23:00:00' WHERE id IN (?, ?)", (ids[0], ids[2]))
+    con.execute("UPDATE registros SET creado = '2020-08-01 00:00:00' WHERE id = ?", (ids[1],))
+    df = pd.DataFrame({'MODELO': ['M'] * 5}, index=ids + [999])
+
+    partes = exportacion.dividir_en_partes(df, 'FECHA')
+    # Un id sin fecha conocida va a su propia parte
+    assert [(nombre, list(p.index)) for nombre, p in partes] == [
+        ('Mes_2020-07.xlsx', [ids[0], ids[2]]), ('Mes_2020-08.xlsx', [ids[1]]),
+        (f"Mes_{almacen.fechas_alta()[ids[3]][:7]}.xlsx", [ids[3]]), ('Mes_SIN_FECHA.xlsx', [999])]
+
+
+def test_reporte_vinculado_con_fotos_sin_recodificar_y_parquet(fotos, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    otra = tmp_path / 'otra'
+    otra.mkdir()
+    repetida = otra / 'foto_0.jpg'
+    repetida.write_bytes(b'no es un jpeg, se copia igual')
+    df = _df(fotos).rename_axis(COLUMNA_ID)
+    df.loc[12, 'FOTO_2'] = str(repetida)
+
+    ruta = tmp_path / 'vinculado.zip'
+    assert exportacion.escribir_reporte_vinculado(df, ['MODELO', 'OBSERVACIONES'], ['FOTO_1', 'FOTO_2'], str(ruta)) == []
+
+    with zipfile.ZipFile(ruta) as zf:
+        assert sorted(zf.namelist()) == ['Reporte.xlsx', 'datos.parquet', 'fotos/foto_0.jpg', 'fotos/foto_0_2.jpg', 'fotos/foto_1.jpg', 'fotos/foto_2.jpg']
+        # Las fotos se copian byte a byte
+        assert zf.read('fotos/foto_0_2.jpg') == repetida.read_bytes()
+        with open(fotos[1], 'rb') as f:
+            assert zf.read('fotos/foto_1.jpg') == f.read()
+        zf.extract('Reporte.xlsx', tmp_path / 'x')
+        zf.extract('datos.parquet', tmp_path / 'x')
+
+    ws = load_workbook(tmp_path / 'x' / 'Reporte.xlsx').active
+    assert [c.value for c in ws[1]] == ['MODELO', 'OBSERVACIONES', 'FOTO_1', 'FOTO_2']
+    vinculos = {(c.row, c.column): c.hyperlink.target for fila in ws.iter_rows(min_row=2) for c in fila if c.hyperlink}
+    assert vinculos == {(2, 3): 'fotos/foto_0.jpg', (3, 4): 'fotos/foto_2.jpg', (4, 3): 'fotos/foto_1.jpg', (4, 4): 'fotos/foto_0_2.jpg'}
+    assert ws.cell(2, 3).value == 'Ver foto' and ws.cell(2, 4).value is None
+    assert not ws._images
+
+    # Dataset completo con el id de cada registro y las fotos como rutas dentro del ZIP
+    datos = pq.read_table(tmp_path / 'x' / 'datos.parquet').to_pydict()
+    assert datos[COLUMNA_ID] == [10, 11, 12]
+    assert datos['OBSERVACIONES'] == ['rayado', None, '']
+    assert datos['FOTO_1'] == ['fotos/foto_0.jpg', None, 'fotos/foto_1.jpg']
+    assert datos['FOTO_2'] == [None, 'fotos/foto_2.jpg', 'fotos/foto_0_2.jpg']
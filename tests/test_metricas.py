@@ -0,0 +1,27 @@
+import time
+import metricas
+
+
+def test_archivo_prometheus_se_escribe_en_segundo_plano_y_a_intervalos(tmp_path, monkeypatch):
+    ruta = tmp_path / 'inspeccion.prom'
+    escrituras = []
+    escribir = metricas.escribir_prometheus
+    monkeypatch.setattr(metricas, 'ARCHIVO_LOG_METRICAS', str(tmp_path / 'metricas.log'))
+    monkeypatch.setattr(metricas, 'ARCHIVO_METRICAS_PROMETHEUS', str(ruta))
+    monkeypatch.setattr(metricas, 'INTERVALO_ESCRITURA_PROMETHEUS_S', 0.2)
+    monkeypatch.setattr(metricas, 'escribir_prometheus', lambda r: escrituras.append(r) or escribir(r))
+    metricas.reiniciar()
+
+    for _ in range(200):
+        metricas.registrar('prueba.fase', 0.003, bytes_procesados=10)
+    fin = time.time() + 5
+    while not (ruta.exists() and 'count{fase="prueba.fase"} 200' in ruta.read_text()):
+        assert time.time() < fin, 'el archivo no se actualizó'
+        time.sleep(0.05)
+
+    # Una escritura por intervalo, no una por observación
+    assert 1 <= len(escrituras) <= 3
+    texto = ruta.read_text()
+    assert 'inspeccion_fase_bytes_total{fase="prueba.fase"} 2000' in texto
+    assert 'inspeccion_fase_duracion_segundos_bucket{fase="prueba.fase",le="0.005"} 200' in texto
+    metricas.reiniciar()
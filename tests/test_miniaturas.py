@@ -0,0 +1,71 @@
+import os
+import time
+from io import BytesIO
+import pytest
+from PIL import Image
+import miniaturas
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Caché de miniaturas vacía en una carpeta temporal."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(miniaturas, '_hashes_archivos', type(miniaturas._hashes_archivos)())
+    return tmp_path
+
+
+def _jpeg_apaisado(orientacion=1):
+    # Mitad izquierda roja y derecha azul, para comprobar hacia dónde se rotó
+    img = Image.new('RGB', (400, 200), 'blue')
+    img.paste((255, 0, 0), (0, 0, 200, 200))
+    exif = Image.Exif()
+    exif[0x0112] = orientacion
+    salida = BytesIO()
+    img.save(salida, format='JPEG', quality=90, exif=exif)
+    return salida.getvalue()
+
+
+def test_miniatura_respeta_la_orientacion_exif():
+    # Orientación 6: la cámara estaba girada 90° y el visor debe rotar en sentido horario
+    with Image.open(BytesIO(miniaturas.generar_miniatura(_jpeg_apaisado(orientacion=6), 50, 100))) as img:
+        assert img.size == (100, 200)
+        assert not img.getexif().get(0x0112)
+        rojo, _, azul = img.getpixel((50, 10))
+        assert rojo > 200 and azul < 60
+        rojo, _, azul = img.getpixel((50, 190))
+        assert azul > 200 and rojo < 60
+
+
+def test_miniatura_se_genera_una_vez_por_contenido(cache):
+    foto = cache / 'foto.jpg'
+    foto.write_bytes(_jpeg_apaisado())
+    ruta = miniaturas.obtener_miniatura(str(foto), 100, 50)
+    assert os.path.exists(ruta) and ruta.startswith(miniaturas.CARPETA_MINIATURAS)
+
+    os.utime(ruta, (0, 0))
+    assert miniaturas.obtener_miniatura(str(foto), 100, 50) == ruta
+    # Reusar la entrada renueva su marca de uso
+    assert os.path.getmtime(ruta) > 0
+    assert miniaturas.miniatura_en_cache(str(foto), 100, 50) == ruta
+    assert miniaturas.miniatura_en_cache(str(foto), 80, 40) is None
+
+    # Otro contenido en la misma ruta produce otra clave
+    foto.write_bytes(_jpeg_apaisado(orientacion=3))
+    os.utime(foto, (time.time() + 5, time.time() + 5))
+    assert miniaturas.obtener_miniatura(str(foto), 100, 50) != ruta
+
+
+def test_limite_de_cache_expulsa_las_menos_usadas(cache):
+    rutas = []
+    for i in range(4):
+        ruta = miniaturas.guardar_miniatura(_jpeg_apaisado(), 20 + i, 10)
+        os.utime(ruta, (1000 + i, 1000 + i))
+        rutas.append(ruta)
+    # La primera se vuelve a usar y pasa a ser la más reciente
+    miniaturas.guardar_miniatura(_jpeg_apaisado(), 20, 10)
+
+    tamanos = [os.path.getsize(r) for r in rutas]
+    limite = tamanos[0] + tamanos[3]
+    assert miniaturas.aplicar_limite_cache(limite) == tamanos[1] + tamanos[2]
+    assert [os.path.exists(r) for r in rutas] == [True, False, False, True]
+    assert miniaturas.tamano_cache() == (2, limite)
@@ -0,0 +1,47 @@
+import random
+from io import BytesIO
+from PIL import Image
+from normalizacion_fotos import normalizar_foto, quitar_metadatos_jpeg
+
+AJUSTES = {"ACTIVO": True, "LADO_MAXIMO_PX": 2048, "FORMATO": "JPEG", "CALIDAD": 95, "CONSERVAR_ORIGINAL": False}
+
+
+def _jpeg_con_exif(orientacion=1, ancho=320, alto=200):
+    random.seed(1)
+    img = Image.frombytes('RGB', (ancho, alto), bytes(random.getrandbits(8) for _ in range(ancho * alto * 3)))
+    exif = Image.Exif()
+    exif[0x010F] = 'Camara de prueba'  # Make
+    exif[0x0112] = orientacion
+    exif.get_ifd(0x8825)[2] = (4.0, 36.0, 0.0)  # GPSLatitude
+    salida = BytesIO()
+    img.save(salida, format='JPEG', quality=40, exif=exif)
+    return salida.getvalue()
+
+
+def test_sin_cambios_de_imagen_igual_se_quitan_los_metadatos():
+    datos = _jpeg_con_exif()
+    normalizada, extension = normalizar_foto(datos, AJUSTES)
+
+    assert extension == 'jpg'
+    assert len(normalizada) < len(datos)
+    with Image.open(BytesIO(normalizada)) as img, Image.open(BytesIO(datos)) as original:
+        assert not img.getexif()
+        assert 'exif' not in img.info
+        # Sin re-codificar: los píxeles son idénticos
+        assert img.tobytes() == original.tobytes()
+
+
+def test_foto_rotada_se_re_codifica_sin_metadatos():
+    normalizada, extension = normalizar_foto(_jpeg_con_exif(orientacion=6), AJUSTES)
+    with Image.open(BytesIO(normalizada)) as img:
+        assert extension == 'jpg'
+        assert img.size == (200, 320)
+        assert not img.getexif()
+
+
+def test_quitar_metadatos_conserva_perfil_de_color():
+    img = Image.new('RGB', (16, 16), 'red')
+    salida = BytesIO()
+    img.save(salida, format='JPEG', icc_profile=b'perfil-de-prueba' * 4, exif=Image.Exif())
+    with Image.open(BytesIO(quitar_metadatos_jpeg(salida.getvalue()))) as limpia:
+        assert limpia.info.get('icc_profile') == b'perfil-de-prueba' * 4
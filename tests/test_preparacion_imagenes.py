@@ -0,0 +1,62 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import pytest
+from PIL import Image
+import preparacion_imagenes
+
+
+class PoolRoto:
+    """Imita un ProcessPoolExecutor cuyo proceso murió: las tareas enviadas fallan con BrokenProcessPool."""
+
+    def __init__(self, rechazar_envios_desde=None):
+        self.enviadas = 0
+        self.rechazar_envios_desde = rechazar_envios_desde
+        self.cerrado = False
+
+    def submit(self, *args):
+        if self.rechazar_envios_desde is not None and self.enviadas >= self.rechazar_envios_desde:
+            raise BrokenProcessPool('pool roto')
+        self.enviadas += 1
+        futuro = Future()
+        futuro.set_exception(BrokenProcessPool('un proceso terminó de golpe'))
+        return futuro
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.cerrado = True
+
+
+@pytest.fixture
+def fotos(tmp_path, monkeypatch):
+    """Diez fotos en disco y una caché de miniaturas vacía."""
+    monkeypatch.chdir(tmp_path)
+    rutas = []
+    for i in range(10):
+        ruta = tmp_path / f'foto_{i}.jpg'
+        Image.new('RGB', (64, 48), (i * 20, 0, 0)).save(ruta, format='JPEG')
+        rutas.append(str(ruta))
+    return rutas
+
+
+@pytest.mark.parametrize('rechazar_envios_desde', [None, 3])
+def test_pool_roto_se_descarta_y_las_fotos_se_preparan_en_el_proceso(fotos, monkeypatch, rechazar_envios_desde):
+    pool = PoolRoto(rechazar_envios_desde)
+    monkeypatch.setattr(preparacion_imagenes, '_pool', pool)
+
+    resultados = list(preparacion_imagenes.preparar_imagenes([[r] for r in fotos], 32, 24, procesos=2, max_en_vuelo=4))
+
+    assert [(fila, columna) for fila, columna, _, _, _ in resultados] == [(i, 0) for i in range(10)]
+    assert all(datos and error is None for _, _, _, datos, error in resultados)
+    with Image.open(BytesIO(resultados[0][3])) as img:
+        assert img.size == (64, 48)
+    # El pool roto ya no se reutiliza: el próximo uso crea uno nuevo
+    assert pool.cerrado
+    assert preparacion_imagenes._pool is None
+    assert pool.enviadas <= 4
+
+
+def test_descartar_no_pisa_un_pool_nuevo(monkeypatch):
+    viejo, nuevo = PoolRoto(), PoolRoto()
+    monkeypatch.setattr(preparacion_imagenes, '_pool', nuevo)
+    preparacion_imagenes._descartar_pool(viejo)
+    assert viejo.cerrado and preparacion_imagenes._pool is nuevo
@@ -0,0 +1,84 @@
+import hashlib
+import multiprocessing
+import os
+import time
+import recolector_fotos
+from almacen_fotos import ruta_foto
+from recolector_fotos import ARCHIVOS_POR_PASO, GRACIA_RECOLECCION_S, DURACION_TURNO_S, recolectar_paso
+
+VIEJA = time.time() - GRACIA_RECOLECCION_S - 3600
+
+
+def _foto(contenido, fecha=VIEJA):
+    ruta = ruta_foto(hashlib.sha256(contenido).hexdigest(), 'jpg')
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as f:
+        f.write(contenido)
+    os.utime(ruta, (fecha, fecha))
+    return ruta
+
+
+def test_borra_solo_huerfanas_fuera_del_periodo_de_gracia(almacen):
+    en_uso = _foto(b'en uso')
+    huerfana_vieja = _foto(b'huerfana vieja')
+    huerfana_reciente = _foto(b'huerfana reciente', fecha=time.time() - GRACIA_RECOLECCION_S + 3600)
+    archivada = _foto(b'de un registro archivado')
+    almacen.insertar_registro({'MODELO': 'M', 'SERIE': 'S-1', 'FOTO DE SERIE': en_uso})
+    almacen.insertar_registro({'MODELO': 'M', 'SERIE': 'S-2', 'FOTO DE SERIE': archivada})
+    almacen._conexion().execute("UPDATE registros SET creado = '2020-01-15 10:00:00' WHERE id = 2")
+    assert almacen.archivar_particion('2020-01', lambda filas: None) == 1
+
+    examinados, borrados, liberados = recolectar_paso()
+    assert (examinados, borrados, liberados) == (4, 1, len(b'huerfana vieja'))
+    assert os.path.exists(en_uso) and os.path.exists(archivada) and os.path.exists(huerfana_reciente)
+    assert not os.path.exists(huerfana_vieja)
+
+    estado = almacen.estado_recoleccion()
+    assert (estado['vueltas'], estado['borrados'], estado['hoja'], estado['nombre']) == (1, 1, None, None)
+
+
+def test_cursor_retoma_donde_quedo_el_paso_anterior(almacen):
+    # El recorrido sigue el orden de las rutas (carpeta 'ab/cd' y luego nombre)
+    rutas = sorted(_foto(f'huerfana {i}'.encode()) for i in range(2 * ARCHIVOS_POR_PASO + 50))
+
+    examinados, borrados, _ = recolectar_paso()
+    assert (examinados, borrados) == (ARCHIVOS_POR_PASO, ARCHIVOS_POR_PASO)
+    assert [os.path.exists(r) for r in rutas] == [False] * ARCHIVOS_POR_PASO + [True] * (ARCHIVOS_POR_PASO + 50)
+    estado = almacen.estado_recoleccion()
+    assert os.path.join(recolector_fotos.CARPETA_FOTOS, *estado['hoja'].split('/'), estado['nombre']) == rutas[ARCHIVOS_POR_PASO - 1]
+    assert estado['vueltas'] == 0
+
+    assert recolectar_paso()[:2] == (ARCHIVOS_POR_PASO, ARCHIVOS_POR_PASO)
+    assert recolectar_paso()[:2] == (50, 50)
+    assert not any(os.path.exists(r) for r in rutas)
+    estado = almacen.estado_recoleccion()
+    assert (estado['vueltas'], estado['examinados'], estado['hoja']) == (1, 2 * ARCHIVOS_POR_PASO + 50, None)
+
+    # La vuelta siguiente empieza otra vez desde el principio
+    nueva = _foto(b'otra huerfana')
+    assert recolectar_paso()[:2] == (1, 1) and not os.path.exists(nueva)
+
+
+def _tomar_turno_en_otro_proceso(carpeta):
+    os.chdir(carpeta)
+    import almacen_registros
+    return almacen_registros.tomar_turno_recoleccion(time.time(), DURACION_TURNO_S) is not None
+
+
+def test_un_solo_proceso_tiene_el_turno(almacen, tmp_path):
+    contexto = multiprocessing.get_context('spawn')
+    turno = almacen.tomar_turno_recoleccion(time.time(), DURACION_TURNO_S)
+    assert turno is not None
+
+    with contexto.Pool(1) as pool:
+        assert pool.apply(_tomar_turno_en_otro_proceso, (str(tmp_path),)) is False
+        # Ni siquiera el mismo proceso toma dos veces el turno vigente; un paso que lo pide no hace nada
+        assert almacen.tomar_turno_recoleccion(time.time(), DURACION_TURNO_S) is None
+        assert recolectar_paso() is None
+
+        almacen.liberar_turno_recoleccion()
+        assert pool.apply(_tomar_turno_en_otro_proceso, (str(tmp_path),)) is True
+        assert almacen.tomar_turno_recoleccion(time.time(), DURACION_TURNO_S) is None
+
+    # Un turno vencido (el proceso murió a mitad de un paso) lo puede retomar otro
+    assert almacen.tomar_turno_recoleccion(time.time() + DURACION_TURNO_S + 1, DURACION_TURNO_S) is not None
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+import zipfile
+from io import BytesIO
+import pandas as pd
+import pytest
+from PIL import Image
+import trabajos_exportacion
+from configuracion import obtener_configuracion
+from importacion import CARPETA_IMPORTACIONES, guardar_zip, leer_informe
+from trabajos_exportacion import ESTADO_EN_COLA, ESTADO_PROCESANDO, ESTADO_LISTO, ESTADO_ERROR
+
+
+@pytest.fixture
+def cola(tmp_path, monkeypatch):
+    """Cola de trabajos vacía, con su propio pool y la carpeta de estados en una carpeta temporal."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(trabajos_exportacion, '_trabajos', {})
+    monkeypatch.setattr(trabajos_exportacion, '_executor', None)
+    yield trabajos_exportacion
+    if trabajos_exportacion._executor is not None:
+        trabajos_exportacion._executor.shutdown(wait=True)
+
+
+def _esperar(condicion, limite_s=5):
+    fin = time.time() + limite_s
+    while not condicion():
+        assert time.time() < fin, 'el trabajo no avanzó'
+        time.sleep(0.01)
+
+
+def _df():
+    return pd.DataFrame({'MODELO': ['M1'], 'FOTO_1': ['']})
+
+
+def test_estado_avance_y_eta(cola, tmp_path, monkeypatch):
+    avanzar, seguir = threading.Event(), threading.Event()
+    ruta_reporte = tmp_path / 'reporte.xlsx'
+
+    def generar(df, encabezados, columnas_imagen, progreso=None):
+        progreso(0, 4)
+        progreso(2, 4)
+        avanzar.set()
+        seguir.wait(5)
+        ruta_reporte.write_bytes(b'xlsx')
+        return str(ruta_reporte), [('warning', 'aviso')]
+
+    monkeypatch.setattr(cola, 'generar_reporte', generar)
+    id_trabajo = cola.enviar_exportacion(_df(), ['MODELO'], ['FOTO_1'])
+    assert avanzar.wait(5)
+
+    with cola._lock:
+        cola._trabajos[id_trabajo]['inicio'] = time.time() - 10
+    estado = cola.consultar_trabajo(id_trabajo)
+    assert estado['estado'] == ESTADO_PROCESANDO
+    assert (estado['hechas'], estado['total']) == (2, 4)
+    # 2 imágenes en 10 s: faltan 2, unos 10 s más
+    assert estado['eta_s'] == pytest.approx(10, abs=1)
+
+    seguir.set()
+    _esperar(lambda: cola.consultar_trabajo(id_trabajo)['estado'] == ESTADO_LISTO)
+    estado = cola.consultar_trabajo(id_trabajo)
+    assert estado['ruta'] == str(ruta_reporte) and estado['eta_s'] is None
+    assert [tuple(a) for a in estado['avisos']] == [('warning', 'aviso')]
+
+    # El estado en disco permite recuperar el trabajo desde otro proceso o tras recargar
+    cola._trabajos.clear()
+    assert cola.consultar_trabajo(id_trabajo)['estado'] == ESTADO_LISTO
+    ruta_reporte.unlink()
+    assert cola.consultar_trabajo(id_trabajo)['estado'] == ESTADO_ERROR
+
+
+def test_tipo_de_reporte_y_errores(cola, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(cola, 'generar_reporte_zip', lambda *a, progreso=None, **partes: llamadas.append(partes) or (None, []))
+
+    def fallar(*a, **k):
+        raise RuntimeError('disco lleno')
+
+    monkeypatch.setattr(cola, 'generar_reporte_vinculado', fallar)
+
+    cola.enviar_exportacion(_df(), ['MODELO'], ['FOTO_1'], partes={'criterio': 'MODELO', 'filas_por_parte': 10})
+    id_vinculado = cola.enviar_exportacion(_df(), ['MODELO'], ['FOTO_1'], vinculado=True)
+    _esperar(lambda: cola.consultar_trabajo(id_vinculado)['estado'] == ESTADO_ERROR)
+    assert cola.consultar_trabajo(id_vinculado)['error'] == 'disco lleno'
+    _esperar(lambda: llamadas)
+    assert llamadas == [{'criterio': 'MODELO', 'filas_por_parte': 10}]
+
+
+def test_cola_llena_rechaza_trabajos(cola, monkeypatch):
+    seguir = threading.Event()
+    monkeypatch.setattr(cola, 'generar_reporte', lambda *a, **k: seguir.wait(5) and (None, []))
+    ids = [cola.enviar_exportacion(_df(), ['MODELO'], ['FOTO_1']) for _ in range(cola.MAX_EXPORTACIONES_SIMULTANEAS + cola.MAX_TRABAJOS_EN_COLA)]
+    assert None not in ids
+    assert cola.consultar_trabajo(ids[-1])['estado'] == ESTADO_EN_COLA
+    assert cola.enviar_exportacion(_df(), ['MODELO'], ['FOTO_1']) is None
+    seguir.set()
+
+
+def test_trabajo_de_un_proceso_reiniciado_termina_en_error(cola):
+    os.makedirs(cola.CARPETA_TRABAJOS)
+    estado = {'id': 'abc', 'estado': ESTADO_PROCESANDO, 'inicio': time.time(), 'fin': None,
+              'hechas': 1, 'total': 3, 'ruta': None, 'avisos': [], 'error': None}
+    with open(cola._ruta_estado('abc'), 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    assert cola.consultar_trabajo('abc')['estado'] == ESTADO_ERROR
+    assert cola.consultar_trabajo('no-existe') is None
+
+
+def test_importacion_en_segundo_plano(almacen, cola):
+    config = obtener_configuracion()
+    foto = BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(foto, format='JPEG')
+    archivo_zip = BytesIO()
+    with zipfile.ZipFile(archivo_zip, 'w') as zf:
+        zf.writestr('S-1/1.jpg', foto.getvalue())
+    manifiesto = pd.DataFrame({'MODELO': ['M1', 'M2', ''], 'SERIE': ['S-1', 'S-2', 'S-3']})
+
+    ruta_zip = guardar_zip(archivo_zip)
+    id_trabajo = cola.enviar_importacion(manifiesto, ruta_zip, config)
+    _esperar(lambda: cola.consultar_trabajo(id_trabajo)['estado'] in (ESTADO_LISTO, ESTADO_ERROR))
+
+    estado = cola.consultar_trabajo(id_trabajo)
+    assert estado['estado'] == ESTADO_LISTO and (estado['hechas'], estado['total']) == (3, 3)
+    informe = leer_informe(estado['ruta'])
+    assert [(f['SERIE'], f['ESTADO'], f['FOTOS']) for f in informe] == [('S-1', 'IMPORTADO', 1), ('S-2', 'IMPORTADO', 0), ('S-3', 'ERROR', 0)]
+    # El ZIP copiado se borra al terminar
+    assert not os.path.exists(ruta_zip)
+    registros = almacen.leer_registros()
+    assert [r['SERIE'] for r in registros] == ['S-1', 'S-2']
+    assert os.path.exists(registros[0][config["COLUMNAS_IMAGEN"][0]])
+
+
+def test_zip_invalido_no_se_guarda(cola):
+    with pytest.raises(zipfile.BadZipFile):
+        guardar_zip(BytesIO(b'no es un zip'))
+    assert os.listdir(CARPETA_IMPORTACIONES) == []
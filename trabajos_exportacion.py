@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from exportacion import CARPETA_EXPORTACIONES, generar_reporte, generar_reporte_zip, generar_reporte_vinculado
+from importacion import importar_zip
+
+# ----------------------------------------------------
+# COLA DE TRABAJOS DE EXPORTACIÓN EN SEGUNDO PLANO
+# ----------------------------------------------------
+# Los reportes y las importaciones masivas corren en un pool de hilos
+# compartido por todo el proceso, fuera del hilo del script de Streamlit. Cada
+# trabajo guarda su estado en exportaciones/trabajos/<id>.json, de modo que la
+# página puede consultar el avance (imágenes o filas procesadas y tiempo
+# estimado) y recuperar el resultado por id aunque el navegador se recargue o
+# se pierda la conexión.
+CARPETA_TRABAJOS = os.path.join(CARPETA_EXPORTACIONES, 'trabajos')
+MAX_EXPORTACIONES_SIMULTANEAS = int(os.environ.get('MAX_EXPORTACIONES_SIMULTANEAS', 2))
+MAX_TRABAJOS_EN_COLA = int(os.environ.get('MAX_TRABAJOS_EN_COLA', 8))
+INTERVALO_GUARDADO_PROGRESO_S = 1.0
+RETENCION_TRABAJOS_MEMORIA_S = 3600
+RETENCION_TRABAJOS_DISCO_S = 24 * 3600
+
+ESTADO_EN_COLA = 'en_cola'
+ESTADO_PROCESANDO = 'procesando'
+ESTADO_LISTO = 'listo'
+ESTADO_ERROR = 'error'
+
+_executor = None
+_trabajos = {}
+_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_EXPORTACIONES_SIMULTANEAS, thread_name_prefix='exportacion')
+    return _executor
+
+
+def _ruta_estado(id_trabajo):
+    return os.path.join(CARPETA_TRABAJOS, f"{id_trabajo}.json")
+
+
+def _guardar_estado(estado):
+    os.makedirs(CARPETA_TRABAJOS, exist_ok=True)
+    ruta = _ruta_estado(estado['id'])
+    ruta_tmp = f"{ruta}.tmp"
+    with open(ruta_tmp, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(ruta_tmp, ruta)
+
+
+def _trabajos_activos():
+    return sum(1 for e in _trabajos.values() if e['estado'] in (ESTADO_EN_COLA, ESTADO_PROCESANDO))
+
+
+def _purgar_trabajos():
+    """Olvida los trabajos terminados hace tiempo (en memoria y, más tarde, también su archivo de estado)."""
+    ahora = time.time()
+    for id_trabajo in [i for i, e in _trabajos.items() if e['fin'] and ahora - e['fin'] > RETENCION_TRABAJOS_MEMORIA_S]:
+        del _trabajos[id_trabajo]
+
+    if os.path.exists(CARPETA_TRABAJOS):
+        for nombre in os.listdir(CARPETA_TRABAJOS):
+            ruta = os.path.join(CARPETA_TRABAJOS, nombre)
+            try:
+                if ahora - os.path.getmtime(ruta) > RETENCION_TRABAJOS_DISCO_S:
+                    os.remove(ruta)
+            except OSError:
+                pass
+
+
+def _ejecutar(id_trabajo, tarea):
+    ultimo_guardado = [0.0]
+
+    def progreso(hechas, total):
+        with _lock:
+            estado = _trabajos[id_trabajo]
+            estado['hechas'] = hechas
+            estado['total'] = total
+            ahora = time.time()
+            if ahora - ultimo_guardado[0] >= INTERVALO_GUARDADO_PROGRESO_S:
+                ultimo_guardado[0] = ahora
+                _guardar_estado(estado)
+
+    with _lock:
+        _trabajos[id_trabajo]['estado'] = ESTADO_PROCESANDO
+        _trabajos[id_trabajo]['inicio'] = time.time()
+        _guardar_estado(_trabajos[id_trabajo])
+
+    try:
+        ruta, avisos = tarea(progreso)
+        with _lock:
+            estado = _trabajos[id_trabajo]
+            estado.update({'estado': ESTADO_LISTO, 'ruta': ruta, 'avisos': avisos, 'fin': time.time()})
+            _guardar_estado(estado)
+    except Exception as e:
+        with _lock:
+            estado = _trabajos[id_trabajo]
+            estado.update({'estado': ESTADO_ERROR, 'error': str(e), 'fin': time.time()})
+            _guardar_estado(estado)
+
+
+def _encolar(tarea):
+    """Encola tarea(progreso) -> (ruta, avisos) y devuelve el id del trabajo, o None si la cola está llena."""
+    with _lock:
+        _purgar_trabajos()
+        if _trabajos_activos() >= MAX_EXPORTACIONES_SIMULTANEAS + MAX_TRABAJOS_EN_COLA:
+            return None
+        id_trabajo = uuid.uuid4().hex
+        estado = {
+            'id': id_trabajo,
+            'estado': ESTADO_EN_COLA,
+            'creado': time.time(),
+            'inicio': None,
+            'fin': None,
+            'hechas': 0,
+            'total': None,
+            'ruta': None,
+            'avisos': [],
+            'error': None,
+        }
+        _trabajos[id_trabajo] = estado
+        _guardar_estado(estado)
+        _obtener_executor().submit(_ejecutar, id_trabajo, tarea)
+
+    return id_trabajo
+
+
+def enviar_exportacion(df, encabezados, columnas_imagen, partes=None, vinculado=False):
+    """
+    Encola la generación del reporte y devuelve el id del trabajo, o None si la cola está llena.
+    Con partes={'criterio': ..., 'filas_por_parte': ...} el reporte se divide en varios libros dentro de un ZIP;
+    con vinculado=True se genera el ZIP liviano con fotos vinculadas y Parquet.
+    """
+    df, encabezados, columnas_imagen = df.copy(), list(encabezados), list(columnas_imagen)
+    partes = dict(partes) if partes else None
+
+    def tarea(progreso):
+        if vinculado:
+            return generar_reporte_vinculado(df, encabezados, columnas_imagen, progreso=progreso)
+        if partes:
+            return generar_reporte_zip(df, encabezados, columnas_imagen, progreso=progreso, **partes)
+        return generar_reporte(df, encabezados, columnas_imagen, progreso=progreso)
+
+    return _encolar(tarea)
+
+
+def enviar_importacion(manifiesto, ruta_zip, config):
+    """
+    Encola una importación masiva (ver importacion.importar_zip) y devuelve el id del trabajo, o None si la
+    cola está llena. Al terminar, 'ruta' es el informe por fila en JSON; el avance se cuenta en filas.
+    """
+    manifiesto = manifiesto.copy()
+    return _encolar(lambda progreso: (importar_zip(manifiesto, ruta_zip, config, progreso=progreso), []))
+
+
+def consultar_trabajo(id_trabajo):
+    """
+    Devuelve una copia del estado del trabajo (con 'eta_s' estimado si está en proceso), o None si no existe.
+    Los trabajos de otro proceso o anteriores a un reinicio se leen desde su archivo de estado.
+    """
+    with _lock:
+        estado = dict(_trabajos[id_trabajo]) if id_trabajo in _trabajos else None
+
+    if estado is None:
+        ruta = _ruta_estado(id_trabajo)
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+        # Un trabajo que quedó a medias en un proceso que ya no existe no va a terminar
+        if estado['estado'] in (ESTADO_EN_COLA, ESTADO_PROCESANDO):
+            estado['estado'] = ESTADO_ERROR
+            estado['error'] = 'El proceso que generaba el reporte se reinició. Vuelva a procesarlo.'
+
+    if estado['estado'] == ESTADO_LISTO and not (estado['ruta'] and os.path.exists(estado['ruta'])):
+        estado['estado'] = ESTADO_ERROR
+        estado['error'] = 'El archivo del reporte ya no está disponible. Vuelva a procesarlo.'
+
+    estado['eta_s'] = None
+    hechas, total = estado.get('hechas'), estado.get('total')
+    if estado['estado'] == ESTADO_PROCESANDO and estado['inicio'] and total and hechas:
+        transcurrido = time.time() - estado['inicio']
+        estado['eta_s'] = transcurrido / hechas * (total - hechas)
+    return estado